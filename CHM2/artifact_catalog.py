@@ -0,0 +1,312 @@
+"""SQLite catalog of pipeline artifacts with a spatial index.
+
+Every file produced in an output directory (training CSV, stack, mask,
+prediction, evaluation) is recorded with its size, modification time,
+content hash, the parameters it was produced with, and its bounding box in
+EPSG:4326 in an R-tree. Lookups by name prefix, bounds and parameters are
+indexed queries. Stages register their outputs with register_artifact()
+when they write them; files copied in by hand are picked up by an explicit
+sync, which only re-hashes new or changed files:
+
+    python artifact_catalog.py --dir chm_outputs --sync
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import pandas as pd
+import rasterio
+from rasterio.warp import transform_bounds
+
+CATALOG_NAME = '.artifacts.sqlite'
+RASTER_EXTENSIONS = ('.tif', '.tiff', '.vrt')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    content_hash TEXT,
+    params TEXT,
+    registered REAL
+);
+CREATE INDEX IF NOT EXISTS artifacts_name ON artifacts (name);
+CREATE INDEX IF NOT EXISTS artifacts_hash ON artifacts (content_hash);
+CREATE VIRTUAL TABLE IF NOT EXISTS artifacts_rtree USING rtree (id, minx, maxx, miny, maxy);
+"""
+
+
+def file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    """Content hash of a file, read in chunks."""
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _coordinates_bounds(coords) -> list:
+    """Flatten nested GeoJSON coordinates into [minx, miny, maxx, maxy]."""
+    xs, ys = [], []
+    stack = [coords]
+    while stack:
+        item = stack.pop()
+        if item and isinstance(item[0], (int, float)):
+            xs.append(item[0])
+            ys.append(item[1])
+        else:
+            stack.extend(item)
+    return [min(xs), min(ys), max(xs), max(ys)] if xs else None
+
+
+def file_bounds(path: str):
+    """Bounding box (minx, miny, maxx, maxy) in EPSG:4326 of a raster, point CSV or GeoJSON, else None."""
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext in RASTER_EXTENSIONS:
+            with rasterio.open(path) as src:
+                if src.crs is None:
+                    return None
+                return tuple(transform_bounds(src.crs, 'EPSG:4326', *src.bounds))
+        if ext == '.csv':
+            header = pd.read_csv(path, nrows=0).columns
+            if 'longitude' in header and 'latitude' in header:
+                df = pd.read_csv(path, usecols=['longitude', 'latitude'])
+                if len(df):
+                    return (df['longitude'].min(), df['latitude'].min(),
+                            df['longitude'].max(), df['latitude'].max())
+        if ext in ('.geojson', '.json'):
+            with open(path) as f:
+                data = json.load(f)
+            features = data.get('features', [data])
+            boxes = [_coordinates_bounds((feat.get('geometry') or feat).get('coordinates', []))
+                     for feat in features]
+            boxes = [b for b in boxes if b]
+            if boxes:
+                return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+                        max(b[2] for b in boxes), max(b[3] for b in boxes))
+    except (rasterio.errors.RasterioIOError, ValueError, KeyError, AttributeError, TypeError):
+        pass
+    return None
+
+
+class ArtifactCatalog:
+    """Catalog of the artifacts in one output directory.
+
+    Args:
+        directory: Output directory; paths are stored relative to it
+        db_path: Catalog database (default: directory/.artifacts.sqlite)
+    """
+
+    def __init__(self, directory: str, db_path: str = None):
+        self.directory = os.path.abspath(directory)
+        self.db_path = db_path or os.path.join(self.directory, CATALOG_NAME)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _relpath(self, path: str) -> str:
+        return os.path.relpath(os.path.abspath(path), self.directory)
+
+    def _abspath(self, relpath: str) -> str:
+        return os.path.normpath(os.path.join(self.directory, relpath))
+
+    def register(self, path: str, params: dict = None, bounds: tuple = None) -> int:
+        """Record a file, hashing its content and reading its bounds.
+
+        Parameters of an existing record are kept unless new ones are given;
+        its hash is reused if the file's size and mtime are unchanged.
+
+        Returns:
+            Artifact id
+        """
+        stat = os.stat(path)
+        relpath = self._relpath(path)
+        bounds = bounds or file_bounds(path)
+        with self.conn:
+            row = self.conn.execute("SELECT id, params, size, mtime, content_hash FROM artifacts WHERE path = ?",
+                                    (relpath,)).fetchone()
+            unchanged = row is not None and (row['size'], row['mtime']) == (stat.st_size, stat.st_mtime)
+            values = (os.path.basename(path), stat.st_size, stat.st_mtime,
+                      row['content_hash'] if unchanged else file_hash(path),
+                      json.dumps(params, sort_keys=True, default=str) if params is not None
+                      else (row['params'] if row else None), time.time())
+            if row:
+                artifact_id = row['id']
+                self.conn.execute(
+                    "UPDATE artifacts SET name = ?, size = ?, mtime = ?, content_hash = ?, params = ?, "
+                    "registered = ? WHERE id = ?", values + (artifact_id,))
+                self.conn.execute("DELETE FROM artifacts_rtree WHERE id = ?", (artifact_id,))
+            else:
+                artifact_id = self.conn.execute(
+                    "INSERT INTO artifacts (name, size, mtime, content_hash, params, registered, path) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", values + (relpath,)).lastrowid
+            if bounds:
+                minx, miny, maxx, maxy = bounds
+                self.conn.execute("INSERT INTO artifacts_rtree VALUES (?, ?, ?, ?, ?)",
+                                  (artifact_id, minx, maxx, miny, maxy))
+        return artifact_id
+
+    def sync(self) -> int:
+        """Bring the catalog in line with the files in the directory.
+
+        New and changed files (by size and mtime) are registered, records of
+        removed files are dropped.
+
+        Returns:
+            Number of files registered
+        """
+        known = {row['path']: (row['size'], row['mtime'])
+                 for row in self.conn.execute("SELECT path, size, mtime FROM artifacts")}
+        seen, registered = set(), 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file() or entry.name.startswith(CATALOG_NAME):
+                    continue
+                stat = entry.stat()
+                seen.add(entry.name)
+                if known.get(entry.name) != (stat.st_size, stat.st_mtime):
+                    self.register(entry.path)
+                    registered += 1
+        # Files in subdirectories are only registered explicitly
+        removed = [p for p in known if p not in seen and
+                   (os.sep not in p or not os.path.exists(self._abspath(p)))]
+        with self.conn:
+            for relpath in removed:
+                row = self.conn.execute("SELECT id FROM artifacts WHERE path = ?", (relpath,)).fetchone()
+                self.conn.execute("DELETE FROM artifacts WHERE id = ?", (row['id'],))
+                self.conn.execute("DELETE FROM artifacts_rtree WHERE id = ?", (row['id'],))
+        return registered
+
+    def register_new(self, prefix: str = '') -> list:
+        """Register the files of the directory starting with prefix that are new or changed.
+
+        Unlike sync only these files are looked at, so a lookup by prefix
+        sees files copied in by hand without hashing the whole directory.
+
+        Returns:
+            Paths of the files registered
+        """
+        known = {row['path']: (row['size'], row['mtime']) for row in self.conn.execute(
+            "SELECT path, size, mtime FROM artifacts WHERE name >= ? AND name < ?",
+            (prefix, prefix + '\U0010ffff'))}
+        registered = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.startswith(prefix) or entry.name.startswith(CATALOG_NAME):
+                    continue
+                stat = entry.stat()
+                if known.get(entry.name) != (stat.st_size, stat.st_mtime):
+                    self.register(entry.path)
+                    registered.append(entry.path)
+        return registered
+
+    def find(self, prefix: str = '', bounds: tuple = None, params: dict = None) -> list:
+        """Artifacts matching a name prefix, intersecting bounds and matching parameters, newest first.
+
+        Args:
+            prefix: File name prefix
+            bounds: (minx, miny, maxx, maxy) in EPSG:4326 the artifact must intersect
+            params: Parameters the artifact must have been registered with
+
+        Returns:
+            List of dicts with path, name, size, mtime, content_hash and params
+        """
+        query = "SELECT a.* FROM artifacts a"
+        args = []
+        if bounds:
+            query += " JOIN artifacts_rtree r ON r.id = a.id"
+        query += " WHERE a.name >= ? AND a.name < ?"
+        args += [prefix, prefix + '\U0010ffff']
+        if bounds:
+            minx, miny, maxx, maxy = bounds
+            query += " AND r.minx <= ? AND r.maxx >= ? AND r.miny <= ? AND r.maxy >= ?"
+            args += [maxx, minx, maxy, miny]
+        for key, value in (params or {}).items():
+            query += " AND json_extract(a.params, ?) = json_extract(?, '$')"
+            args += [f'$."{key}"', json.dumps(value, default=str)]
+        query += " ORDER BY a.mtime DESC"
+        results = []
+        for row in self.conn.execute(query, args):
+            record = dict(row)
+            record['path'] = self._abspath(record['path'])
+            record['params'] = json.loads(record['params']) if record['params'] else {}
+            results.append(record)
+        return results
+
+    def latest(self, prefix: str, bounds: tuple = None, params: dict = None):
+        """Path of the newest matching artifact that still exists, or None."""
+        for match in self.find(prefix, bounds, params):
+            if os.path.exists(match['path']):
+                return match['path']
+        return None
+
+    def record(self, path: str):
+        """Catalog record of a file, or None if it is not registered."""
+        matches = [r for r in self.find(os.path.basename(path)) if r['path'] == os.path.abspath(path)]
+        return matches[0] if matches else None
+
+    def content_hash(self, path: str) -> str:
+        """Content hash of a file, registering it if needed."""
+        record = self.record(path)
+        stat = os.stat(path)
+        if record is None or (record['size'], record['mtime']) != (stat.st_size, stat.st_mtime):
+            self.register(path)
+            record = self.record(path)
+        return record['content_hash']
+
+    def bounds(self, path: str):
+        """Bounds of a registered file from the R-tree, or None."""
+        record = self.record(path)
+        if record is None:
+            return None
+        row = self.conn.execute("SELECT minx, miny, maxx, maxy FROM artifacts_rtree WHERE id = ?",
+                                (record['id'],)).fetchone()
+        return tuple(row) if row else None
+
+
+def register_artifact(path: str, params: dict = None, directory: str = None):
+    """Record a file just produced in the catalog of its directory (or of directory).
+
+    Catalog errors are reported but do not fail the stage that wrote the file.
+    """
+    path = str(path)
+    try:
+        with ArtifactCatalog(directory or os.path.dirname(os.path.abspath(path))) as catalog:
+            catalog.register(path, params=params)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Could not register {path} in the artifact catalog: {e}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sync or query the artifact catalog of an output directory')
+    parser.add_argument('--dir', type=str, default='chm_outputs', help='Output directory')
+    parser.add_argument('--sync', action='store_true', help='Register new or changed files in the directory')
+    parser.add_argument('--find', type=str, default=None, help='List artifacts whose name starts with this')
+    args = parser.parse_args(argv)
+
+    with ArtifactCatalog(args.dir) as catalog:
+        if args.sync:
+            print(f"Registered {catalog.sync()} new or changed files in {args.dir}")
+        if args.find is not None:
+            for record in catalog.find(args.find):
+                print(f"{record['path']}  {record['size']} bytes  {record['content_hash'][:12]}")
+
+
+if __name__ == '__main__':
+    main()
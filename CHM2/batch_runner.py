@@ -0,0 +1,280 @@
+"""Run the canopy height pipeline for many AOIs.
+
+AOIs come from a multi-feature GeoJSON (one job per feature) or a directory
+of GeoJSON files (one job per file). Each job runs the pipeline in its own
+process with its own output directory, under a memory limit and with the
+BLAS/OpenMP/torch thread pools capped, so a failing or runaway AOI does not
+take the others down. A status and metrics table is rewritten as jobs finish.
+"""
+
+import os
+import re
+import sys
+import json
+import glob
+import time
+import argparse
+import traceback
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from tracing import max_rss_mb
+
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                   'NUMEXPR_NUM_THREADS', 'GDAL_NUM_THREADS')
+STATUS_FILE = 'batch_status.csv'
+JOB_RESULT_FILE = 'batch_job.json'
+
+
+def _job_name(feature: dict, index: int) -> str:
+    """File-safe job name from a feature's name/id property, else its index."""
+    properties = feature.get('properties') or {}
+    for key in ('name', 'NAME', 'id', 'ID', 'unit', 'fid'):
+        if properties.get(key) not in (None, ''):
+            return re.sub(r'[^\w.-]+', '_', str(properties[key])).strip('_') or f'aoi_{index:04d}'
+    if feature.get('id') not in (None, ''):
+        return re.sub(r'[^\w.-]+', '_', str(feature['id'])).strip('_') or f'aoi_{index:04d}'
+    return f'aoi_{index:04d}'
+
+
+def _unique_name(name: str, index: int, seen: set) -> str:
+    """name, suffixed with the job index if another job already has it; added to seen."""
+    if name in seen:
+        name = f'{name}_{index:04d}'
+        while name in seen:
+            name += '_'
+    seen.add(name)
+    return name
+
+
+def split_aois(source: str, work_dir: str) -> list:
+    """List the AOI jobs of a GeoJSON file or a directory of GeoJSON files.
+
+    Features of a FeatureCollection are written to work_dir/aois/<name>.geojson
+    so each job gets a single-feature AOI file.
+
+    Args:
+        source: GeoJSON file or directory of .geojson/.json files
+        work_dir: Batch output directory
+
+    Returns:
+        List of dicts with 'name' and 'aoi' (path of the single-AOI GeoJSON)
+    """
+    if os.path.isdir(source):
+        paths = sorted(glob.glob(os.path.join(source, '*.geojson')) + glob.glob(os.path.join(source, '*.json')))
+        if not paths:
+            raise ValueError(f"No GeoJSON files found in {source}")
+        # Jobs with one name would share an output directory (e.g. a.geojson and a.json)
+        seen = set()
+        return [{'name': _unique_name(os.path.splitext(os.path.basename(p))[0], i, seen), 'aoi': os.path.abspath(p)}
+                for i, p in enumerate(paths)]
+
+    with open(source) as f:
+        geojson_data = json.load(f)
+    if geojson_data.get('type') != 'FeatureCollection':
+        return [{'name': os.path.splitext(os.path.basename(source))[0], 'aoi': os.path.abspath(source)}]
+    features = geojson_data['features']
+    if not features:
+        raise ValueError("Empty FeatureCollection")
+
+    aoi_dir = os.path.join(work_dir, 'aois')
+    os.makedirs(aoi_dir, exist_ok=True)
+    jobs, seen = [], set()
+    for i, feature in enumerate(features):
+        name = _unique_name(_job_name(feature, i), i, seen)
+        path = os.path.join(aoi_dir, f'{name}.geojson')
+        collection = {'type': 'FeatureCollection', 'features': [feature]}
+        if geojson_data.get('crs'):
+            collection['crs'] = geojson_data['crs']
+        with open(path, 'w') as f:
+            json.dump(collection, f)
+        jobs.append({'name': name, 'aoi': os.path.abspath(path)})
+    return jobs
+
+
+def limit_resources(memory_mb: int = None, threads: int = None):
+    """Cap the address space and thread pools of the current process.
+
+    Thread variables only take effect for libraries imported afterwards, so
+    this runs first in each job process.
+    """
+    if threads:
+        for var in THREAD_ENV_VARS:
+            os.environ[var] = str(threads)
+    if memory_mb:
+        try:
+            import resource
+            limit = int(memory_mb) * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError) as e:
+            print(f"Warning: could not set memory limit: {e}")
+
+
+def _latest_metrics(output_dir: str) -> dict:
+    """Metrics of the newest evaluation_metrics.json under output_dir."""
+    paths = glob.glob(os.path.join(output_dir, 'evaluation', '*', 'evaluation_metrics.json'))
+    if not paths:
+        return {}
+    with open(max(paths, key=os.path.getmtime)) as f:
+        return json.load(f).get('metrics', {})
+
+
+def run_job(job: dict) -> dict:
+    """Run the pipeline for one AOI in this process; returns its status record."""
+    limit_resources(job.get('memory_mb'), job.get('threads'))
+    if job.get('threads'):
+        try:
+            import torch
+            torch.set_num_threads(int(job['threads']))
+        except ImportError:
+            pass
+    from run_main import run_pipeline
+
+    start = time.time()
+    record = {'name': job['name'], 'status': 'failed', 'error': '', 'stages': {}}
+    try:
+        results = run_pipeline(job['aoi'], job['output_dir'], job.get('stage', 'all'),
+                               force=job.get('force', False), ref_file=job.get('reference'),
+                               sync=job.get('sync', False))
+        record['stages'] = {name: r['status'] for name, r in results.items()}
+        failed = [name for name, r in results.items() if r['status'] not in ('done', 'cached')]
+        if failed:
+            record['error'] = f"stages not completed: {', '.join(failed)}"
+        else:
+            record['status'] = 'done'
+    except MemoryError:
+        record['error'] = f"memory limit of {job.get('memory_mb')} MB exceeded"
+    except Exception as e:
+        traceback.print_exc()
+        record['error'] = f"{type(e).__name__}: {e}"
+    record['seconds'] = time.time() - start
+    record['max_rss_mb'] = max_rss_mb()
+    record['metrics'] = _latest_metrics(job['output_dir'])
+    return record
+
+
+def _run_job_process(job: dict, timeout: float = None) -> dict:
+    """Run a job in a child process and collect its status record."""
+    os.makedirs(job['output_dir'], exist_ok=True)
+    job_file = os.path.join(job['output_dir'], JOB_RESULT_FILE)
+    if os.path.exists(job_file):
+        os.remove(job_file)
+    log_path = os.path.join(job['output_dir'], 'batch_job.log')
+    cmd = [sys.executable, os.path.abspath(__file__), '--run-job', json.dumps(job)]
+    start = time.time()
+    with open(log_path, 'w') as log:
+        try:
+            proc = subprocess.run(cmd, stdout=log, stderr=subprocess.STDOUT, timeout=timeout,
+                                  cwd=os.path.dirname(os.path.abspath(__file__)))
+            returncode = proc.returncode
+        except subprocess.TimeoutExpired:
+            returncode = None
+    if os.path.exists(job_file):
+        with open(job_file) as f:
+            return json.load(f)
+    if returncode is None:
+        error = f"timed out after {timeout}s"
+    elif returncode < 0:
+        error = f"killed by signal {-returncode}"
+    else:
+        error = f"exited with code {returncode}"
+    return {'name': job['name'], 'status': 'failed', 'error': f"{error}, see {log_path}", 'stages': {},
+            'seconds': time.time() - start, 'max_rss_mb': float('nan'), 'metrics': {}}
+
+
+def write_status_table(records: list, output_path: str):
+    """Write job records as a CSV table with one column per stage and metric."""
+    import pandas as pd
+    rows = []
+    for record in records:
+        row = {key: record.get(key) for key in ('name', 'status', 'seconds', 'max_rss_mb', 'error', 'output_dir')}
+        row.update({f'stage_{name}': status for name, status in record.get('stages', {}).items()})
+        row.update(record.get('metrics', {}))
+        rows.append(row)
+    pd.DataFrame(rows).to_csv(output_path, index=False)
+
+
+def run_batch(source: str, output_dir: str, stage: str = 'all', max_workers: int = 2,
+              memory_mb: int = None, threads: int = None, timeout: float = None,
+              reference: str = None, force: bool = False, sync: bool = False) -> list:
+    """Run the pipeline for every AOI of a source, continuing past failures.
+
+    Args:
+        source: Multi-feature GeoJSON or directory of GeoJSON files
+        output_dir: Batch directory; each AOI gets output_dir/<name>
+        stage: Pipeline stage to run, or 'all'
+        max_workers: Number of AOIs processed at once
+        memory_mb: Address-space limit per job in MB
+        threads: Thread limit per job for BLAS, OpenMP, GDAL and torch
+        timeout: Wall-time limit per job in seconds
+        reference: Reference height raster shared by all AOIs
+            (default: dchm_09id4.tif in each AOI directory)
+        force: Rerun stages with cached outputs
+        sync: Re-catalog the whole AOI directories (dropping removed files) before running
+
+    Returns:
+        List of job status records; also written to output_dir/batch_status.csv
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = split_aois(source, output_dir)
+    for job in jobs:
+        job.update({'output_dir': os.path.abspath(os.path.join(output_dir, job['name'])), 'stage': stage,
+                    'memory_mb': memory_mb, 'threads': threads, 'force': force, 'sync': sync,
+                    'reference': os.path.abspath(reference) if reference else None})
+    print(f"Running {len(jobs)} AOIs with {max_workers} workers")
+
+    status_path = os.path.join(output_dir, STATUS_FILE)
+    records = {job['name']: {'name': job['name'], 'status': 'pending', 'output_dir': job['output_dir']}
+               for job in jobs}
+    write_status_table(list(records.values()), status_path)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_run_job_process, job, timeout): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            record = future.result()
+            record['output_dir'] = job['output_dir']
+            records[job['name']] = record
+            write_status_table(list(records.values()), status_path)
+            message = f" ({record['error']})" if record['error'] else ''
+            print(f"[{job['name']}] {record['status']} in {record['seconds']:.1f}s{message}")
+
+    records = list(records.values())
+    n_done = sum(r['status'] == 'done' for r in records)
+    print(f"{n_done}/{len(records)} AOIs completed, status written to {status_path}")
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the canopy height pipeline for many AOIs')
+    parser.add_argument('--aois', type=str, help='Multi-feature GeoJSON or directory of GeoJSON files')
+    parser.add_argument('--output-dir', type=str, default='chm_batch', help='Batch output directory')
+    parser.add_argument('--stage', type=str, default='all',
+                        choices=['all', 'data_preparation', 'height_analysis', 'train_predict', 'evaluate'],
+                        help='Pipeline stage to run')
+    parser.add_argument('--workers', type=int, default=2, help='Number of AOIs processed at once')
+    parser.add_argument('--memory-mb', type=int, default=None, help='Memory limit per AOI job in MB')
+    parser.add_argument('--threads', type=int, default=None, help='Thread limit per AOI job')
+    parser.add_argument('--timeout', type=float, default=None, help='Wall-time limit per AOI job in seconds')
+    parser.add_argument('--reference', type=str, default=None, help='Reference height raster shared by all AOIs')
+    parser.add_argument('--force', action='store_true', help='Rerun stages with cached outputs')
+    parser.add_argument('--sync', action='store_true',
+                        help='Re-catalog the AOI directories (dropping removed files) before running')
+    parser.add_argument('--run-job', type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_job:
+        job = json.loads(args.run_job)
+        record = run_job(job)
+        with open(os.path.join(job['output_dir'], JOB_RESULT_FILE), 'w') as f:
+            json.dump(record, f, indent=2, default=str)
+        return 0 if record['status'] == 'done' else 1
+
+    if not args.aois:
+        parser.error('--aois is required')
+    records = run_batch(args.aois, args.output_dir, args.stage, args.workers, args.memory_mb,
+                        args.threads, args.timeout, args.reference, args.force, args.sync)
+    return 0 if all(r['status'] == 'done' for r in records) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
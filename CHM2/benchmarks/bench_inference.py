@@ -0,0 +1,266 @@
+"""Benchmark inference paths across batch sizes and thread/process counts.
+
+Loads a saved model (train_predict_map.py --save-model) and a stack tile,
+then measures pixels per second and peak memory above baseline for each
+inference path available for the model:
+
+    rf          sklearn RandomForestRegressor.predict (n_jobs = threads)
+    mlp_b<N>    MLP on normalized pixels in batches of N
+    mlp_folded  MLP with normalization and batch norms folded into Linear layers
+    conv1x1     folded MLP as 1x1 convolutions over the whole tile
+    mlp_qint8   folded MLP with dynamically quantized int8 Linear layers
+
+Each path runs with 1..N threads, and with --processes also across worker
+processes splitting the tile. Outputs are compared with the reference path
+of the model (rf or mlp_b<largest>) so accuracy loss (e.g. from
+quantization) is visible next to the speed.
+
+Usage:
+    python benchmarks/bench_inference.py --model chm_outputs/model_mlp.pt --stack chm_outputs/stack.tif
+    python benchmarks/bench_inference.py --synthetic --tile-size 512 --threads 1 2 4 --processes 2
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+DEFAULT_BATCH_SIZES = [64, 1024, 16384, 65536]
+
+
+class PeakMemory:
+    """Peak resident memory above the starting level, sampled in a thread."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+        self._stop = threading.Event()
+
+    def _rss(self) -> int:
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * self.page_size
+        except OSError:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._rss())
+
+    def __enter__(self):
+        self.start = self.peak = self._rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._rss())
+        self.peak_mb = (self.peak - self.start) / 2**20
+
+
+def read_tile(stack_path: str, tile_size: int, row_off: int = 0, col_off: int = 0) -> np.ndarray:
+    """Read a (bands, rows, cols) float32 tile of the stack."""
+    import rasterio
+    from rasterio.windows import Window
+    with rasterio.open(stack_path) as src:
+        window = Window(col_off, row_off, min(tile_size, src.width - col_off), min(tile_size, src.height - row_off))
+        return src.read(window=window, out_dtype='float32')
+
+
+def build_paths(model, model_type: str, batch_sizes: list) -> dict:
+    """Inference functions taking a (bands, rows, cols) tile and returning per-pixel predictions."""
+    def pixels(tile):
+        return tile.reshape(tile.shape[0], -1).T
+
+    if model_type == 'rf':
+        return {'rf': lambda tile: model.predict(pixels(tile))}
+
+    import torch
+    from dl_models import fold_mlp, linear_to_conv1x1
+
+    def batched(net, batch_size, normalize):
+        def run(tile):
+            X = torch.from_numpy(np.ascontiguousarray(pixels(tile)))
+            if normalize:
+                X = (X - model.scaler_mean) / model.scaler_std
+            with torch.no_grad():
+                return torch.cat([net(X[i:i + batch_size]).reshape(-1)
+                                  for i in range(0, len(X), batch_size)]).numpy()
+        return run
+
+    folded = fold_mlp(model)
+    conv = linear_to_conv1x1(folded)
+    quantized = torch.ao.quantization.quantize_dynamic(folded, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def conv_run(tile):
+        with torch.no_grad():
+            return conv(torch.from_numpy(tile)[None]).reshape(-1).numpy()
+
+    paths = {f'mlp_b{bs}': batched(model, bs, True) for bs in sorted(batch_sizes, reverse=True)}
+    paths['mlp_folded'] = batched(folded, max(batch_sizes), False)
+    paths['conv1x1'] = conv_run
+    paths['mlp_qint8'] = batched(quantized, max(batch_sizes), False)
+    return paths
+
+
+def set_threads(model, model_type: str, threads: int):
+    if model_type == 'rf':
+        model.set_params(n_jobs=threads)
+    else:
+        import torch
+        torch.set_num_threads(threads)
+
+
+_worker = {}
+
+
+def _init_worker(model_path: str, path_name: str, batch_sizes: list, repo_dir: str = REPO_DIR):
+    if repo_dir not in sys.path:
+        sys.path.insert(0, repo_dir)
+    from train_predict_map import load_model
+    model, model_type = load_model(model_path)
+    set_threads(model, model_type, 1)
+    _worker['run'] = build_paths(model, model_type, batch_sizes)[path_name]
+
+
+def _run_worker(tile: np.ndarray) -> np.ndarray:
+    return _worker['run'](tile)
+
+
+def time_path(run, tile: np.ndarray, repeat: int) -> tuple:
+    """Best wall time, peak memory (MB) and output of a path on a tile."""
+    run(tile[:, :8, :8])  # warm up
+    times, peak = [], 0.0
+    for _ in range(repeat):
+        with PeakMemory() as memory:
+            start = time.perf_counter()
+            output = run(tile)
+            times.append(time.perf_counter() - start)
+        peak = max(peak, memory.peak_mb)
+    return min(times), peak, np.asarray(output).reshape(-1)
+
+
+def time_processes(model_path: str, path_name: str, batch_sizes: list, tile: np.ndarray,
+                   n_processes: int, repeat: int) -> tuple:
+    """Best wall time of a path with the tile split into row strips across processes."""
+    strips = np.array_split(np.arange(tile.shape[1]), n_processes)
+    # Spawn, not fork: forking after torch/OpenMP threads started deadlocks the workers
+    with ProcessPoolExecutor(n_processes, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker,
+                             initargs=(model_path, path_name, batch_sizes, REPO_DIR)) as executor:
+        list(executor.map(_run_worker, [tile[:, :8, :8]] * n_processes))  # load models
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = np.concatenate([np.asarray(o).reshape(-1) for o in executor.map(
+                _run_worker, [np.ascontiguousarray(tile[:, s[0]:s[-1] + 1]) for s in strips])])
+            times.append(time.perf_counter() - start)
+    return min(times), float('nan'), output
+
+
+def synthetic_inputs(data_dir: str, tile_size: int) -> tuple:
+    """Synthetic stack plus saved RF and (untrained, correctly shaped) MLP models."""
+    import torch
+    from synthetic import make_dataset
+    from train_predict_map import load_training_data, train_model, save_model
+    from dl_models import MLPRegressionModel
+    dataset = make_dataset(data_dir, max(tile_size, 256), 5000)
+    model_paths = [os.path.join(data_dir, 'model_rf.joblib'), os.path.join(data_dir, 'model_mlp.pt')]
+    if not all(os.path.exists(p) for p in model_paths):
+        X, y = load_training_data(dataset['training'])
+        rf, _, _ = train_model(X, y, model_type='rf', test_size=0.1)
+        save_model(rf, data_dir, 'rf')
+        # Inference speed does not depend on the weights, so the MLP is not trained
+        mlp = MLPRegressionModel(input_size=X.shape[1]).eval()
+        mlp.scaler_mean = torch.FloatTensor(X.mean(axis=0))
+        mlp.scaler_std = torch.FloatTensor(X.std(axis=0))
+        save_model(mlp, data_dir, 'mlp')
+    return dataset['stack'], model_paths
+
+
+def run_matrix(model_path: str, tile: np.ndarray, threads: list, processes: list, batch_sizes: list,
+               repeat: int) -> list:
+    """Benchmark every path of one model; returns result rows."""
+    from train_predict_map import load_model
+    model, model_type = load_model(model_path)
+    paths = build_paths(model, model_type, batch_sizes)
+    n_pixels = tile.shape[1] * tile.shape[2]
+    rows, reference = [], None
+    for name, run in paths.items():
+        base_rate = None
+        configs = [('threads', t) for t in threads] + [('processes', p) for p in processes]
+        for mode, count in configs:
+            if mode == 'threads':
+                set_threads(model, model_type, count)
+                seconds, peak_mb, output = time_path(run, tile, repeat)
+            else:
+                seconds, peak_mb, output = time_processes(model_path, name, batch_sizes, tile, count, repeat)
+            if reference is None:
+                reference = output
+            rate = n_pixels / seconds
+            base_rate = base_rate or rate
+            rows.append({'model': model_type, 'path': name, 'mode': mode, 'workers': count,
+                         'pixels_per_second': rate, 'seconds': seconds, 'peak_mb': peak_mb,
+                         'speedup': rate / base_rate,
+                         'max_abs_diff': float(np.max(np.abs(output - reference)))})
+    return rows
+
+
+def print_table(rows: list):
+    print(f"{'model':<5} {'path':<12} {'mode':<9} {'n':>3} {'Mpx/s':>8} {'speedup':>8} {'peak MB':>8} {'max |diff|':>10}")
+    for r in rows:
+        print(f"{r['model']:<5} {r['path']:<12} {r['mode']:<9} {r['workers']:>3} "
+              f"{r['pixels_per_second'] / 1e6:>8.3f} {r['speedup']:>8.2f} {r['peak_mb']:>8.1f} {r['max_abs_diff']:>10.2e}")
+    best = max(rows, key=lambda r: r['pixels_per_second'])
+    print(f"\nFastest: {best['path']} with {best['workers']} {best['mode']} "
+          f"({best['pixels_per_second'] / 1e6:.3f} Mpx/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark inference paths across batch sizes and thread counts')
+    parser.add_argument('--model', type=str, nargs='+', default=None, help='Saved model(s) (.joblib or .pt)')
+    parser.add_argument('--stack', type=str, default=None, help='Stack GeoTIFF to read the tile from')
+    parser.add_argument('--synthetic', action='store_true', help='Use a synthetic stack and models')
+    parser.add_argument('--data-dir', type=str, default='bench_data', help='Directory for synthetic inputs')
+    parser.add_argument('--tile-size', type=int, default=512, help='Tile edge length in pixels')
+    parser.add_argument('--threads', type=int, nargs='+', default=None, help='Thread counts (default: 1, 2, 4.. up to CPUs)')
+    parser.add_argument('--processes', type=int, nargs='*', default=[], help='Process counts')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=DEFAULT_BATCH_SIZES, help='MLP batch sizes')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per configuration (best is reported)')
+    parser.add_argument('--output', type=str, default=None, help='Write the result rows to this JSON file')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        stack_path, model_paths = synthetic_inputs(args.data_dir, args.tile_size)
+    elif args.model and args.stack:
+        stack_path, model_paths = args.stack, args.model
+    else:
+        parser.error('give --model and --stack, or --synthetic')
+    threads = args.threads or sorted({min(2 ** i, os.cpu_count() or 1) for i in range(8)})
+
+    tile = read_tile(stack_path, args.tile_size)
+    tile = np.nan_to_num(tile)
+    print(f"Tile: {tile.shape[1]}x{tile.shape[2]} px, {tile.shape[0]} bands; threads {threads}, "
+          f"processes {args.processes}; best of {args.repeat}")
+    rows = []
+    for model_path in model_paths:
+        rows += run_matrix(model_path, tile, threads, args.processes, args.batch_sizes, args.repeat)
+    print_table(rows)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(rows, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
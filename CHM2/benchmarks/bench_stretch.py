@@ -0,0 +1,53 @@
+"""Benchmark the fused RGB stretch against scale_adjust_band.
+
+Usage:
+    python benchmarks/bench_stretch.py --size 4000 --repeat 3
+"""
+
+import argparse
+import os
+import sys
+import timeit
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from save_evaluation_pdf import scale_adjust_band, stretch_bands
+
+SCALE_PARAMS = [{'min': 0, 'max': 3000, 'contrast': 1.2, 'gamma': 0.8}] * 3
+
+
+def per_band(rgb):
+    """Stretch with the original per-band function."""
+    out = np.zeros(rgb.shape, dtype=np.uint8)
+    for i, p in enumerate(SCALE_PARAMS):
+        out[:, :, i] = scale_adjust_band(rgb[:, :, i], p['min'], p['max'],
+                                         contrast=p['contrast'], gamma=p['gamma'])
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark RGB stretch implementations')
+    parser.add_argument('--size', type=int, default=4000, help='Edge length of the test image in pixels')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs (best is reported)')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    reflectance = rng.integers(0, 10000, (args.size, args.size, 3)).astype(np.uint16)
+    cases = {
+        'uint16': reflectance,
+        'float32': reflectance.astype(np.float32),
+    }
+    cases['float32'][::97, ::89] = np.nan
+
+    print(f"Image: {args.size}x{args.size}x3, best of {args.repeat}")
+    for name, rgb in cases.items():
+        reference = per_band(rgb.astype(np.float32))
+        assert np.array_equal(stretch_bands(rgb, SCALE_PARAMS), reference), f"{name}: results differ"
+        t_old = min(timeit.repeat(lambda: per_band(rgb.astype(np.float32)), number=1, repeat=args.repeat))
+        t_new = min(timeit.repeat(lambda: stretch_bands(rgb, SCALE_PARAMS), number=1, repeat=args.repeat))
+        print(f"{name:>8}: scale_adjust_band {t_old:.3f}s, stretch_bands {t_new:.3f}s ({t_old / t_new:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
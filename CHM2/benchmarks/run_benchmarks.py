@@ -0,0 +1,219 @@
+"""Time the local pipeline on synthetic data and save the results as JSON.
+
+Each configuration (raster size x number of points) gets a synthetic
+dataset (see synthetic.py) and the following benchmarks, each run --repeat
+times: load_training_data, train_model, predict (load_prediction_data plus
+model prediction), load_and_align_rasters, calculate_metrics,
+combine_heights_with_training and save_evaluation_to_pdf. Results include
+the commit, so files from different commits can be compared with --compare.
+
+Usage:
+    python benchmarks/run_benchmarks.py --sizes 1024 4096 --points 10000 100000
+    python benchmarks/run_benchmarks.py --preset small --output bench_new.json --compare bench_old.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import make_dataset
+from tracing import max_rss_mb
+
+BENCHMARKS = ['load_training_data', 'train_model', 'predict', 'load_and_align_rasters',
+              'calculate_metrics', 'combine_heights', 'pdf_report']
+
+# (sizes, points) per preset
+PRESETS = {
+    'small': ([1024], [10000]),
+    'medium': ([1024, 4096], [10000, 100000]),
+    'large': ([4096, 10000, 40000], [100000, 2000000]),
+}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+class BenchmarkContext:
+    """State shared by the benchmarks of one dataset (trained model, aligned rasters)."""
+
+    def __init__(self, dataset: dict, work_dir: str, model_type: str):
+        self.dataset = dataset
+        self.work_dir = work_dir
+        self.model_type = model_type
+        self.X = self.y = self.model = None
+        self.aligned = None
+        self.metrics = None
+
+    def load_training_data(self):
+        from train_predict_map import load_training_data
+        self.X, self.y = load_training_data(self.dataset['training'], self.dataset['mask'])
+
+    def train_model(self):
+        from train_predict_map import train_model
+        if self.X is None:
+            self.load_training_data()
+        self.model, _, _ = train_model(self.X, self.y, model_type=self.model_type, test_size=0.1)
+
+    def predict(self):
+        import torch
+        from train_predict_map import load_prediction_data, RF_PREDICT_CHUNK
+        if self.model is None:
+            self.train_model()
+        X_pred, src = load_prediction_data(self.dataset['stack'], self.dataset['mask'])
+        src.close()
+        if self.model_type == 'rf':
+            for i in range(0, len(X_pred), RF_PREDICT_CHUNK):
+                self.model.predict(X_pred[i:i + RF_PREDICT_CHUNK])
+        else:
+            self.model.eval()
+            with torch.no_grad():
+                X_norm = (torch.FloatTensor(X_pred) - self.model.scaler_mean) / self.model.scaler_std
+                for i in range(0, len(X_norm), 65536):
+                    self.model(X_norm[i:i + 65536])
+
+    def load_and_align_rasters(self):
+        from raster_utils import load_and_align_rasters
+        self.aligned = load_and_align_rasters(self.dataset['prediction'], self.dataset['reference'],
+                                              self.dataset['mask'])
+
+    def calculate_metrics(self):
+        from evaluate_predictions import calculate_metrics
+        if self.aligned is None:
+            self.load_and_align_rasters()
+        pred, ref, _, _ = self.aligned
+        mask = (pred >= 0) & (pred <= 35) & (ref >= 0) & (ref <= 35)
+        self.metrics = calculate_metrics(pred[mask], ref[mask])
+
+    def combine_heights(self):
+        from combine_heights import combine_heights_with_training
+        output_dir = os.path.join(self.work_dir, 'combine')
+        os.makedirs(output_dir, exist_ok=True)
+        training = os.path.join(output_dir, 'training_data.csv')
+        if not os.path.exists(training):
+            os.symlink(os.path.abspath(self.dataset['training']), training)
+        combine_heights_with_training(output_dir, self.dataset['reference'], plot=False)
+
+    def pdf_report(self):
+        from save_evaluation_pdf import save_evaluation_to_pdf
+        if self.metrics is None:
+            self.calculate_metrics()
+        pred, ref, _, _ = self.aligned
+        mask = (pred >= 0) & (pred <= 35) & (ref >= 0) & (ref <= 35)
+        save_evaluation_to_pdf(self.dataset['prediction'], self.dataset['reference'], pred, ref, self.metrics,
+                               os.path.join(self.work_dir, 'report'), mask=mask,
+                               training_data_path=self.dataset['training'],
+                               merged_data_path=self.dataset['stack'], area_ha=float(mask.sum()) / 100)
+
+
+def _silenced(func):
+    """Run func with stdout redirected to devnull (the pipeline prints a lot)."""
+    import contextlib
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return func()
+
+
+def time_benchmark(func, repeat: int) -> dict:
+    """Wall times of repeated runs plus the peak RSS afterwards."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _silenced(func)
+        times.append(time.perf_counter() - start)
+    return {'seconds': times, 'best': min(times), 'mean': float(np.mean(times)), 'max_rss_mb': max_rss_mb()}
+
+
+def run_suite(sizes: list, points: list, data_dir: str, repeat: int = 1, benchmarks: list = None,
+              model_type: str = 'rf', n_bands: int = 10) -> dict:
+    """Run the benchmarks for every size and point count.
+
+    Returns:
+        Result document with environment info and one entry per benchmark run
+    """
+    benchmarks = benchmarks or BENCHMARKS
+    results = []
+    for size in sizes:
+        for n_points in points:
+            print(f"Dataset {size}x{size} px, {n_points:,} points")
+            start = time.perf_counter()
+            dataset = make_dataset(data_dir, size, n_points, n_bands)
+            print(f"  data ready in {time.perf_counter() - start:.1f}s")
+            with tempfile.TemporaryDirectory(dir=data_dir) as work_dir:
+                context = BenchmarkContext(dataset, work_dir, model_type)
+                for name in benchmarks:
+                    try:
+                        timing = time_benchmark(getattr(context, name), repeat)
+                        status = 'ok'
+                    except Exception as e:
+                        timing, status = {'seconds': [], 'best': None, 'mean': None, 'max_rss_mb': max_rss_mb()}, \
+                            f'{type(e).__name__}: {e}'
+                    results.append({'benchmark': name, 'size': size, 'points': n_points, 'status': status,
+                                    **timing})
+                    best = f"{timing['best']:.3f}s" if timing['best'] is not None else status
+                    print(f"  {name:<24} {best}")
+    return {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': {'sizes': sizes, 'points': points, 'repeat': repeat, 'model': model_type, 'bands': n_bands},
+        'results': results,
+    }
+
+
+def compare(current: dict, previous: dict) -> list:
+    """Rows of (benchmark, size, points, previous best, current best, ratio) for runs in both documents."""
+    before = {(r['benchmark'], r['size'], r['points']): r['best'] for r in previous['results']}
+    rows = []
+    for r in current['results']:
+        key = (r['benchmark'], r['size'], r['points'])
+        if before.get(key) and r['best']:
+            rows.append(key + (before[key], r['best'], r['best'] / before[key]))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the local pipeline on synthetic data')
+    parser.add_argument('--preset', choices=list(PRESETS), default=None, help='Predefined sizes and point counts')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1024], help='Raster edge lengths in pixels')
+    parser.add_argument('--points', type=int, nargs='+', default=[10000], help='Training point counts')
+    parser.add_argument('--bands', type=int, default=10, help='Number of predictor bands')
+    parser.add_argument('--model', choices=['rf', 'mlp'], default='rf', help='Model type for training and prediction')
+    parser.add_argument('--repeat', type=int, default=1, help='Timed runs per benchmark')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=None, help='Benchmarks to run')
+    parser.add_argument('--data-dir', type=str, default='bench_data', help='Directory for synthetic data (reused)')
+    parser.add_argument('--output', type=str, default=None, help='Results JSON (default: bench_<commit>.json)')
+    parser.add_argument('--compare', type=str, default=None, help='Earlier results JSON to compare with')
+    args = parser.parse_args()
+
+    sizes, points = PRESETS[args.preset] if args.preset else (args.sizes, args.points)
+    results = run_suite(sizes, points, args.data_dir, args.repeat, args.only, args.model, args.bands)
+    output = args.output or f"bench_{results['commit']}.json"
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        print(f"\nCompared with {previous['commit']} ({args.compare}):")
+        print(f"{'benchmark':<24} {'size':>6} {'points':>9} {'before':>9} {'after':>9} {'ratio':>6}")
+        for name, size, n_points, before, after, ratio in compare(results, previous):
+            print(f"{name:<24} {size:>6} {n_points:>9} {before:>8.3f}s {after:>8.3f}s {ratio:>6.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Synthetic inputs for benchmarking the local pipeline.
+
+Writes a predictor stack, forest mask, reference CHM, prediction raster and
+GEDI-like training CSV on a UTM grid. Rasters are written window by window,
+so sizes up to 40k x 40k pixels only need one window in memory (the files
+themselves are uncompressed: about 4 bytes x bands x pixels for the stack).
+
+Usage:
+    python benchmarks/synthetic.py --size 4096 --points 100000 --output-dir bench_data
+"""
+
+import argparse
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.warp import transform as transform_coords
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from raster_utils import iter_windows
+
+CRS = 'EPSG:32632'
+ORIGIN = (500000.0, 5200000.0)
+PIXEL_SIZE = 10.0
+NODATA = -32767.0
+BAND_NAMES = ['B2', 'B3', 'B4', 'B8', 'B11', 'B12', 'VV', 'VH', 'HH', 'HV', 'elevation', 'slope']
+
+
+def height_field(rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """Smooth canopy height pattern (m) at pixel positions."""
+    return (15 + 8 * np.sin(cols / 310.0) * np.cos(rows / 270.0)
+            + 4 * np.sin((rows + cols) / 97.0)).astype(np.float32)
+
+
+def band_values(height: np.ndarray, n_bands: int, noise: np.ndarray) -> np.ndarray:
+    """Predictor bands as noisy linear responses to height, shape (n_bands,) + height.shape."""
+    bands = np.empty((n_bands,) + height.shape, dtype=np.float32)
+    for b in range(n_bands):
+        bands[b] = (b + 1) * 100 + (-1) ** b * (b + 2) * height + noise[b]
+    return bands
+
+
+def _profile(size: int, count: int, dtype: str, nodata=None) -> dict:
+    return {'driver': 'GTiff', 'width': size, 'height': size, 'count': count, 'dtype': dtype, 'crs': CRS,
+            'transform': from_origin(ORIGIN[0], ORIGIN[1], PIXEL_SIZE, PIXEL_SIZE), 'nodata': nodata,
+            'tiled': True, 'blockxsize': 256, 'blockysize': 256, 'BIGTIFF': 'IF_SAFER'}
+
+
+def make_dataset(output_dir: str, size: int = 1024, n_points: int = 10000, n_bands: int = 10,
+                 seed: int = 0, block_size: int = 2048) -> dict:
+    """Write a synthetic dataset, reusing it if one with the same parameters exists.
+
+    Args:
+        output_dir: Directory for the files
+        size: Edge length of the rasters in pixels
+        n_points: Number of GEDI/training points
+        n_bands: Number of predictor bands in the stack
+        seed: Random seed
+        block_size: Edge length of the windows rasters are written in
+
+    Returns:
+        Dict of paths: stack, mask, reference, prediction, training, plus the parameters
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    params = {'size': size, 'n_points': n_points, 'n_bands': n_bands, 'seed': seed}
+    name = f'{size}px_{n_points}pts_b{n_bands}_s{seed}'
+    paths = {
+        'stack': os.path.join(output_dir, f'stack_{name}.tif'),
+        'mask': os.path.join(output_dir, f'forestMask_{name}.tif'),
+        'reference': os.path.join(output_dir, f'dchm_{name}.tif'),
+        'prediction': os.path.join(output_dir, f'predictCH_{name}.tif'),
+        'training': os.path.join(output_dir, f'training_data_{name}.csv'),
+    }
+    manifest = os.path.join(output_dir, f'dataset_{name}.json')
+    if os.path.exists(manifest) and all(os.path.exists(p) for p in paths.values()):
+        return {**paths, **params}
+
+    names = (BAND_NAMES * (n_bands // len(BAND_NAMES) + 1))[:n_bands]
+    with rasterio.open(paths['stack'], 'w', **_profile(size, n_bands, 'float32')) as stack, \
+            rasterio.open(paths['mask'], 'w', **_profile(size, 1, 'uint8', 0)) as mask, \
+            rasterio.open(paths['reference'], 'w', **_profile(size, 1, 'float32', NODATA)) as ref, \
+            rasterio.open(paths['prediction'], 'w', **_profile(size, 1, 'float32')) as pred:
+        stack.descriptions = tuple(names)
+        for i, window in enumerate(iter_windows(size, size, block_size)):
+            rng = np.random.default_rng([seed, i])
+            rows, cols = np.mgrid[window.row_off:window.row_off + window.height,
+                                  window.col_off:window.col_off + window.width]
+            height = height_field(rows, cols)
+            noise = rng.normal(0, 5, (n_bands,) + height.shape).astype(np.float32)
+            stack.write(band_values(height, n_bands, noise), window=window)
+            mask.write((height > 12).astype(np.uint8)[None], window=window)
+            reference = height + rng.normal(0, 1, height.shape).astype(np.float32)
+            reference[rng.random(height.shape) < 0.01] = NODATA
+            ref.write(reference[None], window=window)
+            pred.write((height + rng.normal(0, 3, height.shape)).astype(np.float32)[None], window=window)
+
+    # Training points at random pixel centres, with band values from the same model
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, size, n_points)
+    cols = rng.integers(0, size, n_points)
+    height = height_field(rows, cols)
+    noise = rng.normal(0, 5, (n_bands, n_points)).astype(np.float32)
+    df = pd.DataFrame(band_values(height, n_bands, noise).T, columns=names)
+    df['rh'] = height + rng.normal(0, 2, n_points).astype(np.float32)
+    xs = ORIGIN[0] + (cols + 0.5) * PIXEL_SIZE
+    ys = ORIGIN[1] - (rows + 0.5) * PIXEL_SIZE
+    lons, lats = transform_coords(CRS, 'EPSG:4326', xs, ys)
+    df['longitude'] = lons
+    df['latitude'] = lats
+    df.to_csv(paths['training'], index=False)
+
+    with open(manifest, 'w') as f:
+        json.dump({**paths, **params}, f, indent=2)
+    return {**paths, **params}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write synthetic benchmark inputs')
+    parser.add_argument('--size', type=int, default=1024, help='Edge length of the rasters in pixels')
+    parser.add_argument('--points', type=int, default=10000, help='Number of training points')
+    parser.add_argument('--bands', type=int, default=10, help='Number of predictor bands')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--output-dir', type=str, default='bench_data', help='Output directory')
+    args = parser.parse_args()
+
+    dataset = make_dataset(args.output_dir, args.size, args.points, args.bands, args.seed)
+    print(json.dumps(dataset, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""Block-wise evaluation of many predictions against many references."""
+
+import os
+import math
+from contextlib import ExitStack
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.transform import Affine
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import Resampling
+
+from raster_utils import iter_windows, pixel_size_m
+import telemetry
+from block_metrics import (
+    empty_sums, block_sums, grouped_sums, merge_sums, metrics_from_sums, summary_from_sums,
+    valid_pixel_mask
+)
+
+DEFAULT_HEIGHT_BINS = (0, 5, 10, 15, 20, 25, 30, 35)
+# Mask rasters are stratified by their integer class values 0-255
+N_MASK_CLASSES = 256
+
+
+def open_aligned(path: str, target, stack: ExitStack, resampling=Resampling.average):
+    """Open a raster on the grid of ``target``, warping only when the grids differ."""
+    src = stack.enter_context(rasterio.open(path))
+    if (src.crs == target.crs and src.transform == target.transform
+            and src.shape == target.shape):
+        return src
+    return stack.enter_context(WarpedVRT(
+        src,
+        crs=target.crs,
+        transform=target.transform,
+        width=target.width,
+        height=target.height,
+        resampling=resampling,
+        dtype='float32',
+        nodata=np.nan
+    ))
+
+
+def read_block(src, window) -> np.ndarray:
+    """Read band 1 of a window as float32 with nodata converted to NaN."""
+    data = src.read(1, window=window, out_dtype='float32')
+    if src.nodata is not None and not np.isnan(src.nodata):
+        data[data == src.nodata] = np.nan
+    return data
+
+
+def iter_aligned_blocks(paths: list, forest_mask_path: str = None, block_size: int = 1024):
+    """Read aligned blocks of several rasters on the grid of the first one.
+
+    Yields (window, list of float32 arrays, mask values or None) per block. Every
+    raster is read exactly once per block; the mask is resampled with nearest
+    neighbour so class values are preserved.
+    """
+    with ExitStack() as stack:
+        target = stack.enter_context(rasterio.open(paths[0]))
+        sources = [target] + [open_aligned(p, target, stack) for p in paths[1:]]
+        mask_src = None
+        if forest_mask_path and os.path.exists(forest_mask_path):
+            mask_src = open_aligned(forest_mask_path, target, stack, resampling=Resampling.nearest)
+
+        n_tiles = math.ceil(target.width / block_size) * math.ceil(target.height / block_size)
+        with telemetry.task('evaluate_blocks', total=target.width * target.height,
+                            tiles_total=n_tiles) as progress:
+            for window in iter_windows(target.width, target.height, block_size):
+                blocks = [read_block(src, window) for src in sources]
+                mask = read_block(mask_src, window) if mask_src is not None else None
+                progress.update(units=window.width * window.height, tiles=1,
+                                bytes_read=sum(b.nbytes for b in blocks) + (mask.nbytes if mask is not None else 0))
+                yield window, blocks, mask
+
+
+def raster_label(path: str) -> str:
+    """Short label for a raster used in comparison tables."""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def evaluate_matrix(pred_paths: list, ref_paths: list, forest_mask_path: str = None,
+                    block_size: int = 1024) -> pd.DataFrame:
+    """Evaluate every prediction against every reference in a single pass.
+
+    All rasters are aligned to the grid of the first prediction and read block
+    by block; each block updates the accumulators of every pair at once.
+
+    Args:
+        pred_paths: Paths to prediction rasters
+        ref_paths: Paths to reference rasters
+        forest_mask_path: Optional forest mask applied to all pairs
+        block_size: Edge length of the processing blocks in pixels
+
+    Returns:
+        DataFrame with one row per (prediction, reference) pair
+    """
+    n_pred, n_ref = len(pred_paths), len(ref_paths)
+    sums = empty_sums(n_pred, n_ref)
+
+    for _, blocks, mask_values in iter_aligned_blocks(list(pred_paths) + list(ref_paths),
+                                                      forest_mask_path, block_size):
+        preds, refs = blocks[:n_pred], blocks[n_pred:]
+        forest = mask_values > 0 if mask_values is not None else None
+        for i, pred in enumerate(preds):
+            for j, ref in enumerate(refs):
+                mask = valid_pixel_mask(pred, ref)
+                if forest is not None:
+                    mask &= forest
+                merge_sums(sums[i, j], block_sums(pred[mask], ref[mask]))
+
+    rows = []
+    for i, pred_path in enumerate(pred_paths):
+        for j, ref_path in enumerate(ref_paths):
+            pair_sums = sums[i, j]
+            row = {
+                'prediction': raster_label(pred_path),
+                'reference': raster_label(ref_path),
+                'N': int(pair_sums[0]),
+            }
+            row.update(metrics_from_sums(pair_sums))
+            if pair_sums[0] > 0:
+                summary = summary_from_sums(pair_sums)
+                row['Pred Mean'] = summary['pred_stats']['mean']
+                row['Ref Mean'] = summary['ref_stats']['mean']
+            else:
+                row['Pred Mean'] = row['Ref Mean'] = np.nan
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def evaluate_stratified(pred_path: str, ref_path: str, forest_mask_path: str = None,
+                        height_bins=DEFAULT_HEIGHT_BINS, tile_size_m: float = 1000.0,
+                        block_size: int = 1024) -> tuple:
+    """Compute metrics per reference height class, mask class and spatial tile.
+
+    Each block is reduced with grouped ``np.bincount`` sums, so there is no loop
+    over strata or tiles. Height classes and tiles only use forest pixels when a
+    mask is given; mask classes cover all valid pixels grouped by mask value.
+
+    Args:
+        pred_path: Path to prediction raster
+        ref_path: Path to reference raster
+        forest_mask_path: Optional mask raster (forest mask or class map)
+        height_bins: Edges of the reference height classes in meters
+        tile_size_m: Edge length of the spatial tiles in meters
+        block_size: Edge length of the processing blocks in pixels
+
+    Returns:
+        Tuple of (strata table, per-tile metrics dict of 2D arrays, tile transform, CRS)
+    """
+    bins = np.asarray(height_bins, dtype=np.float64)
+    n_bins = len(bins) - 1
+    with rasterio.open(pred_path) as src:
+        tile_px = max(1, int(round(tile_size_m / max(pixel_size_m(src)))))
+        n_tile_rows = math.ceil(src.height / tile_px)
+        n_tile_cols = math.ceil(src.width / tile_px)
+        tile_transform = src.transform * Affine.scale(tile_px)
+        crs = src.crs
+
+    height_sums = empty_sums(n_bins)
+    class_sums = empty_sums(N_MASK_CLASSES)
+    tile_sums = empty_sums(n_tile_rows * n_tile_cols)
+    has_mask = False
+
+    for window, (pred, ref), mask_values in iter_aligned_blocks([pred_path, ref_path],
+                                                                forest_mask_path, block_size):
+        valid = valid_pixel_mask(pred, ref)
+        if mask_values is not None:
+            has_mask = True
+            classes = np.clip(np.nan_to_num(mask_values[valid]), 0, N_MASK_CLASSES - 1).astype(np.intp)
+            merge_sums(class_sums, grouped_sums(pred[valid], ref[valid], classes, N_MASK_CLASSES))
+            valid &= mask_values > 0
+
+        rows, cols = np.nonzero(valid)
+        pred_valid, ref_valid = pred[valid], ref[valid]
+
+        tile_labels = ((rows + window.row_off) // tile_px) * n_tile_cols + (cols + window.col_off) // tile_px
+        merge_sums(tile_sums, grouped_sums(pred_valid, ref_valid, tile_labels, len(tile_sums)))
+
+        in_range = (ref_valid >= bins[0]) & (ref_valid <= bins[-1])
+        height_labels = np.clip(np.searchsorted(bins, ref_valid[in_range], side='right') - 1, 0, n_bins - 1)
+        merge_sums(height_sums, grouped_sums(pred_valid[in_range], ref_valid[in_range],
+                                             height_labels, n_bins))
+
+    tables = [strata_table(height_sums, 'height_class',
+                           [f"{lo:g}-{hi:g} m" for lo, hi in zip(bins[:-1], bins[1:])])]
+    if has_mask:
+        tables.append(strata_table(class_sums, 'mask_class', [str(v) for v in range(N_MASK_CLASSES)]))
+    table = pd.concat(tables, ignore_index=True)
+
+    tile_metrics = metrics_from_sums(tile_sums)
+    tile_metrics = {key: value.reshape(n_tile_rows, n_tile_cols) for key, value in tile_metrics.items()}
+    tile_metrics['N'] = tile_sums[:, 0].reshape(n_tile_rows, n_tile_cols)
+    return table, tile_metrics, tile_transform, crs
+
+
+def strata_table(sums: np.ndarray, stratum_type: str, labels: list) -> pd.DataFrame:
+    """Table of metrics for non-empty strata."""
+    table = pd.DataFrame(metrics_from_sums(sums))
+    table.insert(0, 'N', sums[:, 0].astype(np.int64))
+    table.insert(0, 'stratum', labels)
+    table.insert(0, 'stratum_type', stratum_type)
+    return table[table['N'] > 0].reset_index(drop=True)
+
+
+def write_tile_metrics_raster(output_path: str, tile_metrics: dict, transform, crs,
+                              metrics=('RMSE', 'Mean Error', 'MAE', 'N')) -> str:
+    """Write per-tile metrics as a low-resolution multi-band GeoTIFF."""
+    first = tile_metrics[metrics[0]]
+    profile = {
+        'driver': 'GTiff',
+        'dtype': 'float32',
+        'nodata': np.nan,
+        'width': first.shape[1],
+        'height': first.shape[0],
+        'count': len(metrics),
+        'crs': crs,
+        'transform': transform
+    }
+    with rasterio.open(output_path, 'w', **profile) as dst:
+        for band, metric in enumerate(metrics, start=1):
+            data = tile_metrics[metric].astype('float32')
+            if metric == 'N':
+                data[data == 0] = np.nan
+            dst.write(data, band)
+            dst.set_band_description(band, metric)
+    return output_path
@@ -0,0 +1,153 @@
+"""Accumulator-based evaluation metrics for block-wise processing.
+
+Metrics are derived from a fixed vector of sufficient statistics (counts and
+sums) so that blocks, strata or bootstrap replicates can be combined by
+simple addition instead of keeping every pixel in memory.
+"""
+
+import numpy as np
+
+# Order of the sufficient statistics in an accumulator vector
+FIELDS = (
+    'n',
+    'sum_err',
+    'sum_sq_err',
+    'sum_abs_err',
+    'sum_ref',
+    'sum_sq_ref',
+    'sum_pred',
+    'sum_sq_pred',
+    'within_1m',
+    'within_2m',
+    'within_5m',
+    'max_abs_err',
+)
+N_FIELDS = len(FIELDS)
+MAX_FIELD = FIELDS.index('max_abs_err')
+SUM_FIELDS = [i for i in range(N_FIELDS) if i != MAX_FIELD]
+
+
+def valid_pixel_mask(pred: np.ndarray, ref: np.ndarray, max_height: float = 35) -> np.ndarray:
+    """Mask of pixels with plausible heights in both prediction and reference."""
+    pred_mask = (pred >= 0) & (pred <= max_height) & ~np.isnan(pred)
+    ref_mask = (ref >= 0) & (ref <= max_height) & (ref != -32767) & ~np.isnan(ref)
+    return pred_mask & ref_mask
+
+
+def empty_sums(*shape: int) -> np.ndarray:
+    """Return a zeroed accumulator, or an array of accumulators of the given leading shape."""
+    return np.zeros(shape + (N_FIELDS,), dtype=np.float64)
+
+
+def block_sums(pred: np.ndarray, ref: np.ndarray) -> np.ndarray:
+    """Sufficient statistics for a set of already-masked prediction/reference values."""
+    sums = empty_sums()
+    if pred.size == 0:
+        return sums
+    pred = pred.astype(np.float64, copy=False)
+    ref = ref.astype(np.float64, copy=False)
+    err = pred - ref
+    abs_err = np.abs(err)
+    sums[:] = (
+        err.size,
+        err.sum(),
+        np.dot(err, err),
+        abs_err.sum(),
+        ref.sum(),
+        np.dot(ref, ref),
+        pred.sum(),
+        np.dot(pred, pred),
+        np.count_nonzero(abs_err <= 1.0),
+        np.count_nonzero(abs_err <= 2.0),
+        np.count_nonzero(abs_err <= 5.0),
+        abs_err.max(),
+    )
+    return sums
+
+
+def grouped_sums(pred: np.ndarray, ref: np.ndarray, labels: np.ndarray, n_groups: int) -> np.ndarray:
+    """Sufficient statistics per group label in a single vectorized pass.
+
+    Args:
+        pred: Masked prediction values (1-D)
+        ref: Masked reference values (1-D)
+        labels: Integer group label for each value, in [0, n_groups)
+        n_groups: Total number of groups
+
+    Returns:
+        Array of shape (n_groups, N_FIELDS)
+    """
+    pred = pred.astype(np.float64, copy=False)
+    ref = ref.astype(np.float64, copy=False)
+    labels = labels.astype(np.intp, copy=False)
+    err = pred - ref
+    abs_err = np.abs(err)
+
+    sums = empty_sums(n_groups)
+    columns = (
+        None,
+        err,
+        err * err,
+        abs_err,
+        ref,
+        ref * ref,
+        pred,
+        pred * pred,
+        abs_err <= 1.0,
+        abs_err <= 2.0,
+        abs_err <= 5.0,
+    )
+    for i, weights in enumerate(columns):
+        sums[:, i] = np.bincount(labels, weights=weights, minlength=n_groups)
+    np.maximum.at(sums[:, MAX_FIELD], labels, abs_err)
+    return sums
+
+
+def merge_sums(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Combine two accumulators (or arrays of accumulators) in place into ``a``."""
+    a[..., SUM_FIELDS] += b[..., SUM_FIELDS]
+    np.maximum(a[..., MAX_FIELD], b[..., MAX_FIELD], out=a[..., MAX_FIELD])
+    return a
+
+
+def metrics_from_sums(sums: np.ndarray) -> dict:
+    """Derive the ``calculate_metrics`` metric set from accumulated sums.
+
+    Works on a single accumulator or on an array of accumulators (last axis
+    holding the fields); in the latter case every metric is an array. Groups
+    without valid pixels yield NaN.
+    """
+    s = np.asarray(sums, dtype=np.float64)
+    n = s[..., 0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mse = s[..., 2] / n
+        mean_error = s[..., 1] / n
+        ss_tot = s[..., 5] - s[..., 4] ** 2 / n
+        r2 = 1.0 - s[..., 2] / ss_tot
+        std_error = np.sqrt(np.maximum(mse - mean_error ** 2, 0.0))
+        metrics = {
+            'MSE': mse,
+            'RMSE': np.sqrt(mse),
+            'MAE': s[..., 3] / n,
+            'R2': r2,
+            'Mean Error': mean_error,
+            'Std Error': std_error,
+            'Max Absolute Error': np.where(n > 0, s[..., MAX_FIELD], np.nan),
+            'Within 1m (%)': s[..., 8] / n * 100,
+            'Within 2m (%)': s[..., 9] / n * 100,
+            'Within 5m (%)': s[..., 10] / n * 100,
+        }
+    if s.ndim == 1:
+        metrics = {key: float(value) for key, value in metrics.items()}
+    return metrics
+
+
+def summary_from_sums(sums: np.ndarray) -> dict:
+    """Mean and standard deviation of predictions and references from accumulated sums."""
+    n = sums[0]
+    pred_mean = sums[6] / n
+    ref_mean = sums[4] / n
+    return {
+        'pred_stats': {'mean': pred_mean, 'std': np.sqrt(max(sums[7] / n - pred_mean ** 2, 0.0))},
+        'ref_stats': {'mean': ref_mean, 'std': np.sqrt(max(sums[5] / n - ref_mean ** 2, 0.0))},
+    }
@@ -4,11 +4,11 @@ import numpy as np
 import json
 import os
 from pathlib import Path
-import pandas as pd
 import datetime
 import argparse
 from typing import Union, List, Dict, Any
 import time
+import functools
 from tqdm import tqdm
 import rasterio
 from rasterio.transform import from_origin
@@ -18,10 +18,18 @@ from rasterio.crs import CRS
 from l2a_gedi_source import get_gedi_data
 from sentinel1_source import get_sentinel1_data
 from sentinel2_source import get_sentinel2_data
-from for_forest_masking import apply_forest_mask, create_forest_mask
+from for_forest_masking import apply_forest_mask, create_forest_mask, forest_mask_collections
 from alos2_source import get_alos2_data
 from new_random_sampling import create_training_data, generate_sampling_sites
 from canopyht_source import get_canopyht_data
+import tracing
+from tracing import span, traced
+from ee_batch import DeferredValues, export_info
+from export_tasks import ExportTaskManager
+from export_planner import plan_export, tile_region
+from artifact_catalog import file_bounds, register_artifact
+from feature_pages import PAGE_SIZE, write_features_csv
+import ee_cache
 
 def load_aoi(aoi_path: str) -> ee.Geometry:
     """
@@ -53,7 +61,10 @@ def load_aoi(aoi_path: str) -> ee.Geometry:
     if geojson_data['type'] == 'FeatureCollection':
         if not geojson_data['features']:
             raise ValueError("Empty FeatureCollection")
-        
+        if len(geojson_data['features']) > 1:
+            print(f"Warning: {aoi_path} has {len(geojson_data['features'])} features, using the first. "
+                  "Use batch_runner.py to map each feature separately.")
+
         # Get the first feature's geometry
         geometry = geojson_data['features'][0]['geometry']
         return create_geometry(geometry['type'], geometry['coordinates'])
@@ -64,7 +75,7 @@ def load_aoi(aoi_path: str) -> ee.Geometry:
     else:
         raise ValueError(f"Unsupported GeoJSON type: {geojson_data['type']}")
 
-def parse_args():
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(description='Canopy Height Mapping using Earth Engine')
     # Basic parameters
     parser.add_argument('--aoi', type=str, required=True, help='Path to AOI GeoJSON file')
@@ -107,97 +118,124 @@ def parse_args():
                        help='Export training data as CSV')
     parser.add_argument('--export-predictions', action='store_true',
                        help='Export predictions as TIF')
-    
-    args = parser.parse_args()
+    parser.add_argument('--export-gedi-points', action='store_true',
+                       help='Export GEDI footprints as CSV for building training data locally from the stack')
+    parser.add_argument('--trace', type=str, default=None,
+                       help='Write a Chrome trace of stage timings and memory to this JSON file')
+    parser.add_argument('--ee-cache', type=str, default=None,
+                       help='Cache getInfo results (sizes, band counts, areas) in this SQLite file')
+    parser.add_argument('--ee-cache-ttl', type=float, default=168,
+                       help='Hours cached getInfo results stay valid')
+    parser.add_argument('--task-state', type=str, default=None,
+                       help='Track the exports in this JSON file and wait until they finish (resumes after a restart)')
+    parser.add_argument('--max-exports', type=int, default=2,
+                       help='Exports running at the same time with --task-state')
+
+    args = parser.parse_args(argv)
     return args
 
+@traced()
 def initialize_ee():
     """Initialize Earth Engine with project ID."""
     EE_PROJECT_ID = "my-project-423921"
     ee.Initialize(project=EE_PROJECT_ID)
 
-def export_training_data(reference_data: ee.FeatureCollection, output_dir: str):
-    """Export training data as CSV."""
-    # Get feature properties as a list of dictionaries
-    features = reference_data.getInfo()['features']
-    
-    # Extract properties and coordinates
-    data = []
-    for feature in features:
-        properties = feature['properties']
-        geometry = feature['geometry']['coordinates']
-        properties['longitude'] = geometry[0]
-        properties['latitude'] = geometry[1]
-        data.append(properties)
-    
-    # Convert to DataFrame and save
-    df = pd.DataFrame(data)
-    band_length = len(df.columns) - 3  # Exclude 'rh', 'longitude' and 'latitude'
-    df_size = len(df)
-    output_path = os.path.join(output_dir, f"training_data_b{band_length}_{df_size}.csv")
+@traced()
+def export_training_data(reference_data: ee.FeatureCollection, output_dir: str, page_size: int = PAGE_SIZE,
+                         workers: int = 4):
+    """Export training data as CSV, fetched in pages (no 5000 feature limit)."""
     os.makedirs(output_dir, exist_ok=True)
-    df.to_csv(output_path, index=False)
+    partial_path = os.path.join(output_dir, 'training_data.partial.csv')
+    result = write_features_csv(reference_data, partial_path, page_size=page_size, workers=workers)
+    if result['rows'] == 0:
+        os.remove(partial_path)
+        raise ValueError("Training data collection is empty; no CSV written")
+    
+    band_length = len(result['columns']) - 3  # Exclude 'rh', 'longitude' and 'latitude'
+    output_path = os.path.join(output_dir, f"training_data_b{band_length}_{result['rows']}.csv")
+    os.replace(partial_path, output_path)
+    register_artifact(output_path, params={'stage': 'export_training_data', 'rows': result['rows']})
     print(f"Training data exported to: {output_path}")
     
     return output_path
 
-def export_featurecollection_to_csv(feature_collection, export_name):
+def add_coordinates(feature_collection):
+    """Add longitude and latitude properties from the point geometries."""
+    return feature_collection.map(lambda feature: 
+        feature.set({
+            'longitude': feature.geometry().coordinates().get(0),
+            'latitude': feature.geometry().coordinates().get(1)
+        })
+    )
+
+@traced()
+def export_featurecollection_to_csv(feature_collection, export_name, property_names: list = None,
+                                    tasks: ExportTaskManager = None):
     """Export a FeatureCollection to CSV via Earth Engine's batch export.
     
     Args:
         feature_collection: The ee.FeatureCollection to export
         export_name: Name for the exported file
+        property_names: Optional pre-resolved property names of the first feature
+            after add_coordinates (fetched with getInfo if not given)
+        tasks: Optional task manager the export is submitted to instead of started
     """
     # Add longitude and latitude columns
-    feature_collection = feature_collection.map(lambda feature: 
-        feature.set({
-            'longitude': feature.geometry().coordinates().get(0),
-            'latitude': feature.geometry().coordinates().get(1)
-        })
-    )
+    feature_collection = add_coordinates(feature_collection)
     
     # Get property names and convert to Python list
-    property_names = feature_collection.first().propertyNames().getInfo()
+    if property_names is None:
+        property_names = ee_cache.get_info(feature_collection.first().propertyNames())
+    property_names = list(property_names)
     
     # Remove system:index from the list if present
     if 'system:index' in property_names:
         property_names.remove('system:index')
         
     # Set up export task
-    export_task = ee.batch.Export.table.toDrive(
-        collection=feature_collection,
-        description=export_name,
-        fileNamePrefix=export_name,
-        folder='GEE_exports',  # Folder in your Google Drive
-        fileFormat='CSV',
-        selectors=property_names  # All property names
-    )
+    def create_task():
+        return ee.batch.Export.table.toDrive(
+            collection=feature_collection,
+            description=export_name,
+            fileNamePrefix=export_name,
+            folder='GEE_exports',  # Folder in your Google Drive
+            fileFormat='CSV',
+            selectors=property_names  # All property names
+        )
+    
+    if tasks is not None:
+        tasks.submit(export_name, create_task, file_name=f'{export_name}.csv', folder='GEE_exports')
+        return export_name
     
     # Start the export
+    export_task = create_task()
     export_task.start()
     
     print(f"Export started with task ID: {export_task.id}")
     print("The CSV file will be available in your Google Drive once the export completes.")
+    return export_name
 
-def export_tif_via_ee(image: ee.Image, aoi: ee.Geometry, prefix: str, scale: int, resample: str = 'bilinear'):  
-    """Export predicted canopy height map as GeoTIFF using Earth Engine export."""
+@traced()
+def export_tif_via_ee(image: ee.Image, aoi: ee.Geometry, prefix: str, scale: int, resample: str = 'bilinear',
+                      info: dict = None, tasks: ExportTaskManager = None, bounds: tuple = None):  
+    """Export predicted canopy height map as GeoTIFF using Earth Engine export.
+    
+    info holds the pre-resolved 'band_count' and 'area_ha' of ee_batch.export_info
+    used in the task name; if not given they are fetched in one getInfo. With a
+    task manager the export is submitted to it instead of started. With the
+    lon/lat bounds of the AOI the export is written on the UTM grid of
+    export_planner, split into tiles (task name suffix _r<row>c<col>) when it
+    exceeds the export limits. Returns the task names.
+    """
     # Rename the classification band for clarity
     # if 'classification' in image.bandNames().getInfo():
     #     image = image.select(['classification'], ['canopy_height'])
-    band_count = image.bandNames().size().getInfo()
-    
-    pixel_area = ee.Image.pixelArea().divide(10000)  # Convert to hectares
-    area_img = ee.Image(1).rename('area').multiply(pixel_area)
+    if info is None:
+        info = ee_cache.get_info(ee.Dictionary(export_info(image, aoi, scale)))
+    band_count = info['band_count']
     
-    # Calculate total area in hectares
-    image_area_ha = area_img.reduceRegion(
-        reducer=ee.Reducer.sum(),
-        geometry=aoi,
-        scale=scale,
-        maxPixels=1e10
-    ).get('area')
-    
-    image_area_ha = int(round(image_area_ha.getInfo(), 0))
+    # Total area in hectares
+    image_area_ha = int(round(info['area_ha'], 0))
     
     # Generate a unique task ID (sanitize prefix and ensure valid characters)
     clean_prefix = ''.join(c for c in prefix if c.isalnum() or c in '_-')
@@ -216,24 +254,66 @@ def export_tif_via_ee(image: ee.Image, aoi: ee.Geometry, prefix: str, scale: int
         'fileFormat': 'GeoTIFF',
         'maxPixels': 1e10
     }
+    exports = {task_id: (export_params, {})}
+    
+    if bounds is not None:
+        # Tiles on one grid (CRS and crsTransform) so they mosaic without resampling
+        plan = plan_export(bounds, scale, band_count)
+        print(f"Export {task_id}: {plan['width']}x{plan['height']} px, ~{plan['bytes'] / 2**20:.0f} MB "
+              f"in {len(plan['tiles'])} tile(s) on {plan['crs']}")
+        exports = {}
+        for tile in plan['tiles']:
+            name = task_id if len(plan['tiles']) == 1 else f"{task_id}_{tile['name']}"
+            params = {**export_params, 'description': name, 'fileNamePrefix': name, 'crs': plan['crs'],
+                      'crsTransform': plan['transform'], 'region': tile_region(plan, tile)}
+            del params['scale']  # given by crsTransform
+            exports[name] = (params, {'crs': plan['crs'], 'transform': plan['transform'], 'tile': tile,
+                                      'mosaic': task_id})
+    
+    for name, (params, grid_info) in exports.items():
+        if tasks is not None:
+            tasks.submit(name, functools.partial(ee.batch.Export.image.toDrive, **params),
+                         file_name=f'{name}.tif', folder='GEE_exports', **grid_info)
+            continue
+        
+        # Start the export task
+        task = ee.batch.Export.image.toDrive(**params)
+        task.start()
+        
+        print(f"Export started with task ID: {name}")
+    if tasks is None:
+        print("The file will be available in your Google Drive once the export completes.")
+    return list(exports)
     
-    # Start the export task
-    task = ee.batch.Export.image.toDrive(**export_params)
-    task.start()
+def main(argv=None, on_export=None, wait: bool = True):
+    """Main function to run the canopy height mapping process.
     
-    print(f"Export started with task ID: {task_id}")
-    print("The file will be available in your Google Drive once the export completes.")
+    With --task-state the exports are tracked until they finish and on_export
+    is called with the task record of each one as it finishes. With
+    wait=False main returns right after submitting; the caller then drives
+    the returned task manager (e.g. export_fetch.fetch_exports), which also
+    starts the exports still queued.
     
-def main():
-    """Main function to run the canopy height mapping process."""
+    Returns:
+        The ExportTaskManager with --task-state, else None
+    """
     # Parse arguments
-    args = parse_args()
+    args = parse_args(argv)
+    if args.trace:
+        tracing.enable(args.trace)
+    if args.ee_cache:
+        ee_cache.enable(args.ee_cache, ttl=args.ee_cache_ttl * 3600)
     
     # Initialize Earth Engine
     initialize_ee()
+    tasks = None
+    if args.task_state:
+        tasks = ExportTaskManager(args.task_state, max_concurrent=args.max_exports, callback=on_export)
     
     # Load AOI
     aoi = load_aoi(args.aoi)
+    # Lon/lat bounds for the export grid (tiled when the exports exceed the limits)
+    aoi_bounds = file_bounds(args.aoi)
     
     # Set dates
     start_date = f"{args.year}-{args.start_date}"
@@ -244,11 +324,12 @@ def main():
     
     # Get S1, S2 satellite data
     print("Collecting satellite data...")
-    s1 = get_sentinel1_data(aoi, args.year, args.start_date, args.end_date)
-    s2 = get_sentinel2_data(aoi, args.year, args.start_date, args.end_date, args.clouds_th)
-    # Import ALOS2 sar data
-    alos2 = get_alos2_data(aoi, args.year, args.start_date, args.end_date,include_texture=False,
-                speckle_filter=False)
+    with span('collect_satellite_data'):
+        s1 = get_sentinel1_data(aoi, args.year, args.start_date, args.end_date)
+        s2 = get_sentinel2_data(aoi, args.year, args.start_date, args.end_date, args.clouds_th)
+        # Import ALOS2 sar data
+        alos2 = get_alos2_data(aoi, args.year, args.start_date, args.end_date,include_texture=False,
+                    speckle_filter=False)
 
     # Get terrain data
     try:
@@ -303,7 +384,6 @@ def main():
 
     # Select only bands ending with '_savg' and rename them with a GLCM prefix
     band_names = glcm.bandNames()
-    band_length = band_names.size().getInfo()
     savg_bands = band_names.filter(ee.Filter.stringEndsWith("item", "_savg"))
 
     # Select and rename bands
@@ -315,16 +395,9 @@ def main():
     # Get predictor names before any masking
     print("Getting band information...")
     predictor_names = merged.bandNames()
-    n_predictors = predictor_names.size().getInfo()
-    var_split_rf = int(np.sqrt(n_predictors).round())
-        
-    # Create and apply forest mask
-    print(f"Creating and applying forest mask (type: {args.mask_type})...")
-    forest_mask = create_forest_mask(args.mask_type, aoi,
-                                   ee.Date(f"{args.year}-{args.start_date}"),
-                                   ee.Date(f"{args.year}-{args.end_date}"),
-                                   args.ndvi_threshold)
-
+    mask_start = ee.Date(f"{args.year}-{args.start_date}")
+    mask_end = ee.Date(f"{args.year}-{args.end_date}")
+    
     ndvi_threshold_percent = int(round(args.ndvi_threshold * 100,0))
     # Export forest mask using export_tif_via_ee
     forest_mask_prefix = f'forestMask{args.mask_type}{ndvi_threshold_percent}'
@@ -353,12 +426,37 @@ def main():
         geometries=True
     )
     
+    # Collect every value needed client-side below and fetch them in one round trip
+    deferred = DeferredValues()
+    deferred.add('glcm_band_count', band_names.size())
+    deferred.add('n_predictors', predictor_names.size())
+    deferred.add('mask_counts', {name: collection.size() for name, collection in
+                                 forest_mask_collections(args.mask_type, aoi, mask_start, mask_end).items()})
+    deferred.add('stack_export', export_info(merged, aoi, args.scale))
+    # The forest mask and the predictions are single band images
+    deferred.add('mask_area_ha', export_info(merged, merged.geometry(), args.scale)['area_ha'])
+    if args.export_training:
+        deferred.add('training_properties', add_coordinates(reference_data).first().propertyNames())
+    if args.export_gedi_points:
+        deferred.add('gedi_properties', add_coordinates(gedi_points).first().propertyNames())
+    with span('getInfo', value='batched'):
+        deferred.resolve()
+    band_length = deferred['glcm_band_count']
+    n_predictors = deferred['n_predictors']
+    var_split_rf = int(np.sqrt(n_predictors).round())
+        
+    # Create and apply forest mask
+    print(f"Creating and applying forest mask (type: {args.mask_type})...")
+    with span('create_forest_mask'):
+        forest_mask = create_forest_mask(args.mask_type, aoi, mask_start, mask_end,
+                                       args.ndvi_threshold, counts=deferred['mask_counts'])
+    
     # Export training data if requested
     if args.export_training:
         print('Exporting training data and tif through Earth Engine...')
         training_prefix = f'training_data_{args.mask_type}{ndvi_threshold_percent}_b{band_length*2}'
         # export_training_data_via_ee(reference_data, training_prefix)
-        export_featurecollection_to_csv(reference_data, training_prefix)
+        export_featurecollection_to_csv(reference_data, training_prefix, deferred['training_properties'], tasks)
         print(f"Exporting training data as CSV: {training_prefix}.csv")
         # try:
         #     size = reference_data.size().getInfo()
@@ -379,7 +477,14 @@ def main():
         
         # Export the complete data stack
         print("Exporting full data stack...")
-        export_tif_via_ee(merged, aoi, 'stack', args.scale, args.resample)
+        export_tif_via_ee(merged, aoi, 'stack', args.scale, args.resample, info=deferred['stack_export'],
+                          tasks=tasks, bounds=aoi_bounds)
+    
+    # Export GEDI footprints for local training data (see local_training.py)
+    if args.export_gedi_points:
+        gedi_prefix = f'gedi_points_{args.quantile}'
+        export_featurecollection_to_csv(gedi_points, gedi_prefix, deferred['gedi_properties'], tasks)
+        print(f"Exporting GEDI footprints as CSV: {gedi_prefix}.csv")
     
     # Train model
     print("Training model...")
@@ -401,14 +506,32 @@ def main():
     if args.export_predictions:
         # prediction_path = os.path.join(args.output_dir, 'predictions.tif')
         print('Exporting via Earth Engine instead')
-        export_tif_via_ee(predictions, aoi, 'predictionCHM', args.scale, args.resample)
+        export_tif_via_ee(predictions, aoi, 'predictionCHM', args.scale, args.resample,
+                          info={'band_count': 1, 'area_ha': deferred['stack_export']['area_ha']}, tasks=tasks,
+                          bounds=aoi_bounds)
     
     
     print(f"Exporting forest mask as {forest_mask_prefix}...")
-    export_tif_via_ee(forest_mask, merged.geometry(), forest_mask_prefix, args.scale, args.resample)
+    export_tif_via_ee(forest_mask, merged.geometry(), forest_mask_prefix, args.scale, args.resample,
+                      info={'band_count': 1, 'area_ha': deferred['mask_area_ha']}, tasks=tasks,
+                      bounds=aoi_bounds)
     # export_tif_via_ee(forest_mask, aoi, forest_mask_prefix, args.scale)
     
+    if tasks is not None and not wait:
+        print(f"Submitted {len(tasks.pending())} exports (state in {args.task_state})")
+    elif tasks is not None:
+        print(f"Waiting for {len(tasks.pending())} exports (state in {args.task_state})...")
+        with span('wait_exports'):
+            records = tasks.run()
+        failed = [name for name, record in records.items() if record['state'] != 'COMPLETED']
+        if failed:
+            raise RuntimeError(f"Exports did not complete: {', '.join(failed)}")
+    
+    if ee_cache.enabled():
+        stats = ee_cache.get_cache().stats()
+        print(f"getInfo cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries")
     print("Processing complete.")
+    return tasks
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
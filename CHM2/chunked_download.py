@@ -0,0 +1,195 @@
+"""Download an Earth Engine image in parallel chunks through getDownloadURL.
+
+A direct download is limited in size, so download_image() splits the
+region into chunks of the export_planner grid that stay under the limit,
+requests a download URL for each chunk (crs_transform and dimensions of the
+chunk, so every chunk is exactly on the grid) and fetches them with a
+bounded thread pool. Failed requests, including server errors of
+getDownloadURL, are retried with exponential backoff.
+Each chunk is verified (complete body, readable GeoTIFF of the expected
+size, bands and grid position) before it is kept, and chunks kept from an
+earlier interrupted run are reused. The chunks are then assembled into one
+COG with mosaic.write_cog.
+
+Usage from Python:
+    download_image(image, bounds, 'chm_outputs/stack.tif', scale=10, band_count=40, workers=8)
+"""
+
+import http.client
+import os
+import random
+import shutil
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import rasterio
+
+import telemetry
+from artifact_catalog import register_artifact
+from export_planner import plan_export
+from mosaic import build_vrt, write_cog
+from tracing import span, traced
+
+# getDownloadURL rejects requests above 48 MB; stay well below
+DOWNLOAD_MAX_BYTES = 32 * 2**20
+DOWNLOAD_MAX_DIMENSION = 10000
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class ChunkError(Exception):
+    """A chunk could not be downloaded or failed verification."""
+
+
+def sample_bytes(band_types: dict) -> int:
+    """Bytes per pixel and band of a download, from ee.Image.bandTypes().
+
+    The GeoTIFF of a download has one data type for all bands: double is 8
+    bytes, float 4, and integer bands get the smallest type holding the value
+    range of all of them (e.g. uint16 and int16 bands together need int32).
+    """
+    float_size, low, high = 0, 0, 0
+    for band_type in band_types.values():
+        precision = band_type.get('precision')
+        if precision in ('double', 'float'):
+            float_size = max(float_size, 8 if precision == 'double' else 4)
+        else:
+            low = min(low, band_type.get('min', -2**63))
+            high = max(high, band_type.get('max', 2**63 - 1))
+    if low < 0:
+        int_size = next((n for n in (1, 2, 4) if -2**(8 * n - 1) <= low and high < 2**(8 * n - 1)), 8)
+    else:
+        int_size = next((n for n in (1, 2, 4) if high < 2**(8 * n)), 8)
+    return max(float_size, int_size)
+
+
+def chunk_params(plan: dict, tile: dict) -> dict:
+    """getDownloadURL parameters of one chunk, on the grid of the plan."""
+    scale, _, left, _, _, top = plan['transform']
+    transform = [scale, 0, left + tile['col_off'] * scale, 0, -scale, top - tile['row_off'] * scale]
+    return {'name': tile['name'], 'format': 'GEO_TIFF', 'crs': plan['crs'], 'crs_transform': transform,
+            'dimensions': f"{tile['width']}x{tile['height']}", 'filePerBand': False}
+
+
+def verify_chunk(path: str, plan: dict, tile: dict):
+    """Raise ChunkError unless path is a GeoTIFF of the chunk's size, bands and position."""
+    try:
+        with rasterio.open(path) as src:
+            shape, count, transform = (src.height, src.width), src.count, src.transform
+            src.read(1, window=((0, 1), (0, 1)))
+    except rasterio.errors.RasterioError as e:
+        raise ChunkError(f"{tile['name']}: unreadable GeoTIFF ({e})")
+    expected = chunk_params(plan, tile)['crs_transform']
+    if shape != (tile['height'], tile['width']) or count != plan['band_count']:
+        raise ChunkError(f"{tile['name']}: got {count} bands of {shape}, "
+                         f"expected {plan['band_count']} of {(tile['height'], tile['width'])}")
+    if abs(transform.c - expected[2]) > 1e-6 * plan['transform'][0] or \
+            abs(transform.f - expected[5]) > 1e-6 * plan['transform'][0]:
+        raise ChunkError(f"{tile['name']}: origin {(transform.c, transform.f)} is off the grid")
+
+
+def fetch(url: str, path: str, timeout: float = 300) -> int:
+    """Download url to path; returns the number of bytes. Raises ChunkError on incomplete bodies."""
+    with urllib.request.urlopen(url, timeout=timeout) as response, open(path, 'wb') as f:
+        expected = response.headers.get('Content-Length')
+        try:
+            shutil.copyfileobj(response, f, 1 << 20)
+        except http.client.IncompleteRead as e:
+            raise ChunkError(f"incomplete download: {e}")
+        size = f.tell()
+    if expected is not None and size != int(expected):
+        raise ChunkError(f"incomplete download: {size} of {expected} bytes")
+    return size
+
+
+def download_chunk(image, plan: dict, tile: dict, chunk_dir: str, retries: int = 4, backoff: float = 2.0,
+                   timeout: float = 300) -> tuple:
+    """Download and verify one chunk, retrying with exponential backoff.
+
+    Returns:
+        (path, bytes downloaded); 0 bytes if a verified chunk was already there
+    """
+    path = os.path.join(chunk_dir, f"{tile['name']}.tif")
+    if os.path.exists(path):
+        try:
+            verify_chunk(path, plan, tile)
+            return path, 0
+        except ChunkError:
+            os.remove(path)
+    part = path + '.part'
+    for attempt in range(retries + 1):
+        try:
+            try:
+                url = image.getDownloadURL(chunk_params(plan, tile))
+            except Exception as e:  # ee.EEException, e.g. quota or 'Too many concurrent aggregations'
+                raise ChunkError(f"getDownloadURL failed: {e}")
+            size = fetch(url, part, timeout)
+            verify_chunk(part, plan, tile)
+            os.replace(part, path)
+            return path, size
+        except urllib.error.HTTPError as e:
+            if e.code not in RETRY_STATUS:
+                raise ChunkError(f"{tile['name']}: HTTP {e.code} {e.reason}")
+            error = f"HTTP {e.code}"
+        except (ChunkError, urllib.error.URLError, OSError) as e:
+            error = str(e)
+        if attempt < retries:
+            delay = backoff * 2 ** attempt * (0.5 + random.random())
+            print(f"Chunk {tile['name']} failed ({error}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+    if os.path.exists(part):
+        os.remove(part)
+    raise ChunkError(f"{tile['name']}: failed after {retries + 1} attempts ({error})")
+
+
+@traced()
+def download_image(image, bounds: tuple, output_path: str, scale: float, band_count: int, crs: str = None,
+                   bytes_per_sample: int = 4, workers: int = 4, retries: int = 4, backoff: float = 2.0,
+                   timeout: float = 300, max_bytes: int = DOWNLOAD_MAX_BYTES, keep_chunks: bool = False) -> str:
+    """Download an image over lon/lat bounds in parallel chunks and assemble one COG.
+
+    Args:
+        image: ee.Image (anything with getDownloadURL)
+        bounds: (minx, miny, maxx, maxy) in EPSG:4326
+        output_path: Output GeoTIFF
+        scale: Pixel size in meters
+        band_count: Number of bands of the image
+        crs: Grid CRS (default: UTM zone of the bounds)
+        bytes_per_sample: Bytes per pixel and band, for the chunk size
+        workers: Concurrent downloads
+        retries: Retries per chunk
+        backoff: First retry delay in seconds, doubled per attempt
+        timeout: Socket timeout per request
+        max_bytes: Size limit of a chunk
+        keep_chunks: Keep the chunk directory after assembling
+
+    Returns:
+        output_path
+    """
+    plan = plan_export(bounds, scale, band_count, bytes_per_sample, crs, DOWNLOAD_MAX_DIMENSION, max_bytes)
+    chunk_dir = output_path + '.chunks'
+    os.makedirs(chunk_dir, exist_ok=True)
+    print(f"Downloading {plan['width']}x{plan['height']} px in {len(plan['tiles'])} chunks with {workers} workers")
+
+    progress = telemetry.task('download_chunks', total=len(plan['tiles']), unit='chunks')
+    paths = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(download_chunk, image, plan, tile, chunk_dir, retries, backoff, timeout):
+                   tile['name'] for tile in plan['tiles']}
+        for future in as_completed(futures):
+            paths[futures[future]], size = future.result()
+            progress.update(units=1, tiles=1, bytes_read=size)
+    progress.finish()
+
+    with span('assemble_chunks'):
+        vrt_path = build_vrt([paths[tile['name']] for tile in plan['tiles']], output_path + '.vrt')
+        try:
+            write_cog(vrt_path, output_path)
+        finally:
+            os.remove(vrt_path)
+    if not keep_chunks:
+        shutil.rmtree(chunk_dir)
+    register_artifact(output_path, params={'stage': 'download', 'scale': scale, 'crs': plan['crs']})
+    print(f"Downloaded to {output_path}")
+    return output_path
@@ -1,19 +1,143 @@
 import os
 import pandas as pd
 import rasterio
-from rasterio.warp import transform, reproject
 import numpy as np
 from utils import get_latest_file
-from sklearn.metrics import mean_squared_error, mean_absolute_error
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
-from scipy import stats
+from artifact_catalog import register_artifact
+from point_sampler import sample_rasters
 import json
 
-def analyze_heights(df: pd.DataFrame, height_columns: list, ref_column: str = 'reference_height'):
+ERROR_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def height_statistics(ref: np.ndarray, heights: np.ndarray, percentiles=ERROR_PERCENTILES) -> dict:
+    """Agreement statistics of several height columns with a reference, all at once.
+    
+    Values are held as float32 and sums accumulated in float64. Each column
+    uses the rows where both it and the reference are not NaN.
+    
+    Args:
+        ref: Reference heights, shape (n,)
+        heights: Height matrix, shape (n, k)
+        percentiles: Error percentiles to compute
+        
+    Returns:
+        Dictionary mapping statistic names to arrays of length k
+    """
+    ref = np.asarray(ref, dtype=np.float32)
+    heights = np.array(heights, dtype=np.float32, ndmin=2)
+    valid = ~np.isnan(heights) & ~np.isnan(ref)[:, None]
+    n = valid.sum(axis=0)
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Shift by overall means so the moment sums below do not cancel
+        ref_shift = np.float32(np.nan_to_num(np.nanmean(ref)) if n.any() else 0)
+        col_shift = np.nan_to_num(np.nansum(heights, axis=0) / (~np.isnan(heights)).sum(axis=0)).astype(np.float32)
+        x = np.where(valid, ref[:, None] - ref_shift, 0)
+        y = np.where(valid, heights - col_shift, 0)
+        errors = np.where(valid, heights - ref[:, None], np.nan)
+        del heights
+        
+        sum_x, sum_y = x.sum(axis=0, dtype=np.float64), y.sum(axis=0, dtype=np.float64)
+        sum_xx = np.einsum('ij,ij->j', x, x, dtype=np.float64)
+        sum_yy = np.einsum('ij,ij->j', y, y, dtype=np.float64)
+        sum_xy = np.einsum('ij,ij->j', x, y, dtype=np.float64)
+        del x, y
+        err = np.where(valid, errors, 0)
+        sum_e = err.sum(axis=0, dtype=np.float64)
+        sum_ee = np.einsum('ij,ij->j', err, err, dtype=np.float64)
+        sum_abs = np.abs(err).sum(axis=0, dtype=np.float64)
+        del err
+        
+        mean_x, mean_y = sum_x / n, sum_y / n
+        var_x = sum_xx / n - mean_x ** 2
+        var_y = sum_yy / n - mean_y ** 2
+        cov = sum_xy / n - mean_x * mean_y
+        correlation = cov / np.sqrt(var_x * var_y)
+        slope = cov / var_x
+        intercept = (mean_y + col_shift) - slope * (mean_x + ref_shift)
+        bias = sum_e / n
+        mse = sum_ee / n
+    
+    result = {
+        'N': n,
+        'Correlation': correlation,
+        'RMSE': np.sqrt(mse),
+        'MAE': sum_abs / n,
+        'Bias': bias,
+        'R-squared': correlation ** 2,
+        'Slope': slope,
+        'Intercept': intercept,
+        'Error_std': np.sqrt(np.maximum(mse - bias ** 2, 0))
+    }
+    
+    # Percentiles with linear interpolation, from one sort with NaN at the end
+    errors.sort(axis=0)
+    for q in percentiles:
+        pos = np.maximum(n - 1, 0) * (q / 100)
+        lower = np.floor(pos).astype(int)
+        upper = np.minimum(lower + 1, np.maximum(n - 1, 0))
+        frac = pos - lower
+        lo = np.take_along_axis(errors, lower[None, :], axis=0)[0].astype(np.float64)
+        hi = np.take_along_axis(errors, upper[None, :], axis=0)[0].astype(np.float64)
+        result[f'Error_p{q}'] = np.where(n > 0, lo + (hi - lo) * frac, np.nan)
+    return result
+
+
+def plot_height_comparison(df: pd.DataFrame, stats_dict: dict, height_columns: list,
+                           ref_column: str = 'reference_height'):
+    """Scatter plots of each analysed height column against the reference."""
+    import matplotlib
+    matplotlib.use('Agg')  # Use non-interactive backend
+    import matplotlib.pyplot as plt
+    
+    n_plots = len(height_columns)
+    n_cols = min(2, n_plots)
+    n_rows = (n_plots + n_cols - 1) // n_cols
+    fig = plt.figure(figsize=(12, 5*n_rows))
+    
+    for idx, col in enumerate(height_columns):
+        if col not in stats_dict:
+            continue
+        col_stats = stats_dict[col]
+        valid_pairs = df[[ref_column, col]].dropna()
+        ref_vals = valid_pairs[ref_column].values.astype(float)
+        col_vals = valid_pairs[col].values.astype(float)
+        ax = fig.add_subplot(n_rows, n_cols, idx + 1)
+        
+        # Create scatter plot
+        ax.scatter(ref_vals, col_vals, alpha=0.5, s=10)
+        
+        # Add identity line
+        min_val = min(np.nanmin(ref_vals), np.nanmin(col_vals))
+        max_val = max(np.nanmax(ref_vals), np.nanmax(col_vals))
+        ax.plot([min_val, max_val], [min_val, max_val], 'r--', label='1:1 line')
+        
+        # Add regression line
+        x_range = np.array([min_val, max_val])
+        ax.plot(x_range, col_stats['Slope'] * x_range + col_stats['Intercept'], 'g-', 
+               label=f"Regression (R²={col_stats['R-squared']:.3f})")
+        
+        ax.set_xlabel(f'Reference Height (m)')
+        ax.set_ylabel(f'{col} (m)')
+        ax.set_title(f"Reference vs {col}\nRMSE={col_stats['RMSE']:.2f}m, Bias={col_stats['Bias']:.2f}m")
+        ax.grid(True)
+        ax.legend()
+    
+    plt.tight_layout()
+    return fig
+
+
+def analyze_heights(df: pd.DataFrame, height_columns: list, ref_column: str = 'reference_height',
+                    plot: bool = True):
     """
     Analyze relationships between reference heights and other height columns.
+    
+    Statistics for all columns are computed at once by height_statistics.
+    With plot=False no figure is created and matplotlib is not imported.
+    
+    Returns:
+        Tuple of (statistics dict, figure or None)
     """
     # Input validation
     if not isinstance(df, pd.DataFrame):
@@ -25,125 +149,61 @@ def analyze_heights(df: pd.DataFrame, height_columns: list, ref_column: str = 'r
         
     # Filter out nodata and -32767 values from reference height
     valid_mask = (df[ref_column] != -32767) & df[ref_column].notna()
-    valid_data = df[valid_mask].copy()
+    valid_data = df[valid_mask]
     
     print(f"\nHeight Analysis (using {len(valid_data)} valid points):")
     print("-" * 50)
     
-    # Create a figure with subplots
-    n_plots = len(height_columns)
-    if n_plots > 0:
-        n_cols = min(2, n_plots)
-        n_rows = (n_plots + n_cols - 1) // n_cols
-        fig = plt.figure(figsize=(12, 5*n_rows))
-        axes = []
-    else:
+    if len(height_columns) == 0:
         print("No height columns to analyze")
         return None, None
     
+    columns = [col for col in height_columns if col in valid_data.columns]
+    ref_vals = valid_data[ref_column].to_numpy(dtype=np.float32, na_value=np.nan)
+    col_vals = valid_data[columns].to_numpy(dtype=np.float32, na_value=np.nan)
+    col_stats = height_statistics(ref_vals, col_vals)
+    
     stats_dict = {}
     error_matrix = {}
+    for i, col in enumerate(columns):
+        n_valid = int(col_stats['N'][i])
+        print(f"\nAnalyzing {col}...")
+        print(f"Found {n_valid} valid pairs for {col}")
+        if n_valid < 2:
+            print(f"Skipping {col} - insufficient valid pairs")
+            continue
+        
+        stats_dict[col] = {name: float(values[i]) for name, values in col_stats.items()}
+        stats_dict[col]['N'] = n_valid
+        error_matrix[col] = {'RMSE': stats_dict[col]['RMSE']}
+        
+        # Print results
+        print(f"Correlation: {stats_dict[col]['Correlation']:.3f}")
+        print(f"RMSE: {stats_dict[col]['RMSE']:.3f} m")
+        print(f"MAE: {stats_dict[col]['MAE']:.3f} m")
+        print(f"Bias: {stats_dict[col]['Bias']:.3f} m")
+        print(f"R-squared: {stats_dict[col]['R-squared']:.3f}")
+        print(f"Linear fit: y = {stats_dict[col]['Slope']:.3f}x + {stats_dict[col]['Intercept']:.3f}")
     
-    # Process each height column
-    for idx, col in enumerate(height_columns):
-        if col in valid_data.columns:
-            print(f"\nAnalyzing {col}...")
-            # Get valid pairs (no NaN in either column)
-            valid_pairs = valid_data[[ref_column, col]].dropna()
-            n_valid = len(valid_pairs)
-            print(f"Found {n_valid} valid pairs for {col}")
-            
-            if n_valid < 2:
-                print(f"Skipping {col} - insufficient valid pairs")
-                continue
-                
-            # Create subplot
-            ax = fig.add_subplot(n_rows, n_cols, idx + 1)
-            axes.append(ax)
-            
-            try:
-                # Convert to numpy arrays and ensure float type
-                ref_vals = valid_pairs[ref_column].values.astype(float)
-                col_vals = valid_pairs[col].values.astype(float)
-                
-                # Calculate statistics
-                rmse = float(np.sqrt(mean_squared_error(ref_vals, col_vals)))
-                mae = float(mean_absolute_error(ref_vals, col_vals))
-                bias = float(np.mean(col_vals - ref_vals))
-                correlation = float(np.corrcoef(ref_vals, col_vals)[0, 1])
-                
-                # Calculate error statistics
-                errors = col_vals - ref_vals
-                error_std = float(np.std(errors))
-                error_percentiles = [float(x) for x in np.percentile(errors, [5, 25, 50, 75, 95])]
-                
-                # Calculate regression
-                slope, intercept, r_value, p_value, std_err = stats.linregress(ref_vals, col_vals)
-                r_squared = r_value ** 2
-                
-                # Store statistics
-                stats_dict[col] = {
-                    'N': n_valid,
-                    'Correlation': correlation,
-                    'RMSE': rmse,
-                    'MAE': mae,
-                    'Bias': bias,
-                    'R-squared': r_squared,
-                    'Slope': float(slope),
-                    'Intercept': float(intercept),
-                    'Error_std': error_std,
-                    'Error_p5': error_percentiles[0],
-                    'Error_p25': error_percentiles[1],
-                    'Error_p50': error_percentiles[2],
-                    'Error_p75': error_percentiles[3],
-                    'Error_p95': error_percentiles[4]
-                }
-                error_matrix[col] = {'RMSE': rmse}
-                
-                # Print results
-                print(f"Correlation: {correlation:.3f}")
-                print(f"RMSE: {rmse:.3f} m")
-                print(f"MAE: {mae:.3f} m")
-                print(f"Bias: {bias:.3f} m")
-                print(f"R-squared: {r_squared:.3f}")
-                print(f"Linear fit: y = {slope:.3f}x + {intercept:.3f}")
-                
-                # Create scatter plot
-                ax.scatter(ref_vals, col_vals, alpha=0.5, s=10)
-                
-                # Add identity line
-                min_val = min(np.nanmin(ref_vals), np.nanmin(col_vals))
-                max_val = max(np.nanmax(ref_vals), np.nanmax(col_vals))
-                ax.plot([min_val, max_val], [min_val, max_val], 'r--', label='1:1 line')
-                
-                # Add regression line
-                x_range = np.array([min_val, max_val])
-                ax.plot(x_range, slope * x_range + intercept, 'g-', 
-                       label=f'Regression (R²={r_squared:.3f})')
-                
-                ax.set_xlabel(f'Reference Height (m)')
-                ax.set_ylabel(f'{col} (m)')
-                ax.set_title(f'Reference vs {col}\nRMSE={rmse:.2f}m, Bias={bias:.2f}m')
-                ax.grid(True)
-                ax.legend()
-                
-            except Exception as e:
-                print(f"Error analyzing {col}: {str(e)}")
-                print(f"Data types - ref: {type(ref_vals)}, col: {type(col_vals)}")
-                print(f"Data ranges - ref: [{np.nanmin(ref_vals)}, {np.nanmax(ref_vals)}], "
-                      f"col: [{np.nanmin(col_vals)}, {np.nanmax(col_vals)}]")
-                continue
-    
+    if not error_matrix:
+        return None, None
     stats_dict['error_matrix'] = error_matrix
     
-    if len(axes) > 0:
-        plt.tight_layout()
-        return stats_dict, fig
-    else:
-        return None, None
+    fig = plot_height_comparison(valid_data, stats_dict, height_columns, ref_column) if plot else None
+    return stats_dict, fig
 
-def combine_heights_with_training(output_dir: str, reference_path: str):
-    """Combine reference heights with training data coordinates."""
+def combine_heights_with_training(output_dir: str, reference_path: str, extra_rasters: dict = None,
+                                  plot: bool = True, training_file: str = None):
+    """Combine reference heights with training data coordinates.
+    
+    Args:
+        output_dir: Directory with the training data CSV
+        reference_path: Reference height raster, sampled into 'reference_height'
+        extra_rasters: Optional mapping of column name to raster path sampled
+            at the same points (e.g. other height products)
+        plot: Save the comparison plot (False skips matplotlib entirely)
+        training_file: Training data CSV (default: latest training_data file in output_dir)
+    """
     # Input validation
     if not os.path.exists(output_dir):
         raise ValueError(f"Output directory does not exist: {output_dir}")
@@ -151,39 +211,36 @@ def combine_heights_with_training(output_dir: str, reference_path: str):
         raise ValueError(f"Reference file does not exist: {reference_path}")
     
     # Get latest training data file
-    training_file = get_latest_file(output_dir, 'training_data')
+    if training_file is None:
+        training_file = get_latest_file(output_dir, 'training_data')
+    elif not os.path.exists(training_file):
+        raise ValueError(f"Training file does not exist: {training_file}")
     print(f"Using training file: {training_file}")
     
     # Read training data
     df = pd.read_csv(training_file)
     
-    # Open reference raster
     with rasterio.open(reference_path) as src:
         print(f"Reference CRS: {src.crs}")
-        
-        # Create lists of coordinates
-        lons = df['longitude'].values
-        lats = df['latitude'].values
-        
-        # Transform coordinates from EPSG:4326 to reference CRS
-        xs, ys = transform('EPSG:4326', src.crs, lons, lats)
-        
-        # Sample the raster at transformed coordinates
-        coords = list(zip(xs, ys))
-        samples = list(src.sample(coords))
-        heights = [sample[0] for sample in samples]
+    
+    # Sample all rasters at the training points in one block-ordered pass each
+    rasters = {'reference_height': reference_path, **(extra_rasters or {})}
+    samples = sample_rasters(rasters, df['longitude'].values, df['latitude'].values, crs='EPSG:4326')
+    for col in samples.columns:
+        if col != 'reference_height':
+            df[col] = samples[col].values
     
     # Create a Series with the heights
-    height_series = pd.Series(heights)
+    height_series = samples['reference_height']
     
-    # Replace -32767 with pd.NA
-    height_series = height_series.replace(-32767, pd.NA)
+    # Replace -32767 with NaN
+    height_series = height_series.replace(-32767, np.nan)
     
     # Add heights to dataframe
     df['reference_height'] = height_series
     
     # Analyze relationships with other height columns
-    height_columns = ['rh', 'ht2021', 'ht2022', 'ht2023']
+    height_columns = ['rh', 'ht2021', 'ht2022', 'ht2023'] + [col for col in samples.columns if col != 'reference_height']
     
     # Check column existence
     available_columns = [col for col in height_columns if col in df.columns]
@@ -192,7 +249,7 @@ def combine_heights_with_training(output_dir: str, reference_path: str):
         print(f"Available columns: {df.columns.tolist()}")
     else:
         print(f"\nAnalyzing height columns: {available_columns}")
-        stats, fig = analyze_heights(df, available_columns)
+        stats, fig = analyze_heights(df, available_columns, plot=plot)
         
         if stats is not None:
             # Save the statistics to a JSON file
@@ -202,10 +259,12 @@ def combine_heights_with_training(output_dir: str, reference_path: str):
             print(f"\nStatistics saved to: {stats_file}")
             
             # Save the analysis plot
-            plot_path = os.path.join(output_dir, 'trainingData_height_comparison.png')
-            fig.savefig(plot_path, dpi=300, bbox_inches='tight')
-            plt.close(fig)
-            print(f"Analysis plot saved to: {plot_path}")
+            if fig is not None:
+                import matplotlib.pyplot as plt
+                plot_path = os.path.join(output_dir, 'trainingData_height_comparison.png')
+                fig.savefig(plot_path, dpi=300, bbox_inches='tight')
+                plt.close(fig)
+                print(f"Analysis plot saved to: {plot_path}")
             
             # Print error matrix
             print("\nError Matrix (RMSE between reference and height columns):")
@@ -217,6 +276,7 @@ def combine_heights_with_training(output_dir: str, reference_path: str):
     # Save combined data with explicit NA handling
     output_file = os.path.join(output_dir, 'trainingData_with_heights.csv')
     df.to_csv(output_file, index=False, na_rep='NA')
+    register_artifact(output_file, params={'stage': 'height_analysis', 'training': training_file})
     
     # Print summary statistics
     valid_heights = df['reference_height'].dropna()
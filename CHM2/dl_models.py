@@ -111,3 +111,57 @@ class MLPRegressionModel(torch.nn.Module):
         
         x = self.head(x)
         return x.squeeze(1)
+
+
+def fold_mlp(model: MLPRegressionModel, scaler_mean=None, scaler_std=None) -> nn.Sequential:
+    """Inference-only copy of an MLPRegressionModel as plain Linear/ReLU layers.
+    
+    Eval-mode batch norms are folded into the preceding linear layers and the
+    input normalization into the first one, so the result takes raw features.
+    Dropout is dropped (it is the identity in eval mode).
+    
+    Args:
+        model: Trained model
+        scaler_mean: Feature means used for normalization (default: model.scaler_mean)
+        scaler_std: Feature standard deviations (default: model.scaler_std)
+        
+    Returns:
+        nn.Sequential mapping (N, n_features) to (N, 1)
+    """
+    scaler_mean = getattr(model, 'scaler_mean', None) if scaler_mean is None else scaler_mean
+    scaler_std = getattr(model, 'scaler_std', None) if scaler_std is None else scaler_std
+    modules = []
+    with torch.no_grad():
+        for i, (layer, bn) in enumerate(zip(model.layers, model.batch_norms)):
+            scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+            weight = layer.weight * scale[:, None]
+            bias = (layer.bias - bn.running_mean) * scale + bn.bias
+            if i == 0 and scaler_mean is not None:
+                # W((x - m) / s) + b = (W / s) x + (b - W (m / s))
+                mean = torch.as_tensor(scaler_mean, dtype=weight.dtype, device=weight.device).reshape(-1)
+                std = torch.as_tensor(scaler_std, dtype=weight.dtype, device=weight.device).reshape(-1)
+                bias = bias - weight @ (mean / std)
+                weight = weight / std[None, :]
+            linear = nn.Linear(weight.shape[1], weight.shape[0])
+            linear.weight.copy_(weight)
+            linear.bias.copy_(bias)
+            modules += [linear, nn.ReLU()]
+        head = nn.Linear(model.head.in_features, 1)
+        head.load_state_dict(model.head.state_dict())
+        modules.append(head)
+    return nn.Sequential(*modules).eval()
+
+
+def linear_to_conv1x1(mlp: nn.Sequential) -> nn.Sequential:
+    """Convert a Linear/ReLU network into 1x1 convolutions applied to (N, C, H, W) tiles."""
+    modules = []
+    with torch.no_grad():
+        for module in mlp:
+            if isinstance(module, nn.Linear):
+                conv = nn.Conv2d(module.in_features, module.out_features, kernel_size=1)
+                conv.weight.copy_(module.weight[:, :, None, None])
+                conv.bias.copy_(module.bias)
+                modules.append(conv)
+            else:
+                modules.append(module)
+    return nn.Sequential(*modules).eval()
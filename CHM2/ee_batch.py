@@ -0,0 +1,80 @@
+"""Deferred evaluation of Earth Engine values in a single round trip.
+
+Each getInfo() call is a blocking request to the Earth Engine servers.
+DeferredValues collects computed objects under keys and resolves all of them
+with one getInfo() on an ee.Dictionary. Values can be nested dictionaries,
+e.g. the export metadata of several images.
+
+    values = DeferredValues()
+    values.add('n_bands', image.bandNames().size())
+    values.add('stack', export_info(image, aoi, scale))
+    values['n_bands']  # first access resolves everything at once
+
+If any value fails on the server the whole request fails, so only values
+that are expected to compute should be batched. While the ee_cache is
+enabled, values found in it are not requested at all.
+"""
+
+import ee
+
+import ee_cache
+
+
+class DeferredValues:
+    """Collect ee values under keys and resolve them with a single getInfo."""
+
+    def __init__(self):
+        self._pending = {}
+        self._resolved = {}
+
+    def add(self, key: str, value) -> str:
+        """Register an ee object (or dict of ee objects) to be resolved; returns the key."""
+        if isinstance(value, dict):
+            value = ee.Dictionary(value)
+        self._pending[key] = value
+        self._resolved.pop(key, None)
+        return key
+
+    def resolve(self) -> dict:
+        """Resolve all pending values in one request; returns all resolved values."""
+        cache = ee_cache.get_cache()
+        if cache is not None:
+            for key, value in list(self._pending.items()):
+                found, cached = cache.lookup(value)
+                if found:
+                    self._resolved[key] = cached
+                    del self._pending[key]
+        if self._pending:
+            values = ee.Dictionary(self._pending).getInfo()
+            if cache is not None:
+                for key, value in values.items():
+                    cache.store(self._pending[key], value)
+            self._resolved.update(values)
+            self._pending = {}
+        return dict(self._resolved)
+
+    def get(self, key: str, default=None):
+        if key in self._pending:
+            self.resolve()
+        return self._resolved.get(key, default)
+
+    def __getitem__(self, key: str):
+        if key in self._pending:
+            self.resolve()
+        return self._resolved[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._pending or key in self._resolved
+
+
+def export_info(image, region, scale: int) -> dict:
+    """Deferred band count and area (ha) of an image export over a region, as used in export names."""
+    pixel_area = ee.Image.pixelArea().divide(10000)  # Convert to hectares
+    area_img = ee.Image(1).rename('area').multiply(pixel_area)
+    area_ha = area_img.reduceRegion(
+        reducer=ee.Reducer.sum(),
+        geometry=region,
+        scale=scale,
+        maxPixels=1e10
+    ).get('area')
+    return {'band_count': image.bandNames().size(), 'area_ha': area_ha}
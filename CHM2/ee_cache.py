@@ -0,0 +1,187 @@
+"""Persistent cache of Earth Engine getInfo results.
+
+Re-running chm_main for the same AOI and dates asks the servers for the
+same collection sizes, band counts and areas. GetInfoCache stores getInfo
+results in SQLite keyed by a hash of the serialized expression graph
+(ComputedObject.serialize()), so identical expressions are only computed
+once. Entries expire after a TTL and the least recently used ones are
+evicted when the cache grows beyond max_bytes.
+
+The cache is off unless enabled with enable() or the CHM_EE_CACHE
+environment variable (path of the database, TTL in seconds from
+CHM_EE_CACHE_TTL). Only cache values that depend on the expression alone:
+results that change as new images are ingested (e.g. collection sizes for
+open-ended date ranges) are served stale until their TTL expires.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_BYTES = 64 * 2**20
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+"""
+
+_MISS = object()
+_cache = None
+
+
+def expression_key(obj) -> str:
+    """Hash of the serialized expression graph of an ee object, or None if it has none."""
+    serialize = getattr(obj, 'serialize', None)
+    if serialize is None:
+        return None
+    return hashlib.blake2b(serialize().encode(), digest_size=20).hexdigest()
+
+
+class GetInfoCache:
+    """getInfo results on disk with a TTL and size-bounded LRU eviction.
+
+    One connection is shared by all threads (the pipeline runs chm_main in
+    worker threads), serialised by a lock.
+
+    Args:
+        path: SQLite database file
+        ttl: Seconds an entry stays valid
+        max_bytes: Upper bound of the total size of the stored values
+    """
+
+    def __init__(self, path: str, ttl: float = DEFAULT_TTL, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = self.misses = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, key: str, default=None):
+        """Cached value for key, or default if missing or expired."""
+        value = self._get(key)
+        return default if value is _MISS else value
+
+    def _get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute('SELECT value, created FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self.conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                    self.conn.commit()
+                self.misses += 1
+                return _MISS
+            self.conn.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+            self.conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, value):
+        """Store a JSON-serializable value, then evict down to max_bytes."""
+        text = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            self.conn.execute('INSERT OR REPLACE INTO entries (key, value, size, created, accessed) '
+                              'VALUES (?, ?, ?, ?, ?)', (key, text, len(text), now, now))
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries and the least recently used ones beyond max_bytes; returns the count."""
+        with self._lock:
+            removed = self.conn.execute('DELETE FROM entries WHERE created < ?',
+                                        (time.time() - self.ttl,)).rowcount
+            total, stale = 0, []
+            for key, size in self.conn.execute('SELECT key, size FROM entries ORDER BY accessed DESC'):
+                total += size
+                if total > self.max_bytes:
+                    stale.append((key,))
+            self.conn.executemany('DELETE FROM entries WHERE key = ?', stale)
+            self.conn.commit()
+        return removed + len(stale)
+
+    def lookup(self, obj):
+        """(True, value) if the result of an ee object is cached, else (False, None)."""
+        key = expression_key(obj)
+        value = _MISS if key is None else self._get(key)
+        return (False, None) if value is _MISS else (True, value)
+
+    def store(self, obj, value):
+        key = expression_key(obj)
+        if key is not None:
+            self.put(key, value)
+
+    def get_info(self, obj):
+        """obj.getInfo(), served from the cache when possible."""
+        found, value = self.lookup(obj)
+        if not found:
+            value = obj.getInfo()
+            self.store(obj, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute('DELETE FROM entries')
+            self.conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        return {'entries': entries, 'bytes': size, 'hits': self.hits, 'misses': self.misses}
+
+
+def enable(path: str, ttl: float = DEFAULT_TTL, max_bytes: int = DEFAULT_MAX_BYTES) -> GetInfoCache:
+    """Cache getInfo results in path; returns the active cache."""
+    global _cache
+    if _cache is None:
+        _cache = GetInfoCache(path, ttl, max_bytes)
+    return _cache
+
+
+def disable():
+    global _cache
+    cache, _cache = _cache, None
+    if cache is not None:
+        cache.close()
+
+
+def enabled() -> bool:
+    return _cache is not None
+
+
+def get_cache():
+    return _cache
+
+
+def get_info(obj):
+    """obj.getInfo() through the active cache, or directly while caching is off."""
+    if _cache is None:
+        return obj.getInfo()
+    return _cache.get_info(obj)
+
+
+if os.environ.get('CHM_EE_CACHE'):
+    enable(os.environ['CHM_EE_CACHE'], float(os.environ.get('CHM_EE_CACHE_TTL', DEFAULT_TTL)))
@@ -1,30 +1,41 @@
 """Module for evaluating canopy height predictions."""
 
 import os
+import json
 import numpy as np
 import argparse
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 import rasterio
 from datetime import datetime
-from rasterio.crs import CRS
-from rasterio.warp import transform_bounds
 
-from save_evaluation_pdf import save_evaluation_to_pdf
-from raster_utils import load_and_align_rasters
-from evaluation_utils import validate_data, create_plots
+from save_evaluation_pdf import save_evaluation_to_pdf, save_matrix_report_pdf, comparison_grid_job
+from raster_utils import load_and_align_rasters, pixel_size_m, quick_validity_check
+from evaluation_utils import validate_data, plot_jobs
+from report_assets import render_assets
+from sampled_evaluation import evaluate_sampled, compare_with_full
+from bootstrap_metrics import spatial_block_sums, bootstrap_metrics, confidence_intervals
+from block_evaluation import (
+    evaluate_matrix, evaluate_stratified, write_tile_metrics_raster, DEFAULT_HEIGHT_BINS
+)
+import tracing
+import telemetry
+from tracing import span, traced
 
 
+@traced()
 def check_predictions(pred_path: str):
     """Check if predictions are valid before proceeding."""
-    with rasterio.open(pred_path) as src:
-        data = src.read(1)
-        if np.all(data == src.nodata):
-            print(f"\nError: The prediction file {os.path.basename(pred_path)} contains only nodata values.")
-            print("Please ensure the prediction generation completed successfully.")
-            return False
-        return True
+    check = quick_validity_check(pred_path)
+    if not check['valid']:
+        print(f"\nError: The prediction file {os.path.basename(pred_path)} contains only nodata values.")
+        print("Please ensure the prediction generation completed successfully.")
+        return False
+    print(f"Prediction check ({check['source']}, {check['reads']} read(s)): "
+          f"min {check['min']:.2f}, max {check['max']:.2f}, nodata {check['nodata_fraction']*100:.1f}%")
+    return True
 
 
+@traced()
 def calculate_metrics(pred: np.ndarray, ref: np.ndarray)->dict:
     """Calculate evaluation metrics."""
     mse = mean_squared_error(ref, pred)
@@ -57,7 +68,79 @@ def calculate_metrics(pred: np.ndarray, ref: np.ndarray)->dict:
     }
 
 
-def main():
+def save_metrics_json(metrics: dict, output_dir: str, metric_cis: dict = None,
+                      bootstrap_info: dict = None) -> str:
+    """Save evaluation metrics and optional confidence intervals to JSON."""
+    output_data = {'metrics': {key: float(value) for key, value in metrics.items()}}
+    if metric_cis:
+        output_data['confidence_intervals'] = metric_cis
+    if bootstrap_info:
+        output_data['bootstrap'] = bootstrap_info
+    
+    output_path = os.path.join(output_dir, 'evaluation_metrics.json')
+    with open(output_path, 'w') as f:
+        json.dump(output_data, f, indent=4)
+    return output_path
+
+
+def run_matrix_evaluation(pred_paths: list, ref_paths: list, forest_mask_path: str, output_dir: str,
+                          generate_pdf: bool = False, block_size: int = 1024) -> int:
+    """Evaluate all prediction/reference pairs in one pass and write a comparison table."""
+    for pred_path in pred_paths:
+        if not check_predictions(pred_path):
+            return 1
+    
+    print(f"Evaluating {len(pred_paths)} prediction(s) against {len(ref_paths)} reference(s)...")
+    table = evaluate_matrix(pred_paths, ref_paths, forest_mask_path, block_size=block_size)
+    
+    table_path = os.path.join(output_dir, 'evaluation_matrix.csv')
+    table.to_csv(table_path, index=False)
+    print(f"Comparison table saved to: {table_path}")
+    
+    if generate_pdf:
+        pdf_path = save_matrix_report_pdf(table, output_dir)
+        print(f"PDF report saved to: {pdf_path}")
+    
+    print("\nEvaluation Matrix (for heights between 0-35m):")
+    print(table[['prediction', 'reference', 'N', 'RMSE', 'MAE', 'R2', 'Mean Error']].round(3).to_string(index=False))
+    return 0
+
+
+def run_sampled_evaluation(pred_path: str, ref_path: str, forest_mask_path: str, output_dir: str,
+                           n_samples: int, seed: int = 42, compare_path: str = None) -> int:
+    """Estimate metrics from a stratified pixel sample and compare with a full run if available."""
+    print(f"Estimating metrics from a stratified sample of {n_samples:,} pixels...")
+    try:
+        sampled = evaluate_sampled(pred_path, ref_path, forest_mask_path, n_samples=n_samples, seed=seed)
+    except ValueError as e:
+        print(f"\nValidation Error: {str(e)}")
+        return 1
+    
+    output_path = os.path.join(output_dir, 'sampled_metrics.json')
+    with open(output_path, 'w') as f:
+        json.dump(sampled, f, indent=4)
+    
+    print(f"\nSampled Evaluation ({sampled['sample']['valid']:,} valid of {sampled['sample']['drawn']:,} sampled pixels):")
+    print("-" * 50)
+    for metric, value in sampled['metrics'].items():
+        se = sampled['standard_errors'][metric]
+        print(f"{metric:<20}: {value:>7.3f} ± {se:.3f}")
+    print("-" * 50)
+    
+    # Look for a full-run result next to the sampled output when no path is given
+    if compare_path is None:
+        compare_path = os.path.join(output_dir, 'evaluation_metrics.json')
+    if os.path.exists(compare_path):
+        comparison = compare_with_full(sampled, compare_path)
+        comparison.to_csv(os.path.join(output_dir, 'sampled_vs_full.csv'), index=False)
+        print(f"\nComparison with full run ({compare_path}):")
+        print(comparison.round(4).to_string(index=False))
+    
+    print(f"\nSampled metrics saved to: {output_path}")
+    return 0
+
+
+def main(argv=None):
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Evaluate canopy height predictions against reference data')
     parser.add_argument('--pred', type=str, help='Path to prediction raster', default='chm_outputs/predictions.tif')
@@ -68,7 +151,27 @@ def main():
     parser.add_argument('--model-eval', type=str, help='Path to model evaluation JSON file', default=None)
     parser.add_argument('--training', type=str, help='Path to training data CSV for additional metadata', default='chm_outputs/training_data.csv')
     parser.add_argument('--merged', type=str, help='Path to merged data raster for RGB visualization', default=None)
-    args = parser.parse_args()
+    parser.add_argument('--preds', type=str, nargs='+', help='Several prediction rasters for matrix evaluation', default=None)
+    parser.add_argument('--refs', type=str, nargs='+', help='Several reference rasters for matrix evaluation', default=None)
+    parser.add_argument('--block-size', type=int, help='Block size in pixels for block-wise evaluation', default=1024)
+    parser.add_argument('--strata', action='store_true', help='Calculate metrics by height class, mask class and spatial tile')
+    parser.add_argument('--height-bins', type=str, help='Comma-separated reference height class edges in meters',
+                        default=','.join(str(b) for b in DEFAULT_HEIGHT_BINS))
+    parser.add_argument('--tile-size', type=float, help='Tile size in meters for the per-tile metric raster', default=1000)
+    parser.add_argument('--bootstrap', type=int, help='Number of block bootstrap replicates for confidence intervals (0 disables)', default=0)
+    parser.add_argument('--bootstrap-block-size', type=int, help='Spatial block size in pixels for the bootstrap', default=100)
+    parser.add_argument('--sample', type=int, help='Estimate metrics from a stratified sample of this many pixels (0 disables)', default=0)
+    parser.add_argument('--sample-seed', type=int, help='Random seed for the pixel sample', default=42)
+    parser.add_argument('--compare-metrics', type=str, help='Full-run evaluation_metrics.json to compare sampled estimates with', default=None)
+    parser.add_argument('--bootstrap-workers', type=int, help='Worker processes for the bootstrap (default: all CPUs)', default=None)
+    parser.add_argument('--report-workers', type=int, help='Worker processes for rendering report figures (default: one per figure)', default=None)
+    parser.add_argument('--trace', type=str, help='Write a Chrome trace of stage timings and memory to this JSON file', default=None)
+    parser.add_argument('--telemetry', type=str, help='Periodically write progress metrics to this file (.json, or .prom for Prometheus)', default=None)
+    args = parser.parse_args(argv)
+    if args.trace:
+        tracing.enable(args.trace)
+    if args.telemetry:
+        telemetry.enable(args.telemetry)
     
     # Set paths
     pred_path = args.pred
@@ -85,6 +188,16 @@ def main():
     output_dir = os.path.join(output_dir, date)
     os.makedirs(output_dir, exist_ok=True)
     
+    # Matrix mode: every prediction against every reference in one pass
+    if args.preds or args.refs:
+        return run_matrix_evaluation(args.preds or [pred_path], args.refs or [ref_path],
+                                     args.forest_mask, output_dir, generate_pdf, args.block_size)
+    
+    # Sampled mode: approximate metrics without aligning full rasters
+    if args.sample > 0:
+        return run_sampled_evaluation(pred_path, ref_path, args.forest_mask, output_dir,
+                                      args.sample, args.sample_seed, args.compare_metrics)
+    
     # First check if predictions are valid
     if not check_predictions(pred_path):
         return 1
@@ -111,27 +224,8 @@ def main():
         print(f"Valid pixels: {valid_pixels:,} of {total_pixels:,} ({valid_pixels/total_pixels*100:.1f}%)")
         # Calculate area using geographic coordinates
         with rasterio.open(pred_path) as src:
-            # Get the CRS of the prediction
-            if src.crs.is_geographic:
-                # For geographic coordinates, calculate approximate area using UTM
-                center_lat = (src.bounds.bottom + src.bounds.top) / 2
-                center_lon = (src.bounds.left + src.bounds.right) / 2
-                utm_zone = int((center_lon + 180) / 6) + 1
-                utm_epsg = 32600 + utm_zone + (0 if center_lat >= 0 else 100)
-                utm_crs = CRS.from_epsg(utm_epsg)
-                
-                # Transform bounds to UTM
-                bounds_utm = transform_bounds(src.crs, utm_crs, *src.bounds)
-                width_m = bounds_utm[2] - bounds_utm[0]
-                height_m = bounds_utm[3] - bounds_utm[1]
-                
-                # Calculate pixel size in meters
-                pixel_width_m = width_m / src.width
-                pixel_height_m = height_m / src.height
-                pixel_area_m2 = pixel_width_m * pixel_height_m
-            else:
-                # For projected coordinates, use transform directly
-                pixel_area_m2 = abs(transform[0] * transform[4])
+            pixel_width_m, pixel_height_m = pixel_size_m(src)
+            pixel_area_m2 = pixel_width_m * pixel_height_m
         
         area_ha = (np.sum(mask) * pixel_area_m2) / 10000  # Convert to hectares
         print(f"Area of valid pixels: {area_ha:.2f} ha")
@@ -175,10 +269,51 @@ def main():
         # metrics = calculate_metrics(pred_masked, ref_masked)
         metrics = calculate_metrics(pred_masked_2, ref_masked_2)
         
+        metric_cis = None
+        if args.bootstrap > 0:
+            print(f"Bootstrapping confidence intervals ({args.bootstrap} replicates)...")
+            with span('bootstrap', replicates=args.bootstrap):
+                block_sums = spatial_block_sums(pred_data, ref_data, mask, args.bootstrap_block_size)
+                replicates = bootstrap_metrics(block_sums, n_replicates=args.bootstrap,
+                                               n_workers=args.bootstrap_workers)
+            metric_cis = confidence_intervals(replicates)
+            print(f"Resampled {len(block_sums):,} blocks of {args.bootstrap_block_size}x{args.bootstrap_block_size} pixels")
+        
+        metrics_path = save_metrics_json(metrics, output_dir, metric_cis=metric_cis,
+                                         bootstrap_info={'replicates': args.bootstrap,
+                                                         'block_size': args.bootstrap_block_size}
+                                         if metric_cis else None)
+        print(f"Metrics saved to: {metrics_path}")
+        
+        if args.strata:
+            print("\nCalculating stratified metrics...")
+            height_bins = [float(b) for b in args.height_bins.split(',')]
+            with span('evaluate_stratified'):
+                strata, tile_metrics, tile_transform, tile_crs = evaluate_stratified(
+                    pred_path, ref_path, args.forest_mask, height_bins=height_bins,
+                    tile_size_m=args.tile_size, block_size=args.block_size)
+            strata_path = os.path.join(output_dir, 'stratified_metrics.csv')
+            strata.to_csv(strata_path, index=False)
+            tile_path = write_tile_metrics_raster(
+                os.path.join(output_dir, f'tile_metrics_{int(args.tile_size)}m.tif'),
+                tile_metrics, tile_transform, tile_crs)
+            print(strata[['stratum_type', 'stratum', 'N', 'RMSE', 'MAE', 'Mean Error']].round(3).to_string(index=False))
+            print(f"Stratified metrics saved to: {strata_path}")
+            print(f"Per-tile metric raster saved to: {tile_path}")
+        
         print("Generating visualizations...")
-        # Always generate plots for masked data
-        # plot_paths = create_plots(pred_masked, ref_masked, metrics, output_dir)
-        plot_paths = create_plots(pred_masked_2, ref_masked_2, metrics, output_dir)
+        # Always generate plots for masked data; the comparison grid is rendered
+        # alongside them when a PDF is requested
+        jobs = plot_jobs(pred_masked_2, ref_masked_2, metrics)
+        if generate_pdf:
+            rgb_temp_dir = os.path.join(output_dir, 'rgb_temp')
+            os.makedirs(rgb_temp_dir, exist_ok=True)
+            jobs.append(comparison_grid_job(ref_data, pred_data, merged_data_path, transform,
+                                            mask=mask, temp_dir=rgb_temp_dir))
+        with span('render_assets', n_assets=len(jobs)):
+            assets = render_assets(jobs, output_dir, cache_dir=os.path.join(args.output, '.asset_cache'),
+                                   n_workers=args.report_workers)
+        plot_paths = {name: path for name, path in assets.items() if name != 'comparison_grid'}
         
         if generate_pdf:
             # Create PDF report with all visualizations
@@ -205,7 +340,9 @@ def main():
                 merged_data_path=merged_data_path,
                 area_ha=area_ha,
                 validation_info=validation_info,
-                plot_paths=plot_paths
+                plot_paths=plot_paths,
+                metric_cis=metric_cis,
+                grid_path=assets['comparison_grid']
             )
             print(f"PDF report saved to: {pdf_path}")
         
@@ -213,10 +350,12 @@ def main():
         print("\nEvaluation Results (for heights between 0-35m, excluding -32767 and no data):")
         print("-" * 50)
         for metric, value in metrics.items():
+            ci = (metric_cis or {}).get(metric)
+            ci_text = f"  [{ci['lower']:.3f}, {ci['upper']:.3f}]" if ci else ""
             if metric.endswith('(%)'):
                 print(f"{metric:<20}: {value:>7.1f}%")
             else:
-                print(f"{metric:<20}: {value:>7.3f}")
+                print(f"{metric:<20}: {value:>7.3f}{ci_text}")
         print("-" * 50)
         
         print("\nOutputs saved to:", output_dir)
@@ -5,6 +5,8 @@ import numpy as np
 import matplotlib.pyplot as plt
 from scipy.stats import norm
 
+from report_assets import AssetJob, render_assets
+
 
 def validate_data(pred_data: np.ndarray, ref_data: np.ndarray):
     """Validate data before analysis and return validation info."""
@@ -36,11 +38,8 @@ def validate_data(pred_data: np.ndarray, ref_data: np.ndarray):
     return validation_info
 
 
-def create_plots(pred: np.ndarray, ref: np.ndarray, metrics: dict, output_dir: str):
-    """Create evaluation plots and return plot paths."""
-    plot_paths = {}
-    
-    # Scatter plot
+def plot_scatter(pred: np.ndarray, ref: np.ndarray, output_path: str, r2: float, rmse: float):
+    """Scatter plot of predicted against reference heights."""
     plt.figure(figsize=(10, 10))
     plt.scatter(ref, pred, alpha=0.5, s=1)
     plt.plot([0, max(ref.max(), pred.max())], [0, max(ref.max(), pred.max())], 'r--', label='1:1 line')
@@ -53,14 +52,15 @@ def create_plots(pred: np.ndarray, ref: np.ndarray, metrics: dict, output_dir: s
     plt.xlabel('Reference Height (m)')
     plt.ylabel('Predicted Height (m)')
     plt.title('Predicted vs Reference Height\n' + \
-             f'R² = {metrics["R2"]:.3f}, RMSE = {metrics["RMSE"]:.3f}m')
+             f'R² = {r2:.3f}, RMSE = {rmse:.3f}m')
     plt.legend()
     plt.grid(True)
-    plot_paths['scatter'] = os.path.join(output_dir, 'scatter_plot.png')
-    plt.savefig(plot_paths['scatter'], dpi=300, bbox_inches='tight')
+    plt.savefig(output_path, dpi=300, bbox_inches='tight')
     plt.close()
-    
-    # Error histogram
+
+
+def plot_error_hist(pred: np.ndarray, ref: np.ndarray, output_path: str):
+    """Histogram of prediction errors with a fitted normal curve."""
     errors = pred - ref
     plt.figure(figsize=(10, 6))
     plt.hist(errors, bins=50, alpha=0.75, density=True)
@@ -78,11 +78,12 @@ def create_plots(pred: np.ndarray, ref: np.ndarray, metrics: dict, output_dir: s
              f'Mean = {errors.mean():.3f}m, Std = {errors.std():.3f}m')
     plt.legend()
     plt.grid(True)
-    plot_paths['error_hist'] = os.path.join(output_dir, 'error_hist.png')
-    plt.savefig(plot_paths['error_hist'], dpi=300, bbox_inches='tight')
+    plt.savefig(output_path, dpi=300, bbox_inches='tight')
     plt.close()
-    
-    # Height distributions
+
+
+def plot_height_distributions(pred: np.ndarray, ref: np.ndarray, output_path: str):
+    """Overlaid histograms of reference and predicted heights."""
     plt.figure(figsize=(10, 6))
     plt.hist(ref, bins=50, alpha=0.5, label='Reference', density=True)
     plt.hist(pred, bins=50, alpha=0.5, label='Predicted', density=True)
@@ -91,15 +92,33 @@ def create_plots(pred: np.ndarray, ref: np.ndarray, metrics: dict, output_dir: s
     plt.title('Height Distributions')
     plt.legend()
     plt.grid(True)
-    plot_paths['height_dist'] = os.path.join(output_dir, 'height_distributions.png')
-    plt.savefig(plot_paths['height_dist'], dpi=300, bbox_inches='tight')
+    plt.savefig(output_path, dpi=300, bbox_inches='tight')
     plt.close()
-    
-    return plot_paths
 
 
-def create_comparison_grid(ref_data, pred_data, diff_data, rgb_data, output_path, forest_mask=None):
-    """Create 2x2 grid visualization and save to file."""
+def plot_jobs(pred: np.ndarray, ref: np.ndarray, metrics: dict) -> list:
+    """Asset jobs for the evaluation plots."""
+    arrays = {'pred': pred, 'ref': ref}
+    return [
+        AssetJob('scatter', 'scatter_plot.png', plot_scatter, arrays,
+                 {'r2': float(metrics['R2']), 'rmse': float(metrics['RMSE'])}),
+        AssetJob('error_hist', 'error_hist.png', plot_error_hist, arrays, {}),
+        AssetJob('height_dist', 'height_distributions.png', plot_height_distributions, arrays, {}),
+    ]
+
+
+def create_plots(pred: np.ndarray, ref: np.ndarray, metrics: dict, output_dir: str,
+                 cache_dir: str = None, n_workers: int = None):
+    """Create evaluation plots concurrently and return plot paths."""
+    return render_assets(plot_jobs(pred, ref, metrics), output_dir, cache_dir=cache_dir, n_workers=n_workers)
+
+
+def create_comparison_grid(ref_data, pred_data, diff_data, rgb_data, output_path, forest_mask=None, dpi=150):
+    """Create 2x2 grid visualization and save to file.
+    
+    Arrays are expected at display resolution. A .jpg output path writes a
+    compressed JPEG instead of a PNG.
+    """
     fig, axes = plt.subplots(2, 2, figsize=(10, 10))
     vmax = 35
     # Create masked versions for visualization
@@ -113,17 +132,17 @@ def create_comparison_grid(ref_data, pred_data, diff_data, rgb_data, output_path
         diff_masked = diff_data
     
     # Plot reference data
-    im0 = axes[0,0].imshow(ref_masked, cmap='viridis', vmin=0, vmax=vmax, aspect='equal')
+    im0 = axes[0,0].imshow(ref_masked, cmap='viridis', vmin=0, vmax=vmax, aspect='equal', interpolation='nearest')
     axes[0,0].set_title('Reference Heights')
     plt.colorbar(im0, ax=axes[0,0], fraction=0.046, pad=0.04)
     
     # Plot prediction data
-    im1 = axes[0,1].imshow(pred_masked, cmap='viridis', vmin=0, vmax=vmax, aspect='equal')
+    im1 = axes[0,1].imshow(pred_masked, cmap='viridis', vmin=0, vmax=vmax, aspect='equal', interpolation='nearest')
     axes[0,1].set_title('Predicted Heights')
     plt.colorbar(im1, ax=axes[0,1], fraction=0.046, pad=0.04)
     
     # Plot difference map
-    im2 = axes[1,0].imshow(diff_masked, cmap='RdYlBu', vmin=-10, vmax=10, aspect='equal')
+    im2 = axes[1,0].imshow(diff_masked, cmap='RdYlBu', vmin=-10, vmax=10, aspect='equal', interpolation='nearest')
     axes[1,0].set_title('Height Difference (Pred - Ref)')
     plt.colorbar(im2, ax=axes[1,0], fraction=0.046, pad=0.04)
     
@@ -151,5 +170,8 @@ def create_comparison_grid(ref_data, pred_data, diff_data, rgb_data, output_path
         ax.set_yticks([])
     
     plt.tight_layout()
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    if output_path.lower().endswith(('.jpg', '.jpeg')):
+        plt.savefig(output_path, dpi=dpi, bbox_inches='tight', pil_kwargs={'quality': 85, 'optimize': True})
+    else:
+        plt.savefig(output_path, dpi=dpi, bbox_inches='tight')
     plt.close()
\ No newline at end of file
@@ -0,0 +1,148 @@
+"""Copy the files of completed Earth Engine exports from Drive into a local directory.
+
+Exports land in a Drive folder (GEE_exports); the local stages read from the
+output directory. fetch_exports() waits for a set of export tasks of an
+ExportTaskManager and fetches the files of each one as soon as it completes,
+so the stages depending on it can start while other exports still run.
+Large exports that Earth Engine split into <name>-<row>-<col>.tif pieces are
+fetched piece by piece (see mosaic.py to merge them). Fetched files are
+registered in the artifact catalog of the directory.
+
+    tasks = chm_main.main(argv, wait=False)
+    names = [name for name in tasks.records if name.startswith('stack')]
+    fetch_exports(tasks, names, ExportFetcher('chm_outputs'))
+
+The Drive backend (list a folder, download a file) is DriveFiles by default,
+using Application Default Credentials with the Drive read-only scope; tests
+pass a fake one.
+"""
+
+import os
+import re
+import time
+
+from artifact_catalog import register_artifact
+from export_tasks import FINISHED_STATES, ExportTaskManager
+
+DRIVE_SCOPE = 'https://www.googleapis.com/auth/drive.readonly'
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+
+class DriveFiles:
+    """Drive backend using the Drive API v3."""
+
+    def __init__(self, service=None):
+        self._service = service
+
+    @property
+    def service(self):
+        if self._service is None:
+            import google.auth
+            from googleapiclient.discovery import build
+            credentials, _ = google.auth.default(scopes=[DRIVE_SCOPE])
+            self._service = build('drive', 'v3', credentials=credentials, cache_discovery=False)
+        return self._service
+
+    def list(self, folder: str, prefix: str) -> list:
+        """Files (dicts with 'id', 'name', 'size') in the folders named folder whose names contain prefix."""
+        folders = self.service.files().list(
+            q=f"name = '{folder}' and mimeType = '{FOLDER_MIME_TYPE}' and trashed = false",
+            fields='files(id)').execute()['files']
+        files = []
+        for parent in folders:
+            page_token = None
+            while True:
+                response = self.service.files().list(
+                    q=f"'{parent['id']}' in parents and name contains '{prefix}' and trashed = false",
+                    fields='nextPageToken, files(id, name, size)', pageToken=page_token).execute()
+                files += response['files']
+                page_token = response.get('nextPageToken')
+                if not page_token:
+                    break
+        return files
+
+    def download(self, file_id: str, path: str, chunk_size: int = 64 * 2**20):
+        """Download a file in chunks to path."""
+        from googleapiclient.http import MediaIoBaseDownload
+        request = self.service.files().get_media(fileId=file_id)
+        with open(path, 'wb') as f:
+            downloader = MediaIoBaseDownload(f, request, chunksize=chunk_size)
+            done = False
+            while not done:
+                _, done = downloader.next_chunk(num_retries=3)
+
+
+class ExportFetcher:
+    """Fetch the files of completed export tasks into output_dir.
+
+    Args:
+        output_dir: Local directory the files are copied to
+        backend: Drive backend (default: DriveFiles)
+        attempts: Folder listings tried while the files of a completed export
+            are not visible in Drive yet
+        delay: Seconds between those listings
+        sleep: Function used to wait between listings
+    """
+
+    def __init__(self, output_dir: str, backend=None, attempts: int = 5, delay: float = 30.0,
+                 sleep=time.sleep):
+        self.output_dir = output_dir
+        self.backend = backend or DriveFiles()
+        self.attempts = attempts
+        self.delay = delay
+        self.sleep = sleep
+
+    def _find(self, record: dict) -> list:
+        stem, ext = os.path.splitext(record['file_name'])
+        pattern = re.compile(rf'^{re.escape(stem)}(-\d{{10}}-\d{{10}})?{re.escape(ext)}$')
+        for attempt in range(self.attempts):
+            files = [f for f in self.backend.list(record['folder'], stem) if pattern.match(f['name'])]
+            if files:
+                return sorted(files, key=lambda f: f['name'])
+            if attempt < self.attempts - 1:
+                self.sleep(self.delay)
+        raise FileNotFoundError(f"Export {record['name']} completed but {record['file_name']} "
+                                f"is not in the Drive folder {record['folder']}")
+
+    def fetch(self, record: dict) -> list:
+        """Copy the files of a completed export; files already fetched (same size) are kept.
+
+        Returns:
+            Local paths of the export's files
+        """
+        if record['state'] != 'COMPLETED':
+            raise RuntimeError(f"Export {record['name']} {record['state'].lower()}: {record.get('error')}")
+        os.makedirs(self.output_dir, exist_ok=True)
+        paths = []
+        for drive_file in self._find(record):
+            path = os.path.join(self.output_dir, drive_file['name'])
+            if os.path.exists(path) and os.path.getsize(path) == int(drive_file.get('size', -1)):
+                print(f"Already fetched: {path}")
+            else:
+                part = path + '.part'
+                self.backend.download(drive_file['id'], part)
+                os.replace(part, path)
+                print(f"Fetched {drive_file['name']} to {path}")
+            register_artifact(path, params={'stage': 'export', 'export': record['name'],
+                                            'task_id': record.get('task_id')})
+            paths.append(path)
+        return paths
+
+
+def fetch_exports(tasks: ExportTaskManager, names: list, fetcher: ExportFetcher, timeout: float = None) -> dict:
+    """Wait for export tasks and fetch the files of each one as soon as it completes.
+
+    Raises RuntimeError for an export that failed or was cancelled.
+
+    Returns:
+        Local paths by export name
+    """
+    fetched = {}
+    pending = list(names)
+    while pending:
+        records = tasks.run(pending, timeout=timeout, any_finished=True)
+        for name, record in records.items():
+            if name in pending and record['state'] in FINISHED_STATES:
+                fetched[name] = fetcher.fetch(record)
+                pending.remove(name)
+    return fetched
@@ -0,0 +1,93 @@
+"""Split Earth Engine image exports into tiles that fit the export limits.
+
+A single GeoTIFF export is limited in grid size and file size (see the
+README: 10,000 pixels per side, 32 MB). plan_export() lays a pixel grid over
+the AOI in its UTM zone, with the origin snapped to multiples of the scale,
+estimates the pixel count and uncompressed output size, and splits the grid
+into tiles small enough for both limits. All tiles share the CRS and
+crsTransform of the grid, so the exported files mosaic locally without
+resampling.
+
+    plan = plan_export(bounds, scale=10, band_count=40)
+    for tile in plan['tiles']:
+        ee.batch.Export.image.toDrive(image=image, crs=plan['crs'], crsTransform=plan['transform'],
+                                      region=tile_region(plan, tile), ...)
+"""
+
+import math
+
+import ee
+from rasterio.warp import transform_bounds
+
+from raster_utils import iter_windows
+
+MAX_DIMENSION = 10000
+MAX_FILE_BYTES = 32 * 2**20
+
+
+def utm_crs(lon: float, lat: float) -> str:
+    """EPSG code of the UTM zone containing a point."""
+    zone = min(int((lon + 180) / 6) + 1, 60)
+    return f"EPSG:{32600 + zone + (0 if lat >= 0 else 100)}"
+
+
+def plan_grid(bounds: tuple, scale: float, crs: str = None) -> dict:
+    """Pixel grid covering lon/lat bounds, with the origin snapped to multiples of scale.
+
+    Args:
+        bounds: (minx, miny, maxx, maxy) in EPSG:4326
+        scale: Pixel size in meters
+        crs: Grid CRS (default: UTM zone of the bounds centre)
+
+    Returns:
+        Dict with crs, transform (Earth Engine crsTransform), width and height
+    """
+    crs = crs or utm_crs((bounds[0] + bounds[2]) / 2, (bounds[1] + bounds[3]) / 2)
+    left, bottom, right, top = transform_bounds('EPSG:4326', crs, *bounds)
+    left = math.floor(left / scale) * scale
+    top = math.ceil(top / scale) * scale
+    width = max(1, math.ceil((right - left) / scale))
+    height = max(1, math.ceil((top - bottom) / scale))
+    return {'crs': crs, 'transform': [scale, 0, left, 0, -scale, top], 'width': width, 'height': height}
+
+
+def tile_size(band_count: int, bytes_per_sample: int = 4, max_dimension: int = MAX_DIMENSION,
+              max_bytes: int = MAX_FILE_BYTES) -> int:
+    """Largest square tile edge (pixels) within the dimension and file-size limits."""
+    side = min(max_dimension, int(math.sqrt(max_bytes / (band_count * bytes_per_sample))))
+    if side < 1:
+        raise ValueError(f"A single pixel of {band_count} bands exceeds {max_bytes} bytes")
+    return side
+
+
+def plan_export(bounds: tuple, scale: float, band_count: int, bytes_per_sample: int = 4, crs: str = None,
+                max_dimension: int = MAX_DIMENSION, max_bytes: int = MAX_FILE_BYTES) -> dict:
+    """Grid, size estimate and tiles of an image export over lon/lat bounds.
+
+    Returns:
+        plan_grid() dict plus pixels, bytes (uncompressed estimate), tile_size and
+        tiles: dicts with name, row_off, col_off, width, height and bounds in the grid CRS
+    """
+    grid = plan_grid(bounds, scale, crs)
+    side = tile_size(band_count, bytes_per_sample, max_dimension, max_bytes)
+    scale, left, top = grid['transform'][0], grid['transform'][2], grid['transform'][5]
+    windows = list(iter_windows(grid['width'], grid['height'], side))
+    n_cols = math.ceil(grid['width'] / side)
+    tiles = []
+    for i, window in enumerate(windows):
+        x0 = left + window.col_off * scale
+        y1 = top - window.row_off * scale
+        tiles.append({
+            'name': f"r{i // n_cols:02d}c{i % n_cols:02d}",
+            'row_off': window.row_off, 'col_off': window.col_off,
+            'width': window.width, 'height': window.height,
+            'bounds': (x0, y1 - window.height * scale, x0 + window.width * scale, y1),
+        })
+    pixels = grid['width'] * grid['height']
+    return {**grid, 'pixels': pixels, 'bytes': pixels * band_count * bytes_per_sample,
+            'band_count': band_count, 'tile_size': side, 'tiles': tiles}
+
+
+def tile_region(plan: dict, tile: dict):
+    """ee.Geometry rectangle of a tile in the grid CRS."""
+    return ee.Geometry.Rectangle(list(tile['bounds']), plan['crs'], False)
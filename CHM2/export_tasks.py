@@ -0,0 +1,217 @@
+"""Track Earth Engine export tasks until their files are ready.
+
+ExportTaskManager starts export tasks with at most max_concurrent running
+at a time, polls their status with exponential backoff and calls a callback
+as each one finishes. Started tasks are recorded in a JSON state file, so
+after a restart submitting the same task names picks up the running tasks
+instead of starting them again, and completed ones are not repeated.
+
+    tasks = ExportTaskManager('chm_outputs/export_tasks.json', max_concurrent=2)
+    tasks.submit('stack_b40_s10_p1234', lambda: ee.batch.Export.image.toDrive(**params),
+                 callback=lambda record: print(record['state']))
+    tasks.run()  # blocks until all submitted tasks have finished
+
+export_fetch.fetch_exports() waits for tasks and copies their files from
+Drive as each one completes.
+
+The backend (start a task, fetch the status of several tasks) is
+EarthEngineTasks by default; tests pass a fake one.
+"""
+
+import json
+import os
+import threading
+import time
+
+ACTIVE_STATES = ('UNSUBMITTED', 'READY', 'RUNNING', 'CANCEL_REQUESTED')
+FINISHED_STATES = ('COMPLETED', 'FAILED', 'CANCELLED')
+
+
+class EarthEngineTasks:
+    """Task backend using the Earth Engine batch API."""
+
+    def start(self, task) -> str:
+        """Start an unstarted ee.batch.Task; returns its id."""
+        task.start()
+        return task.id
+
+    def status(self, task_ids: list) -> dict:
+        """Status dicts ('state', 'error_message', ...) by task id, in one request."""
+        import ee
+        return {s['id']: s for s in ee.data.getTaskStatus(list(task_ids))}
+
+
+class ExportTaskManager:
+    """Start, poll and resume export tasks.
+
+    Args:
+        state_path: JSON file recording the started tasks
+        backend: Task backend (default: EarthEngineTasks)
+        max_concurrent: Tasks running at the same time
+        poll_interval: First delay between status polls (seconds)
+        max_interval: Upper bound of the poll delay
+        backoff: Factor the delay grows by while no task changes state
+        retries: Restarts of a task that failed or could not be started
+        callback: Default callback for tasks submitted without one
+        sleep: Function used to wait between polls
+    """
+
+    def __init__(self, state_path: str, backend=None, max_concurrent: int = 2, poll_interval: float = 10.0,
+                 max_interval: float = 300.0, backoff: float = 2.0, retries: int = 1, callback=None,
+                 sleep=time.sleep):
+        self.state_path = state_path
+        self.backend = backend or EarthEngineTasks()
+        self.max_concurrent = max_concurrent
+        self.poll_interval = poll_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.retries = retries
+        self.callback = callback
+        self.sleep = sleep
+        self.records = {}
+        self._queue = []
+        self._retry = []
+        self._create = {}
+        self._callbacks = {}
+        self._lock = threading.RLock()
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                self.records = json.load(f)['tasks']
+            # Tasks that were queued but never started are submitted again by the caller
+            self.records = {name: r for name, r in self.records.items() if r['state'] != 'QUEUED'}
+
+    def save(self):
+        """Write the state file atomically."""
+        if os.path.dirname(self.state_path):
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        tmp = f'{self.state_path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'tasks': self.records, 'updated': time.time()}, f, indent=2)
+        os.replace(tmp, self.state_path)
+
+    def submit(self, name: str, create, callback=None, **info) -> dict:
+        """Queue an export unless a task of that name is already running or completed.
+
+        Args:
+            name: Unique task name (e.g. the export description)
+            create: Callable returning the unstarted task
+            callback: Called with the task record when the task finishes
+            **info: Extra fields stored in the record (e.g. file name, folder)
+
+        Returns:
+            The task record
+        """
+        with self._lock:
+            record = self.records.get(name)
+            self._create[name] = create
+            callback = callback or self.callback
+            if callback:
+                self._callbacks[name] = callback
+            if record and record['state'] in ACTIVE_STATES:
+                print(f"Resuming export {name} ({record['state']}, task {record['task_id']})")
+            elif record and record['state'] == 'COMPLETED':
+                print(f"Export {name} already completed")
+                if callback:
+                    callback(record)
+            else:
+                record = {'name': name, 'task_id': None, 'state': 'QUEUED', 'attempts': 0,
+                          'error': None, 'submitted': time.time(), 'updated': time.time(), **info}
+                self.records[name] = record
+                self._queue.append(name)
+            self.save()
+            return record
+
+    def active(self) -> list:
+        return [name for name, r in self.records.items() if r['state'] in ACTIVE_STATES]
+
+    def pending(self, names=None) -> list:
+        """Names of tasks (of names, default all) that are queued or running."""
+        names = self.records if names is None else names
+        return [name for name in names if self.records[name]['state'] not in FINISHED_STATES]
+
+    def _start_queued(self) -> bool:
+        started = False
+        while self._queue and len(self.active()) < self.max_concurrent:
+            name = self._queue.pop(0)
+            record = self.records[name]
+            record['attempts'] += 1
+            try:
+                record['task_id'] = self.backend.start(self._create[name]())
+                record['state'] = 'READY'
+                print(f"Started export {name} (task {record['task_id']})")
+            except Exception as e:
+                self._failed(record, f'start failed: {e}')
+            record['updated'] = time.time()
+            started = True
+        return started
+
+    def _failed(self, record: dict, error: str):
+        name = record['name']
+        record['error'] = error
+        if record['attempts'] <= self.retries and name in self._create:
+            print(f"Export {name} failed ({error}), retrying")
+            record['state'] = 'QUEUED'
+            self._retry.append(name)  # restarted on the next poll
+        else:
+            record['state'] = 'FAILED'
+            self._finished(record)
+
+    def _finished(self, record: dict):
+        print(f"Export {record['name']} {record['state'].lower()}"
+              + (f": {record['error']}" if record['error'] else ''))
+        callback = self._callbacks.get(record['name'])
+        if callback:
+            callback(record)
+
+    def step(self) -> bool:
+        """Start queued tasks and poll the active ones once; returns True if any task changed state."""
+        with self._lock:
+            self._queue += self._retry
+            self._retry = []
+            changed = self._start_queued()
+            active = [self.records[name] for name in self.active()]
+            statuses = self.backend.status([r['task_id'] for r in active]) if active else {}
+            for record in active:
+                status = statuses.get(record['task_id'], {})
+                state = status.get('state', record['state'])
+                if state == record['state']:
+                    continue
+                changed = True
+                record['updated'] = time.time()
+                if state == 'FAILED':
+                    self._failed(record, status.get('error_message', 'unknown error'))
+                else:
+                    record['state'] = state
+                    if state in FINISHED_STATES:
+                        record['error'] = status.get('error_message')
+                        self._finished(record)
+            changed = self._start_queued() or changed
+            if changed:
+                self.save()
+            return changed
+
+    def run(self, names: list = None, timeout: float = None, any_finished: bool = False) -> dict:
+        """Poll until the tasks (default: all submitted) have finished.
+
+        Several threads may wait on different tasks of one manager.
+
+        Args:
+            names: Task names to wait for
+            timeout: Seconds before raising TimeoutError
+            any_finished: Return as soon as one of the tasks has finished
+
+        Returns:
+            Task records by name
+        """
+        names = list(self.records) if names is None else list(names)
+        deadline = time.time() + timeout if timeout else None
+        delay = self.poll_interval
+        while True:
+            changed = self.step()
+            pending = self.pending(names)
+            if not pending or (any_finished and len(pending) < len(names)):
+                return {name: self.records[name] for name in names}
+            if deadline and time.time() > deadline:
+                raise TimeoutError(f"Exports still running after {timeout}s: {self.pending(names)}")
+            delay = self.poll_interval if changed else min(delay * self.backoff, self.max_interval)
+            self.sleep(delay)
@@ -0,0 +1,100 @@
+"""Fetch a FeatureCollection in pages and stream it into a CSV file.
+
+A single getInfo() on a FeatureCollection fails above 5000 features. The
+pages here are fetched with fc.toList(page_size, offset).getInfo(), a bounded
+number of them concurrently, and each page is written as CSV rows as soon
+as it is next in order. At most `workers` pages are in memory at a time,
+whatever the size of the collection.
+
+Columns are the properties of the first feature followed by longitude and
+latitude of the point geometries; later features missing a property get an
+empty cell.
+
+Usage from Python:
+    write_features_csv(reference_data, 'chm_outputs/training.csv', page_size=2000, workers=8)
+"""
+
+import csv
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import telemetry
+from tracing import traced
+
+# Features per request; stays well below the 5000 element limit of getInfo
+PAGE_SIZE = 2000
+
+
+def fetch_page(feature_collection, offset: int, page_size: int = PAGE_SIZE, retries: int = 3,
+               backoff: float = 2.0) -> list:
+    """Features [offset, offset + page_size) as GeoJSON dicts, retrying failed requests."""
+    for attempt in range(retries + 1):
+        try:
+            return feature_collection.toList(page_size, offset).getInfo()
+        except Exception as e:  # e.g. 'Too many concurrent aggregations'
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt
+            print(f"Page at offset {offset} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def iter_pages(feature_collection, count: int = None, page_size: int = PAGE_SIZE, workers: int = 4,
+               retries: int = 3):
+    """Yield the pages of a FeatureCollection in order, fetching up to workers pages concurrently."""
+    if count is None:
+        count = feature_collection.size().getInfo()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for offset in range(0, count, page_size):
+            pending.append(executor.submit(fetch_page, feature_collection, offset, page_size, retries))
+            if len(pending) >= workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def feature_rows(features: list, properties: list):
+    """CSV rows of the properties and point coordinates of features."""
+    for feature in features:
+        values = feature['properties']
+        longitude, latitude = feature['geometry']['coordinates'][:2]
+        yield [values.get(name) for name in properties] + [longitude, latitude]
+
+
+@traced()
+def write_features_csv(feature_collection, output_path: str, count: int = None, page_size: int = PAGE_SIZE,
+                       workers: int = 4, retries: int = 3) -> dict:
+    """Stream a point FeatureCollection into a CSV file, page by page.
+
+    Args:
+        feature_collection: ee.FeatureCollection of points
+        output_path: Output CSV
+        count: Number of features, if already known (fetched with size() otherwise)
+        page_size: Features per request
+        workers: Concurrent page requests
+        retries: Retries of a failed page request
+
+    Returns:
+        dict with 'path', 'rows' and 'columns'
+    """
+    if count is None:
+        count = feature_collection.size().getInfo()
+    print(f"Fetching {count} features in pages of {page_size} with {workers} workers")
+    progress = telemetry.task('fetch_features', total=count, unit='features')
+    properties, rows = None, 0
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        for page in iter_pages(feature_collection, count, page_size, workers, retries):
+            if properties is None and page:
+                properties = [p for p in page[0]['properties'] if p not in ('longitude', 'latitude')]
+                writer.writerow(properties + ['longitude', 'latitude'])
+            writer.writerows(feature_rows(page, properties or []))
+            rows += len(page)
+            progress.update(units=len(page))
+    progress.finish()
+    os.replace(tmp_path, output_path)
+    return {'path': output_path, 'rows': rows, 'columns': (properties or []) + ['longitude', 'latitude']}
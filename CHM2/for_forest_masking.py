@@ -3,12 +3,78 @@ import ee
 import pandas as pd
 from typing import Union, List, Tuple
 
+import ee_cache
+
+def forest_mask_collections(
+    mask_type: str,
+    aoi: ee.Geometry,
+    start_date_ee: ee.Date,
+    end_date_ee: ee.Date
+) -> dict:
+    """
+    Image collections whose availability create_forest_mask checks.
+    
+    Their sizes can be resolved up front (e.g. with ee_batch.DeferredValues)
+    and passed to create_forest_mask as counts.
+    
+    Returns:
+        dict: Name ('dw', 'fnf4', 'fnf', 's2') to ee.ImageCollection for the mask type
+    """
+    # Create a buffered version of the AOI to ensure we get all relevant tiles
+    buffered_aoi = aoi.buffer(10000)  # Buffer by 5km
+    collections = {}
+    if mask_type in ['DW', 'ALL']:
+        # Import Dynamic World dataset using buffered AOI
+        collections['dw'] = ee.ImageCollection('GOOGLE/DYNAMICWORLD/V1') \
+            .filterBounds(buffered_aoi) \
+            .filterDate(start_date_ee, end_date_ee)
+    if mask_type in ['FNF', 'ALL']:
+        # This FNF data sets is only available until 2018
+        # FNF4 is only available from 2018 to 2021
+        # mannually assign FNF start and end date to 2018-01-01 and 2021-12-31
+        fnf_start_date = ee.Date('2020-01-01')
+        fnf_end_date = ee.Date('2020-12-31')
+        collections['fnf4'] = ee.ImageCollection("JAXA/ALOS/PALSAR/YEARLY/FNF4") \
+            .filterBounds(buffered_aoi) \
+            .filterDate(fnf_start_date, fnf_end_date)
+        # Fallback when FNF4 has no data
+        collections['fnf'] = ee.ImageCollection("JAXA/ALOS/PALSAR/YEARLY/FNF") \
+            .filterBounds(buffered_aoi) \
+            .filterDate(start_date_ee, end_date_ee)
+    if mask_type in ['NDVI', 'ALL']:
+        # Import Sentinel-2 dataset using buffered AOI
+        s2 = ee.ImageCollection('COPERNICUS/S2_HARMONIZED') \
+            .filterBounds(buffered_aoi) \
+            .filterDate(start_date_ee, end_date_ee)
+        # Get cloud probability data
+        S2_CLOUD_PROBABILITY = ee.ImageCollection('COPERNICUS/S2_CLOUD_PROBABILITY') \
+            .filterDate(start_date_ee, end_date_ee) \
+            .filterBounds(aoi)
+            
+        s2 = ee.ImageCollection(s2) \
+                    .map(lambda img: img.addBands(S2_CLOUD_PROBABILITY.filter(ee.Filter.equals('system:index', img.get('system:index'))).first()))
+        def maskClouds(img):
+            clouds = ee.Image(img).select('probability')
+            # ee.Image(img.get('cloud_mask')).select('probability')
+            isNotCloud = clouds.lt(70)
+            return img.mask(isNotCloud)
+        
+        def maskEdges(s2_img):
+            return s2_img.updateMask(
+                s2_img.select('B8A').mask().updateMask(s2_img.select('B9').mask())
+            )#.updateMask(mask_raster.eq(1))
+
+        s2 = s2.map(maskEdges) 
+        collections['s2'] = s2.map(maskClouds) 
+    return collections
+
 def create_forest_mask(
     mask_type: str,
     aoi: ee.Geometry,
     start_date_ee: ee.Date,
     end_date_ee: ee.Date,
-    ndvi_threshold: float = 0.2
+    ndvi_threshold: float = 0.2,
+    counts: dict = None
 ) -> ee.Image:
     """
     Create a forest mask based on specified mask type.
@@ -19,6 +85,8 @@ def create_forest_mask(
         start_date_ee: Start date as ee.Date
         end_date_ee: End date as ee.Date
         ndvi_threshold: NDVI threshold for forest classification (default: 0.2)
+        counts: Optional pre-resolved sizes of the forest_mask_collections;
+            sizes not given are fetched with getInfo
     
     Returns:
         ee.Image: Binary forest mask (1 for forest, 0 for non-forest)
@@ -28,23 +96,26 @@ def create_forest_mask(
     fnf_mask = ee.Image(1).clip(aoi)
     ndvi_mask = ee.Image(1).clip(aoi)
     
-    # Create a buffered version of the AOI to ensure we get all relevant tiles
-    buffered_aoi = aoi.buffer(10000)  # Buffer by 5km
+    collections = forest_mask_collections(mask_type, aoi, start_date_ee, end_date_ee)
+    counts = counts or {}
+    
+    def collection_size(name):
+        """Size of a collection, from counts if pre-resolved."""
+        if name in counts:
+            return counts[name]
+        return ee_cache.get_info(collections[name].size())
     
     def clip_image(image):
         """Clip image to the AOI."""
         return image.clip(aoi)
     # Create Dynamic World mask if requested
     if mask_type in ['DW', 'ALL']:
-        # Import Dynamic World dataset using buffered AOI
-        dw = ee.ImageCollection('GOOGLE/DYNAMICWORLD/V1') \
-            .filterBounds(buffered_aoi) \
-            .filterDate(start_date_ee, end_date_ee)
+        dw = collections['dw']
         # dw = ee.ImageCollection('GOOGLE/DYNAMICWORLD/V1') \
         #     .filterDate(start_date_ee, end_date_ee) \
         #     .map(clip_image)
         # Check if we have any data
-        count = dw.size().getInfo()
+        count = collection_size('dw')
         if count == 0:
             print("No Dynamic World data available for the specified area and date range")
         else:
@@ -56,14 +127,7 @@ def create_forest_mask(
     
     # Create Forest/Non-Forest mask if requested
     if mask_type in ['FNF', 'ALL']:
-        # This FNF data sets is only available until 2018
-        # FNF4 is only available from 2018 to 2021
-        # mannually assign FNF start and end date to 2018-01-01 and 2021-12-31
-        fnf_start_date = ee.Date('2020-01-01')
-        fnf_end_date = ee.Date('2020-12-31')
-        fnf = ee.ImageCollection("JAXA/ALOS/PALSAR/YEARLY/FNF4") \
-            .filterBounds(buffered_aoi) \
-            .filterDate(fnf_start_date, fnf_end_date)
+        fnf = collections['fnf4']
         
         # # Import ALOS/PALSAR dataset using buffered AOI
         # fnf = ee.ImageCollection("JAXA/ALOS/PALSAR/YEARLY/FNF4") \
@@ -74,15 +138,11 @@ def create_forest_mask(
         #     .map(clip_image)
         
         # Check if we have any data
-        count = fnf.size().getInfo()
+        count = collection_size('fnf4')
         if count == 0:
             print("No Dense ALOS/PALSAR FNF4 data available for the specified area and date range")
-            fnf_start_date = ee.Date('2017-01-01')
-            fnf_end_date = ee.Date('2017-12-31')
-            fnf = ee.ImageCollection("JAXA/ALOS/PALSAR/YEARLY/FNF") \
-                .filterBounds(buffered_aoi) \
-                .filterDate(start_date_ee, end_date_ee)
-            count = fnf.size().getInfo()
+            fnf = collections['fnf']
+            count = collection_size('fnf')
             if count == 0:
                 print("No ALOS/PALSAR FNF data available for the specified area and date range")
             else:
@@ -97,33 +157,10 @@ def create_forest_mask(
     
     # Create NDVI-based mask if requested
     if mask_type in ['NDVI', 'ALL']:
-        # Import Sentinel-2 dataset using buffered AOI
-        s2 = ee.ImageCollection('COPERNICUS/S2_HARMONIZED') \
-            .filterBounds(buffered_aoi) \
-            .filterDate(start_date_ee, end_date_ee)
-        # Get cloud probability data
-        S2_CLOUD_PROBABILITY = ee.ImageCollection('COPERNICUS/S2_CLOUD_PROBABILITY') \
-            .filterDate(start_date_ee, end_date_ee) \
-            .filterBounds(aoi)
-            
-        s2 = ee.ImageCollection(s2) \
-                    .map(lambda img: img.addBands(S2_CLOUD_PROBABILITY.filter(ee.Filter.equals('system:index', img.get('system:index'))).first()))
-        def maskClouds(img):
-            clouds = ee.Image(img).select('probability')
-            # ee.Image(img.get('cloud_mask')).select('probability')
-            isNotCloud = clouds.lt(70)
-            return img.mask(isNotCloud)
-        
-        def maskEdges(s2_img):
-            return s2_img.updateMask(
-                s2_img.select('B8A').mask().updateMask(s2_img.select('B9').mask())
-            )#.updateMask(mask_raster.eq(1))
-
-        s2 = s2.map(maskEdges) 
-        s2 = s2.map(maskClouds) 
+        s2 = collections['s2']
         
         # Check if we have any data
-        count = s2.size().getInfo()
+        count = collection_size('s2')
         if count == 0:
             print("No Sentinel-2 data available for the specified area and date range for NDVI calculation")
         else:
@@ -1,15 +1,17 @@
 import ee
-import geemap
 import os
 from typing import Union, List, Dict
 from datetime import datetime
 
+from chunked_download import download_image, sample_bytes
+
 def export_to_asset(
     image: ee.Image,
     description: str,
     asset_id: str,
     scale: int = 30,
-    max_pixels: int = 1e13
+    max_pixels: int = 1e13,
+    tasks=None
 ) -> Dict[str, str]:
     """
     Export an Earth Engine image to an Earth Engine asset.
@@ -20,22 +22,30 @@ def export_to_asset(
         asset_id: Asset ID for the export
         scale: Scale in meters
         max_pixels: Maximum number of pixels to export
+        tasks: Optional export_tasks.ExportTaskManager the export is submitted to
+            (the task id is None until the manager starts it)
     
     Returns:
         Dict[str, str]: Task information
     """
-    task = ee.batch.Export.image.toAsset(
-        image=image,
-        description=description,
-        assetId=asset_id,
-        scale=scale,
-        maxPixels=max_pixels
-    )
+    def create_task():
+        return ee.batch.Export.image.toAsset(
+            image=image,
+            description=description,
+            assetId=asset_id,
+            scale=scale,
+            maxPixels=max_pixels
+        )
     
-    task.start()
+    if tasks is not None:
+        task_id = tasks.submit(description, create_task, asset_id=asset_id)['task_id']
+    else:
+        task = create_task()
+        task.start()
+        task_id = task.id
     
     return {
-        'task_id': task.id,
+        'task_id': task_id,
         'description': description,
         'asset_id': asset_id
     }
@@ -47,7 +57,8 @@ def export_to_drive(
     file_name: str,
     scale: int = 30,
     max_pixels: int = 1e13,
-    file_format: str = 'GeoTIFF'
+    file_format: str = 'GeoTIFF',
+    tasks=None
 ) -> Dict[str, str]:
     """
     Export an Earth Engine image to Google Drive.
@@ -60,24 +71,32 @@ def export_to_drive(
         scale: Scale in meters
         max_pixels: Maximum number of pixels to export
         file_format: Output file format
+        tasks: Optional export_tasks.ExportTaskManager the export is submitted to
+            (the task id is None until the manager starts it)
     
     Returns:
         Dict[str, str]: Task information
     """
-    task = ee.batch.Export.image.toDrive(
-        image=image,
-        description=description,
-        folder=folder,
-        fileNamePrefix=file_name,
-        scale=scale,
-        maxPixels=max_pixels,
-        fileFormat=file_format
-    )
+    def create_task():
+        return ee.batch.Export.image.toDrive(
+            image=image,
+            description=description,
+            folder=folder,
+            fileNamePrefix=file_name,
+            scale=scale,
+            maxPixels=max_pixels,
+            fileFormat=file_format
+        )
     
-    task.start()
+    if tasks is not None:
+        task_id = tasks.submit(description, create_task, folder=folder, file_name=file_name)['task_id']
+    else:
+        task = create_task()
+        task.start()
+        task_id = task.id
     
     return {
-        'task_id': task.id,
+        'task_id': task_id,
         'description': description,
         'folder': folder,
         'file_name': file_name
@@ -88,17 +107,22 @@ def download_to_local(
     output_dir: str,
     file_name: str,
     scale: int = 30,
-    region: ee.Geometry = None
+    region: ee.Geometry = None,
+    workers: int = 4
 ) -> str:
     """
     Download an Earth Engine image to local storage.
     
+    The region is downloaded in parallel chunks below the direct download
+    size limit and assembled locally (see chunked_download).
+    
     Args:
         image: Earth Engine image to download
         output_dir: Local output directory
         file_name: Output file name
         scale: Scale in meters
         region: Region to download (if None, uses image bounds)
+        workers: Concurrent chunk downloads
     
     Returns:
         str: Path to downloaded file
@@ -106,18 +130,20 @@ def download_to_local(
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
     
-    # Get download URL
     if region is None:
         region = image.geometry()
     
-    url = image.getDownloadURL({
-        'scale': scale,
-        'region': region,
-        'format': 'GeoTIFF'
-    })
+    # Bounds, band count and band types in one request
+    info = ee.Dictionary({
+        'bounds': region.bounds(maxError=1).coordinates(),
+        'band_count': image.bandNames().size(),
+        'band_types': image.bandTypes()
+    }).getInfo()
+    ring = info['bounds'][0]
+    bounds = (min(p[0] for p in ring), min(p[1] for p in ring), max(p[0] for p in ring), max(p[1] for p in ring))
     
     # Download file
     output_path = os.path.join(output_dir, f"{file_name}.tif")
-    geemap.download_ee_image(url, output_path)
-    
-    return output_path 
\ No newline at end of file
+    # Chunks are sized by the data type, e.g. float64 images need twice as many as float32
+    return download_image(image.clip(region), bounds, output_path, scale, info['band_count'],
+                          bytes_per_sample=sample_bytes(info['band_types']), workers=workers)
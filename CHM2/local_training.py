@@ -0,0 +1,80 @@
+"""Build training tables locally by sampling the exported stack at GEDI footprints.
+
+After one stack export, training data can be re-sampled without another
+Earth Engine table export. Feature columns follow the stack band order, so
+the table lines up with the pixels load_prediction_data reads from the
+same stack.
+"""
+
+import os
+import argparse
+import numpy as np
+import pandas as pd
+import rasterio
+
+from point_sampler import sample_points
+
+
+def stack_band_names(src) -> list:
+    """Band names of a stack from its band descriptions, falling back to b1..bn."""
+    return [desc or f'b{i}' for i, desc in zip(src.indexes, src.descriptions)]
+
+
+def build_training_table(gedi_path: str, stack_path: str, output_dir: str = None,
+                         height_column: str = 'rh', block_size: int = 1024) -> pd.DataFrame:
+    """Sample the stack at GEDI footprints into a training table.
+
+    Args:
+        gedi_path: CSV of GEDI footprints with longitude, latitude and height columns
+        stack_path: Exported predictor stack GeoTIFF
+        output_dir: If given, write training_data_local_b{n}_{size}.csv there
+        height_column: Column holding the GEDI height
+        block_size: Block edge length in pixels for the block-ordered reads
+
+    Returns:
+        DataFrame with one column per stack band followed by rh, longitude and latitude
+    """
+    gedi = pd.read_csv(gedi_path)
+    missing = [c for c in ['longitude', 'latitude', height_column] if c not in gedi.columns]
+    if missing:
+        raise ValueError(f"GEDI table is missing columns: {missing}")
+
+    with rasterio.open(stack_path) as src:
+        band_names = stack_band_names(src)
+        values = sample_points(src, gedi['longitude'].values, gedi['latitude'].values,
+                               crs='EPSG:4326', block_size=block_size)
+
+    df = pd.DataFrame(values, columns=band_names)
+    df['rh'] = gedi[height_column].values
+    df['longitude'] = gedi['longitude'].values
+    df['latitude'] = gedi['latitude'].values
+
+    # Drop footprints outside the stack or with nodata in any band, like sampleRegions
+    valid = ~np.isnan(values).any(axis=1) & df['rh'].notna().values
+    print(f"Sampled {len(band_names)} bands at {len(df)} GEDI footprints, {valid.sum()} complete")
+    df = df[valid].reset_index(drop=True)
+    if df.empty:
+        raise ValueError("No GEDI footprints with valid values in every stack band")
+
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+        output_path = os.path.join(output_dir, f"training_data_local_b{len(band_names)}_{len(df)}.csv")
+        df.to_csv(output_path, index=False)
+        print(f"Training data written to: {output_path}")
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a training table from GEDI footprints and a local stack')
+    parser.add_argument('--gedi', type=str, required=True, help='CSV of GEDI footprints (longitude, latitude, rh)')
+    parser.add_argument('--stack', type=str, required=True, help='Path to exported stack GeoTIFF')
+    parser.add_argument('--output-dir', type=str, default='chm_outputs', help='Output directory for the training CSV')
+    parser.add_argument('--height-column', type=str, default='rh', help='GEDI height column')
+    parser.add_argument('--block-size', type=int, default=1024, help='Block size in pixels for reads')
+    args = parser.parse_args()
+
+    build_training_table(args.gedi, args.stack, args.output_dir, args.height_column, args.block_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Merge the pieces of an Earth Engine export into one Cloud-Optimized GeoTIFF.
+
+Earth Engine splits large exports into <prefix>-<row>-<col>.tif files and
+tiled exports (export_planner) give one <prefix>_r<row>c<col>.tif per tile,
+each possibly split again. The local pipeline expects a single file per
+export, so mosaic_export() finds the pieces of a prefix, writes a VRT over
+them and copies it into <prefix>.tif as a tiled, DEFLATE-compressed COG
+with overviews. GDAL streams the copy block by block (memory bounded by
+cache_mb) and compresses with several threads.
+
+The pieces must share the CRS and pixel grid (as exports with one
+crsTransform do); anything else would need resampling and is rejected.
+
+Usage:
+    python mosaic.py --dir chm_outputs --prefix stack_b40_s10_p40000
+    python mosaic.py --dir chm_outputs --family stack forestMask
+"""
+
+import argparse
+import glob
+import os
+import re
+from xml.sax.saxutils import escape
+
+import numpy as np
+import rasterio
+import rasterio.shutil
+
+from artifact_catalog import register_artifact
+from tracing import traced
+
+PIECE_PATTERN = re.compile(r'^(?P<prefix>.+?)(?P<tile>_r\d{2}c\d{2})?(?P<split>-\d{10}-\d{10})?\.tif$')
+GDAL_TYPES = {'uint8': 'Byte', 'int8': 'Int8', 'uint16': 'UInt16', 'int16': 'Int16', 'uint32': 'UInt32',
+              'int32': 'Int32', 'float32': 'Float32', 'float64': 'Float64'}
+
+
+def find_pieces(directory: str, prefix: str) -> list:
+    """Export pieces of prefix in directory (tiles and Earth Engine splits), sorted by name."""
+    pieces = []
+    for path in glob.glob(os.path.join(glob.escape(directory), glob.escape(prefix) + '*.tif')):
+        match = PIECE_PATTERN.match(os.path.basename(path))
+        if match and match['prefix'] == prefix and (match['tile'] or match['split']):
+            pieces.append(path)
+    return sorted(pieces)
+
+
+def export_prefixes(directory: str, family: str = '') -> list:
+    """Prefixes in directory starting with family that have tiled or split pieces."""
+    prefixes = set()
+    for path in glob.glob(os.path.join(glob.escape(directory), glob.escape(family) + '*.tif')):
+        match = PIECE_PATTERN.match(os.path.basename(path))
+        if match and (match['tile'] or match['split']):
+            prefixes.add(match['prefix'])
+    return sorted(prefixes)
+
+
+def _grid_offset(value: float, res: float) -> int:
+    offset = value / res
+    if abs(offset - round(offset)) > 1e-6:
+        raise ValueError("Export pieces are not on one pixel grid; mosaicking would need resampling")
+    return int(round(offset))
+
+
+def build_vrt(pieces: list, vrt_path: str) -> str:
+    """Write a VRT mosaic of pieces sharing CRS, resolution, bands and data type."""
+    profiles = []
+    for path in pieces:
+        with rasterio.open(path) as src:
+            profiles.append({'path': os.path.abspath(path), 'crs': src.crs, 'res': src.res, 'count': src.count,
+                             'dtype': src.dtypes[0], 'nodata': src.nodata, 'bounds': src.bounds,
+                             'width': src.width, 'height': src.height, 'block': src.block_shapes[0],
+                             'descriptions': src.descriptions})
+    first = profiles[0]
+    for p in profiles[1:]:
+        if (p['crs'], p['count'], p['dtype']) != (first['crs'], first['count'], first['dtype']) \
+                or not np.allclose(p['res'], first['res']):
+            raise ValueError(f"{p['path']} does not match the CRS, resolution or bands of {first['path']}")
+
+    res_x, res_y = first['res']
+    left = min(p['bounds'].left for p in profiles)
+    top = max(p['bounds'].top for p in profiles)
+    width = max(_grid_offset(p['bounds'].right - left, res_x) for p in profiles)
+    height = max(_grid_offset(top - p['bounds'].bottom, res_y) for p in profiles)
+    source_tag = 'ComplexSource' if first['nodata'] is not None else 'SimpleSource'
+
+    lines = [f'<VRTDataset rasterXSize="{width}" rasterYSize="{height}">',
+             f'  <SRS>{escape(first["crs"].to_wkt())}</SRS>',
+             f'  <GeoTransform>{left!r}, {res_x!r}, 0, {top!r}, 0, {-res_y!r}</GeoTransform>']
+    for band in range(1, first['count'] + 1):
+        lines.append(f'  <VRTRasterBand dataType="{GDAL_TYPES[first["dtype"]]}" band="{band}">')
+        if first['nodata'] is not None:
+            lines.append(f'    <NoDataValue>{first["nodata"]!r}</NoDataValue>')
+        if first['descriptions'][band - 1]:
+            lines.append(f'    <Description>{escape(first["descriptions"][band - 1])}</Description>')
+        for p in profiles:
+            x_off = _grid_offset(p['bounds'].left - left, res_x)
+            y_off = _grid_offset(top - p['bounds'].top, res_y)
+            lines += [f'    <{source_tag}>',
+                      f'      <SourceFilename relativeToVRT="0">{escape(p["path"])}</SourceFilename>',
+                      f'      <SourceBand>{band}</SourceBand>',
+                      f'      <SourceProperties RasterXSize="{p["width"]}" RasterYSize="{p["height"]}" '
+                      f'DataType="{GDAL_TYPES[p["dtype"]]}" BlockXSize="{p["block"][1]}" '
+                      f'BlockYSize="{p["block"][0]}"/>',
+                      f'      <SrcRect xOff="0" yOff="0" xSize="{p["width"]}" ySize="{p["height"]}"/>',
+                      f'      <DstRect xOff="{x_off}" yOff="{y_off}" xSize="{p["width"]}" ySize="{p["height"]}"/>']
+            if source_tag == 'ComplexSource':
+                lines.append(f'      <NODATA>{p["nodata"]!r}</NODATA>')
+            lines.append(f'    </{source_tag}>')
+        lines.append('  </VRTRasterBand>')
+    lines.append('</VRTDataset>')
+    with open(vrt_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return vrt_path
+
+
+@traced()
+def write_cog(src_path: str, output_path: str, threads: str = 'ALL_CPUS', block_size: int = 512,
+              resampling: str = None, cache_mb: int = 256) -> str:
+    """Copy a raster (e.g. a VRT) into a tiled DEFLATE COG with overviews, streaming blocks."""
+    with rasterio.open(src_path) as src:
+        integer = np.issubdtype(np.dtype(src.dtypes[0]), np.integer)
+    tmp_path = output_path + '.tmp.tif'
+    with rasterio.Env(GDAL_CACHEMAX=cache_mb, GDAL_NUM_THREADS=threads):
+        rasterio.shutil.copy(src_path, tmp_path, driver='COG', COMPRESS='DEFLATE', PREDICTOR='YES',
+                             NUM_THREADS=threads, BLOCKSIZE=block_size, BIGTIFF='IF_SAFER',
+                             OVERVIEWS='AUTO', RESAMPLING=resampling or ('NEAREST' if integer else 'AVERAGE'))
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def mosaic_export(directory: str, prefix: str, output_path: str = None, threads: str = 'ALL_CPUS',
+                  remove_pieces: bool = False, force: bool = False) -> str:
+    """Mosaic the pieces of an export into one COG.
+
+    Args:
+        directory: Directory with the exported pieces
+        prefix: Export prefix (file name without tile/split suffix)
+        output_path: Output COG (default: directory/<prefix>.tif)
+        threads: Compression threads ('ALL_CPUS' or a number)
+        remove_pieces: Delete the pieces after a successful mosaic
+        force: Rebuild even if the mosaic is newer than all pieces
+
+    Returns:
+        Path of the mosaic, or None if there are no pieces
+    """
+    pieces = find_pieces(directory, prefix)
+    output_path = output_path or os.path.join(directory, f'{prefix}.tif')
+    if not pieces:
+        return output_path if os.path.exists(output_path) else None
+    if not force and os.path.exists(output_path) and \
+            os.path.getmtime(output_path) >= max(os.path.getmtime(p) for p in pieces):
+        print(f"Mosaic up to date: {output_path}")
+        return output_path
+
+    print(f"Mosaicking {len(pieces)} pieces of {prefix}...")
+    vrt_path = os.path.join(directory, f'{prefix}.vrt')
+    build_vrt(pieces, vrt_path)
+    try:
+        write_cog(vrt_path, output_path, threads=str(threads))
+    finally:
+        os.remove(vrt_path)
+    if remove_pieces:
+        for path in pieces:
+            os.remove(path)
+    register_artifact(output_path, params={'stage': 'mosaic', 'pieces': len(pieces)})
+    print(f"Mosaic written to {output_path}")
+    return output_path
+
+
+def mosaic_exports(directory: str, families: list = None, **kwargs) -> list:
+    """Mosaic every split or tiled export in directory whose prefix starts with one of families."""
+    prefixes = sorted({p for family in (families or ['']) for p in export_prefixes(directory, family)})
+    return [mosaic_export(directory, prefix, **kwargs) for prefix in prefixes]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mosaic tiled or split Earth Engine exports into COGs')
+    parser.add_argument('--dir', type=str, default='chm_outputs', help='Directory with the exported pieces')
+    parser.add_argument('--prefix', type=str, nargs='*', default=[], help='Export prefixes to mosaic')
+    parser.add_argument('--family', type=str, nargs='*', default=None,
+                        help='Mosaic all exports whose prefix starts with these (e.g. stack forestMask)')
+    parser.add_argument('--threads', type=str, default='ALL_CPUS', help='Compression threads')
+    parser.add_argument('--remove-pieces', action='store_true', help='Delete the pieces after mosaicking')
+    parser.add_argument('--force', action='store_true', help='Rebuild existing mosaics')
+    args = parser.parse_args(argv)
+
+    options = {'threads': args.threads, 'remove_pieces': args.remove_pieces, 'force': args.force}
+    outputs = [mosaic_export(args.dir, prefix, **options) for prefix in args.prefix]
+    if args.family is not None or not args.prefix:
+        outputs += mosaic_exports(args.dir, args.family, **options)
+    return outputs
+
+
+if __name__ == '__main__':
+    main()
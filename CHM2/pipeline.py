@@ -0,0 +1,190 @@
+"""In-process DAG pipeline runner with stage-level caching.
+
+Stages run as function calls in one interpreter, so heavy imports (torch,
+rasterio, geopandas, ee) are paid once. Each stage declares its inputs and
+parameters; their content hashes form a stage key that is recorded with the
+stage output in the artifact catalog, and a stage whose key already has an
+output is skipped. Stages whose dependencies are done run concurrently in
+threads, except stages sharing an exclusive resource such as pyplot, which
+is not thread-safe. Only stage inputs and outputs are hashed; the whole directory is
+synced into the catalog only when asked for (sync=True).
+"""
+
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from artifact_catalog import ArtifactCatalog
+from tracing import span
+from utils import get_latest_file
+
+
+class Stage:
+    """A pipeline stage.
+
+    Args:
+        name: Stage name
+        run: Callable taking the resolved inputs dict; a non-zero int return means failure
+        deps: Names of stages that must finish first
+        inputs: Callable returning a dict of input name to file path, resolved
+            when the stage becomes ready
+        params: Parameters that affect the stage output
+        output_prefix: File name prefix of the output in the catalog directory;
+            stages without one always run
+        find_output: Callable returning the output path after a run
+            (default: newest file matching output_prefix, from the catalog or the directory)
+        exclusive: Resource the stage must use alone (e.g. 'pyplot'); stages
+            naming the same resource never run at the same time
+    """
+
+    def __init__(self, name: str, run, deps=(), inputs=None, params: dict = None,
+                 output_prefix: str = None, find_output=None, exclusive: str = None):
+        self.name = name
+        self.run = run
+        self.deps = tuple(deps)
+        self.inputs = inputs or (lambda: {})
+        self.params = params or {}
+        self.output_prefix = output_prefix
+        self.find_output = find_output
+        self.exclusive = exclusive
+
+
+class Pipeline:
+    """DAG of stages sharing one artifact catalog.
+
+    Args:
+        output_dir: Directory of the artifact catalog
+        max_workers: Maximum number of stages running at once
+        sync: Bring the whole catalog in line with output_dir (registering
+            changed files, dropping removed ones) before each run
+    """
+
+    def __init__(self, output_dir: str, max_workers: int = 2, sync: bool = False):
+        self.output_dir = output_dir
+        self.max_workers = max_workers
+        self.sync = sync
+        self.stages = {}
+
+    def add(self, stage: Stage) -> Stage:
+        missing = [d for d in stage.deps if d not in self.stages]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {missing}")
+        self.stages[stage.name] = stage
+        return stage
+
+    def _closure(self, targets) -> list:
+        """Names of the targets and everything they depend on, in insertion order."""
+        needed, todo = set(), list(targets)
+        while todo:
+            name = todo.pop()
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage: {name}")
+            if name not in needed:
+                needed.add(name)
+                todo.extend(self.stages[name].deps)
+        return [name for name in self.stages if name in needed]
+
+    @staticmethod
+    def _run_stage(stage: Stage, inputs: dict):
+        with span(stage.name, category='stage'):
+            return stage.run(inputs)
+
+    def stage_key(self, catalog: ArtifactCatalog, stage: Stage, inputs: dict) -> str:
+        """Hash of a stage's name, parameters and input contents."""
+        description = {
+            'stage': stage.name,
+            'params': stage.params,
+            'inputs': {name: catalog.content_hash(path) if path else None
+                       for name, path in sorted(inputs.items())},
+        }
+        return hashlib.blake2b(json.dumps(description, sort_keys=True, default=str).encode(),
+                               digest_size=16).hexdigest()
+
+    def run(self, targets=None, force: bool = False, with_deps: bool = True) -> dict:
+        """Run stages in dependency order, skipping stages with cached outputs.
+
+        Args:
+            targets: Stage names to run (default: all)
+            force: Run stages even if their outputs are cached
+            with_deps: Also run the stages the targets depend on
+
+        Returns:
+            Dictionary mapping stage names to dicts with 'status', 'output' and 'seconds'
+        """
+        targets = list(targets or self.stages)
+        unknown = [name for name in targets if name not in self.stages]
+        if unknown:
+            raise ValueError(f"Unknown stages: {unknown}")
+        names = self._closure(targets) if with_deps else targets
+        results = {}
+        catalog = ArtifactCatalog(self.output_dir)
+        if self.sync:
+            catalog.sync()
+        running = {}
+
+        def ready(name):
+            deps = [d for d in self.stages[name].deps if d in names]
+            return all(results.get(d, {}).get('status') in ('done', 'cached') for d in deps)
+
+        def blocked(name):
+            return any(results.get(d, {}).get('status') in ('failed', 'blocked')
+                       for d in self.stages[name].deps if d in names)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while len(results) < len(names):
+                    for name in names:
+                        if name in results or any(s.name == name for s, _, _ in running.values()):
+                            continue
+                        if blocked(name):
+                            results[name] = {'status': 'blocked', 'output': None, 'seconds': 0.0}
+                            print(f"[{name}] blocked by a failed dependency")
+                            continue
+                        if not ready(name):
+                            continue
+                        stage = self.stages[name]
+                        if stage.exclusive and any(s.exclusive == stage.exclusive for s, _, _ in running.values()):
+                            continue
+                        try:
+                            inputs = stage.inputs()
+                            key = self.stage_key(catalog, stage, inputs)
+                        except (OSError, ValueError) as e:
+                            print(f"[{name}] inputs unavailable: {e}")
+                            results[name] = {'status': 'failed', 'output': None, 'seconds': 0.0}
+                            continue
+                        cached = (catalog.latest(stage.output_prefix, params={'stage_key': key})
+                                  if stage.output_prefix else None)
+                        if cached and not force:
+                            print(f"[{name}] unchanged, using {cached}")
+                            results[name] = {'status': 'cached', 'output': cached, 'seconds': 0.0}
+                            continue
+                        print(f"[{name}] running")
+                        future = executor.submit(self._run_stage, stage, inputs)
+                        running[future] = (stage, key, time.time())
+
+                    if not running:
+                        continue
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        stage, key, start = running.pop(future)
+                        seconds = time.time() - start
+                        try:
+                            code = future.result()
+                            if isinstance(code, int) and code != 0:
+                                raise RuntimeError(f"stage returned exit code {code}")
+                        except Exception as e:
+                            print(f"[{stage.name}] failed after {seconds:.1f}s: {e}")
+                            results[stage.name] = {'status': 'failed', 'output': None, 'seconds': seconds}
+                            continue
+                        output = None
+                        if stage.output_prefix:
+                            output = (stage.find_output() if stage.find_output else
+                                      get_latest_file(self.output_dir, stage.output_prefix, required=False))
+                            if output:
+                                catalog.register(output, params={'stage': stage.name, 'stage_key': key})
+                        print(f"[{stage.name}] done in {seconds:.1f}s")
+                        results[stage.name] = {'status': 'done', 'output': output, 'seconds': seconds}
+        finally:
+            catalog.close()
+        return results
@@ -0,0 +1,130 @@
+"""Block-ordered sampling of many rasters at point coordinates.
+
+Points are sorted into Z-order (Morton) of the read blocks they fall in, so
+each block is read once and neighbouring blocks are read one after another.
+Values are gathered from each block with fancy indexing and returned as
+columns of a table.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.warp import transform as transform_coords
+from rasterio.windows import Window
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _spread_bits(v: np.ndarray) -> np.ndarray:
+    """Insert a zero bit between each of the lower 32 bits."""
+    v = v & 0xFFFFFFFF
+    v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+    v = (v | (v << 8)) & 0x00FF00FF00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v << 2)) & 0x3333333333333333
+    v = (v | (v << 1)) & 0x5555555555555555
+    return v
+
+
+def morton_key(rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """Z-order key interleaving the bits of non-negative row and column indices."""
+    rows = np.asarray(rows).astype(np.uint64)
+    cols = np.asarray(cols).astype(np.uint64)
+    return _spread_bits(cols) | (_spread_bits(rows) << 1)
+
+
+def sample_points(src, xs: np.ndarray, ys: np.ndarray, crs=None, bands: list = None,
+                  block_size: int = 1024) -> np.ndarray:
+    """Sample an open raster at point coordinates.
+
+    Args:
+        src: Open rasterio dataset
+        xs: X coordinates
+        ys: Y coordinates
+        crs: CRS of the coordinates (default: the raster CRS)
+        bands: Band indexes to sample (default: all bands)
+        block_size: Edge length in pixels of the blocks points are grouped into
+
+    Returns:
+        Float64 array of shape (n_points, n_bands), NaN outside the raster and at nodata
+    """
+    bands = list(bands or src.indexes)
+    xs, ys = np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+    values = np.full((len(xs), len(bands)), np.nan)
+    if len(xs) == 0:
+        return values
+    if crs is not None and src.crs != crs:
+        xs, ys = transform_coords(crs, src.crs, xs, ys)
+        xs, ys = np.asarray(xs), np.asarray(ys)
+
+    cols, rows = ~src.transform * (xs, ys)
+    with np.errstate(invalid='ignore'):
+        rows, cols = np.floor(rows), np.floor(cols)
+    inside = (rows >= 0) & (rows < src.height) & (cols >= 0) & (cols < src.width)
+    index = np.flatnonzero(inside)
+    rows, cols = rows[index].astype(np.int64), cols[index].astype(np.int64)
+
+    # Visit blocks in Z-order; each block is read once
+    keys = morton_key(rows // block_size, cols // block_size)
+    order = np.argsort(keys, kind='stable')
+    index, rows, cols, keys = index[order], rows[order], cols[order], keys[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)]
+
+    for start, end in zip(starts, ends):
+        block_rows, block_cols = rows[start:end], cols[start:end]
+        # Read only the extent of the points within the block
+        row_off, col_off = block_rows.min(), block_cols.min()
+        window = Window(col_off, row_off, block_cols.max() - col_off + 1, block_rows.max() - row_off + 1)
+        data = src.read(bands, window=window, masked=True)
+        block_values = data[:, block_rows - row_off, block_cols - col_off]
+        values[index[start:end]] = np.ma.filled(block_values.astype(np.float64), np.nan).T
+    return values
+
+
+def _column_names(src, name: str, bands: list) -> list:
+    """Column names for the sampled bands of a raster."""
+    if len(bands) == 1:
+        return [name]
+    descriptions = src.descriptions
+    return [f"{name}_{descriptions[b - 1] or f'b{b}'}" for b in bands]
+
+
+def _sample_raster(args) -> pd.DataFrame:
+    """Sample one raster path into a DataFrame."""
+    name, path, xs, ys, crs, block_size = args
+    with rasterio.open(path) as src:
+        bands = list(src.indexes)
+        values = sample_points(src, xs, ys, crs=crs, bands=bands, block_size=block_size)
+        return pd.DataFrame(values, columns=_column_names(src, name, bands))
+
+
+def sample_rasters(rasters: dict, xs: np.ndarray, ys: np.ndarray, crs='EPSG:4326',
+                   block_size: int = 1024, n_workers: int = None) -> pd.DataFrame:
+    """Sample many rasters at the same points into a columnar table.
+
+    Rasters are sampled concurrently in threads (GDAL reads release the GIL).
+    Single-band rasters give one column named after their key; multi-band
+    rasters give one column per band, suffixed with the band description.
+
+    Args:
+        rasters: Mapping of column name to raster path
+        xs: X coordinates (longitudes for the default CRS)
+        ys: Y coordinates (latitudes for the default CRS)
+        crs: CRS of the coordinates
+        block_size: Edge length in pixels of the blocks points are grouped into
+        n_workers: Number of threads (default: one per raster, at most CPU count)
+
+    Returns:
+        DataFrame with one row per point, NaN outside rasters and at nodata
+    """
+    if not rasters:
+        return pd.DataFrame(index=range(len(xs)))
+    tasks = [(name, path, xs, ys, crs, block_size) for name, path in rasters.items()]
+    n_workers = min(n_workers or len(tasks), len(tasks), os.cpu_count() or 1)
+    if n_workers == 1:
+        columns = [_sample_raster(task) for task in tasks]
+    else:
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            columns = list(executor.map(_sample_raster, tasks))
+    return pd.concat(columns, axis=1)
@@ -1,11 +1,17 @@
 """Shared raster processing utilities."""
 
 import rasterio
+from rasterio.crs import CRS
 from rasterio.warp import calculate_default_transform, reproject, Resampling, transform_bounds
+from rasterio.transform import Affine, array_bounds
 from rasterio.windows import Window, from_bounds
 import numpy as np
+import math
 import os
 
+from tracing import traced
+
+@traced()
 def clip_and_resample_raster(src_path: str, bounds: tuple, target_transform=None, 
                            target_crs=None, target_shape=None, output_path: str = None):
     """Clip raster to bounds and optionally resample to target resolution."""
@@ -111,6 +117,7 @@ def get_common_bounds(pred_path: str, ref_path: str):
             return bounds
 
 
+@traced()
 def load_and_align_rasters(pred_path: str, ref_path: str, forest_mask_path: str = None, output_dir: str = None):
     """Load and align rasters to same CRS and resolution, optionally applying forest mask."""
     # Get intersection bounds in prediction CRS
@@ -133,6 +140,8 @@ def load_and_align_rasters(pred_path: str, ref_path: str, forest_mask_path: str
     else:
         pred_clip_path = ref_clip_path = None
         
+    use_mask = bool(forest_mask_path and os.path.exists(forest_mask_path))
+    
     print("\nProcessing prediction raster...")
     pred_data, _ = clip_and_resample_raster(
         pred_path, bounds,
@@ -153,7 +162,7 @@ def load_and_align_rasters(pred_path: str, ref_path: str, forest_mask_path: str
     
     # Load and apply forest mask if provided
     forest_mask = None
-    if forest_mask_path and os.path.exists(forest_mask_path):
+    if use_mask:
         print("\nProcessing forest mask...")
         mask_data, _ = clip_and_resample_raster(
             forest_mask_path, bounds,
@@ -170,4 +179,143 @@ def load_and_align_rasters(pred_path: str, ref_path: str, forest_mask_path: str
         
         print(f"Forest mask applied - {np.sum(forest_mask):,} forest pixels")
 
-    return pred_data, ref_data, target_transform, forest_mask
\ No newline at end of file
+    return pred_data, ref_data, target_transform, forest_mask
+
+def iter_windows(width: int, height: int, block_size: int = 1024):
+    """Yield square windows of at most ``block_size`` pixels covering a raster, row by row."""
+    for row_off in range(0, height, block_size):
+        for col_off in range(0, width, block_size):
+            yield Window(
+                col_off=col_off,
+                row_off=row_off,
+                width=min(block_size, width - col_off),
+                height=min(block_size, height - row_off)
+            )
+
+
+def pixel_size_m(src) -> tuple:
+    """Approximate pixel width and height in meters, using the local UTM zone for geographic CRS."""
+    if src.crs.is_geographic:
+        center_lat = (src.bounds.bottom + src.bounds.top) / 2
+        center_lon = (src.bounds.left + src.bounds.right) / 2
+        utm_zone = int((center_lon + 180) / 6) + 1
+        utm_epsg = 32600 + utm_zone + (0 if center_lat >= 0 else 100)
+        utm_crs = CRS.from_epsg(utm_epsg)
+        
+        # Transform bounds to UTM
+        bounds_utm = transform_bounds(src.crs, utm_crs, *src.bounds)
+        width_m = bounds_utm[2] - bounds_utm[0]
+        height_m = bounds_utm[3] - bounds_utm[1]
+        return width_m / src.width, height_m / src.height
+    return abs(src.transform[0]), abs(src.transform[4])
+
+
+def block_statistics(data: np.ndarray, nodata=None) -> dict:
+    """Basic statistics of a block: valid count, min, max and nodata fraction."""
+    invalid = np.isnan(data) if np.issubdtype(data.dtype, np.floating) else np.zeros(data.shape, dtype=bool)
+    if nodata is not None and not np.isnan(nodata):
+        invalid |= data == nodata
+    valid_values = data[~invalid]
+    return {
+        'valid_pixels': int(valid_values.size),
+        'min': float(valid_values.min()) if valid_values.size else None,
+        'max': float(valid_values.max()) if valid_values.size else None,
+        'nodata_fraction': float(invalid.mean()) if invalid.size else 1.0
+    }
+
+
+@traced()
+def quick_validity_check(path: str, max_reads: int = 64, overview_size: int = 1024) -> dict:
+    """Check whether a raster holds any valid data with a bounded number of reads.
+    
+    First reads a decimated view (served from internal overviews when present).
+    If that shows no valid data, scans the raster at full resolution in a coarse
+    grid of at most ``max_reads - 1`` windows, stopping at the first window with
+    valid data.
+    
+    Args:
+        path: Path to raster
+        max_reads: Maximum number of read calls
+        overview_size: Longest edge of the decimated read in pixels
+        
+    Returns:
+        Dictionary with 'valid', 'source', 'reads' and statistics of the last block read
+    """
+    with rasterio.open(path) as src:
+        factor = max(1, math.ceil(max(src.width, src.height) / overview_size))
+        out_shape = (math.ceil(src.height / factor), math.ceil(src.width / factor))
+        data = src.read(1, out_shape=out_shape)
+        stats = block_statistics(data, src.nodata)
+        source = 'overview' if src.overviews(1) else 'decimated'
+        reads = 1
+        if stats['valid_pixels'] > 0 or factor == 1:
+            return {'valid': stats['valid_pixels'] > 0, 'source': source, 'reads': reads, **stats}
+        
+        # Decimated read can miss sparse data: scan full resolution in coarse windows
+        side = max(1, int(math.sqrt(max(1, max_reads - 1))))
+        block_size = math.ceil(max(src.width, src.height) / side)
+        for window in iter_windows(src.width, src.height, block_size):
+            data = src.read(1, window=window)
+            stats = block_statistics(data, src.nodata)
+            reads += 1
+            if stats['valid_pixels'] > 0:
+                return {'valid': True, 'source': 'block', 'reads': reads, **stats}
+        return {'valid': False, 'source': 'block', 'reads': reads, **stats}
+
+
+def display_grid(shape: tuple, transform, max_pixels: int = 1_000_000) -> tuple:
+    """Coarser grid with at most ``max_pixels`` cells covering an array.
+    
+    Returns:
+        Tuple of (decimation step, display shape, display transform)
+    """
+    step = max(1, math.ceil(math.sqrt(shape[0] * shape[1] / max_pixels)))
+    out_shape = (math.ceil(shape[0] / step), math.ceil(shape[1] / step))
+    return step, out_shape, transform * Affine.scale(step)
+
+
+@traced()
+def read_display(src, indexes: list, dst_shape: tuple, dst_transform,
+                 resampling=Resampling.bilinear) -> np.ndarray:
+    """Read bands onto a coarse grid in the dataset CRS without a full-resolution read.
+    
+    The source window covering the grid is read decimated to about the grid
+    resolution (served from overviews when present) and then warped onto it.
+    
+    Args:
+        src: Open rasterio dataset
+        indexes: Band indexes to read
+        dst_shape: (height, width) of the destination grid
+        dst_transform: Affine transform of the destination grid
+        resampling: Resampling method for the final warp
+        
+    Returns:
+        Float32 array of shape (len(indexes), height, width)
+    """
+    bounds = array_bounds(dst_shape[0], dst_shape[1], dst_transform)
+    window = from_bounds(*bounds, transform=src.transform)
+    col_off, row_off = max(0, math.floor(window.col_off)), max(0, math.floor(window.row_off))
+    col_end = min(src.width, math.ceil(window.col_off + window.width))
+    row_end = min(src.height, math.ceil(window.row_off + window.height))
+    out = np.zeros((len(indexes),) + tuple(dst_shape), dtype=np.float32)
+    if col_end <= col_off or row_end <= row_off:
+        return out
+    window = Window(col_off, row_off, col_end - col_off, row_end - row_off)
+    
+    step = max(1, int(min(abs(dst_transform.a / src.transform.a), abs(dst_transform.e / src.transform.e))))
+    read_shape = (max(1, math.ceil(window.height / step)), max(1, math.ceil(window.width / step)))
+    data = src.read(indexes, window=window, out_shape=(len(indexes),) + read_shape,
+                    resampling=Resampling.average).astype(np.float32)
+    read_transform = src.window_transform(window) * Affine.scale(window.width / read_shape[1],
+                                                                 window.height / read_shape[0])
+    for i in range(len(indexes)):
+        reproject(
+            data[i],
+            out[i],
+            src_transform=read_transform,
+            src_crs=src.crs,
+            dst_transform=dst_transform,
+            dst_crs=src.crs,
+            resampling=resampling
+        )
+    return out
@@ -0,0 +1,93 @@
+"""Concurrent, content-addressed rendering of report figures.
+
+Each asset is rendered by a top-level plotting function in a worker
+process (matplotlib is not thread-safe) and stored in a cache directory
+under a hash of the function, its input arrays and its parameters.
+Re-runs with unchanged inputs copy the cached file instead of re-rendering.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Bump when plotting code changes so cached assets are re-rendered
+RENDER_VERSION = 1
+
+AssetJob = namedtuple('AssetJob', ['name', 'filename', 'func', 'arrays', 'params'])
+AssetJob.__doc__ = """Render func(output_path=..., **arrays, **params) to filename, reported under name."""
+
+
+def asset_key(job: AssetJob) -> str:
+    """Content hash of an asset job."""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"{RENDER_VERSION}:{job.func.__module__}.{job.func.__qualname__}".encode())
+    h.update(json.dumps(job.params, sort_keys=True, default=str).encode())
+    for name, array in sorted(job.arrays.items()):
+        h.update(name.encode())
+        if array is None:
+            h.update(b'none')
+            continue
+        if np.ma.isMaskedArray(array):
+            h.update(np.ascontiguousarray(np.ma.getmaskarray(array)).data)
+            array = array.data
+        array = np.ascontiguousarray(array)
+        h.update(f"{array.dtype.str}{array.shape}".encode())
+        h.update(array.data)
+    return h.hexdigest()
+
+
+def _render(job: AssetJob, cache_path: str) -> str:
+    """Render an asset to a temporary file and move it into the cache."""
+    import matplotlib
+    matplotlib.use('Agg')
+    root, ext = os.path.splitext(cache_path)
+    tmp_path = f"{root}.{os.getpid()}.tmp{ext}"
+    job.func(output_path=tmp_path, **job.arrays, **job.params)
+    os.replace(tmp_path, cache_path)
+    return cache_path
+
+
+def render_assets(jobs: list, output_dir: str, cache_dir: str = None, n_workers: int = None) -> dict:
+    """Render report assets concurrently, reusing cached results.
+
+    Args:
+        jobs: List of AssetJob
+        output_dir: Directory the assets are written to
+        cache_dir: Cache directory (default: output_dir/.asset_cache)
+        n_workers: Worker processes (default: one per asset to render, 1 renders in-process)
+
+    Returns:
+        Dictionary mapping asset names to output paths
+    """
+    cache_dir = cache_dir or os.path.join(output_dir, '.asset_cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+
+    cache_paths, pending = {}, []
+    for job in jobs:
+        ext = os.path.splitext(job.filename)[1]
+        cache_paths[job.name] = os.path.join(cache_dir, f"{asset_key(job)}{ext}")
+        if not os.path.exists(cache_paths[job.name]):
+            pending.append(job)
+    print(f"Report assets: {len(jobs) - len(pending)} cached, {len(pending)} to render")
+
+    n_workers = min(n_workers or len(pending), len(pending), os.cpu_count() or 1)
+    if n_workers <= 1:
+        for job in pending:
+            _render(job, cache_paths[job.name])
+    elif pending:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(_render, job, cache_paths[job.name]) for job in pending]
+            for future in futures:
+                future.result()
+
+    paths = {}
+    for job in jobs:
+        paths[job.name] = os.path.join(output_dir, job.filename)
+        shutil.copyfile(cache_paths[job.name], paths[job.name])
+    return paths
@@ -1,27 +1,45 @@
 import os
-import subprocess
-from pathlib import Path
+import glob
+import json
 import time
 
 from utils import get_latest_file
+from artifact_catalog import file_bounds
 from combine_heights import combine_heights_with_training
+from export_fetch import ExportFetcher, fetch_exports
+from export_tasks import ExportTaskManager
+from pipeline import Pipeline, Stage
+from mosaic import mosaic_exports
 
-# Set parameters
-def main(type: str):
 
-    aoi_path = '../downloads/new_aoi.geojson'
-    if not os.path.exists(aoi_path):
-        raise FileNotFoundError(f"AOI file not found at {aoi_path}")
+def _write_record(output_dir: str, stage: str, argv: list, exports: list = None) -> str:
+    """Record a stage run and the Earth Engine exports it produced."""
+    path = os.path.join(output_dir, f"{stage}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump({'stage': stage, 'argv': argv, 'exports': exports or [], 'time': time.time()}, f, indent=2)
+    return path
+
 
-    # Create output directories
-    output_dir = 'chm_outputs'
+def build_pipeline(aoi_path: str, output_dir: str = 'chm_outputs', max_workers: int = 4,
+                   ref_file: str = None, sync: bool = False, fetcher: ExportFetcher = None) -> Pipeline:
+    """Canopy height pipeline: data_preparation -> fetch_training -> height_analysis,
+    {fetch_stack, fetch_mask} -> mosaic -> train_predict -> evaluate.
+
+    Stages call the module entry points in-process. data_preparation submits
+    the Earth Engine exports and returns; each fetch stage waits for its own
+    exports and copies them from Drive into output_dir (with fetcher, default
+    ExportFetcher), so height_analysis starts as soon as the training data is
+    fetched while the stack export still runs. Inputs are looked up in the
+    artifact catalog when a stage becomes ready, registering files copied into
+    output_dir by hand; sync re-catalogs the whole directory before the run.
+    """
     eval_dir = os.path.join(output_dir, 'evaluation')
     os.makedirs(output_dir, exist_ok=True)
     os.makedirs(eval_dir, exist_ok=True)
+    ref_file = ref_file or os.path.join(output_dir, 'dchm_09id4.tif')
 
-    # Build command for GEE model training and prediction
-    gee_cmd = [
-        'python', 'chm_main.py',
+    # Arguments for GEE model training and prediction
+    gee_args = [
         '--aoi', aoi_path,
         '--year', '2022',
         '--start-date', '01-01',
@@ -42,65 +60,135 @@ def main(type: str):
         # '--resample', 'bicubic',
         '--ndvi-threshold', '0.35',
         '--mask-type', 'ALL',
+        # Track the exports (resumed after a restart); the fetch stages wait for them
+        '--task-state', os.path.join(output_dir, 'export_tasks.json'),
+    ]
+    # Options for local model training and prediction
+    train_options = [
+        '--test-size', '0.1',
+        '--apply-forest-mask',  # Add flag to indicate mask should be used as forest mask
+        '--model', 'mlp', # default is 'rf'
+        # '--batch_size', '32', # default is 64
     ]
-    if type == 'data_preparation':
-        # Convert all arguments to strings
-        gee_cmd = [str(arg) for arg in gee_cmd]
-        # Run the GEE model training and prediction
+
+    def local_inputs(*names):
+        # Get the most recent training data, stack, and mask files covering the AOI
+        aoi_bounds = file_bounds(aoi_path)
+        prefixes = {'training': 'training_data', 'stack': 'stack', 'mask': 'forestMask',
+                    'prediction': 'predictCH'}
+        inputs = {name: get_latest_file(output_dir, prefixes[name], bounds=aoi_bounds if name != 'prediction' else None)
+                  for name in names}
+        inputs['reference'] = ref_file
+        return inputs
+
+    fetcher = fetcher or ExportFetcher(output_dir)
+    # Export task manager shared by the fetch stages of this run
+    state = {'tasks': None, 'fetched': {}}
+
+    def data_preparation(inputs):
+        import chm_main
         print("Running GEE canopy height model...")
-        subprocess.run(gee_cmd, check=True)
-        # # Wait for downloaded files
-        # print("Waiting for GEE exports to complete...")
-        # time.sleep(60)  # Wait for files to be downloaded
-    else:
-        # Get the most recent training data, stack, and mask files
-        training_file = get_latest_file(output_dir, 'training_data')
-        stack_file = get_latest_file(output_dir, 'stack')
-        mask_file = get_latest_file(output_dir, 'forestMask')  # Forest mask is optional
-
-    ref_file = os.path.join(output_dir, 'dchm_09id4.tif')
-    
-    if type == 'height_analysis':
-        combine_heights_with_training(output_dir, ref_file)
-
-    if type =='train_predict':
-        try:
-            # Build command for local model training and prediction
-            train_cmd = [
-                'python', 'train_predict_map.py',
-                '--training-data', training_file,
-                '--stack', stack_file,
-                '--mask', mask_file,  # Used as both quality mask and forest mask
-                '--output-dir', output_dir,
-                # '--output-filename', 'local_canopy_height_predictions.tif',
-                '--test-size', '0.1',
-                '--apply-forest-mask',  # Add flag to indicate mask should be used as forest mask
-                '--model', 'mlp', # default is 'rf'
-                # '--batch_size', '32', # default is 64
-            ]
-            # Run local training and prediction
-            print("\nRunning local model training and prediction...")
-            subprocess.run([str(arg) for arg in train_cmd], check=True)
-        except FileNotFoundError as e:
-            print(f"Error: {e}")
-            print("Please ensure all required files have been exported from GEE before running local processing.")
-    
-    if type == 'evaluate':
-        pred_file = get_latest_file(output_dir, 'predictCH') 
-        # Run evaluation with PDF report generation
-        eval_cmd = [
-            'python', 'evaluate_predictions.py',
-            '--pred', pred_file,
-            '--ref', ref_file,
+        state['tasks'] = chm_main.main([str(arg) for arg in gee_args], wait=False)
+        _write_record(output_dir, 'data_preparation', gee_args, list(state['tasks'].records.values()))
+
+    def fetch_stage(name, prefix):
+        def fetch(inputs):
+            # Exports submitted by the data_preparation run the record describes
+            with open(inputs['record']) as f:
+                names = [r['name'] for r in json.load(f)['exports'] if r['name'].startswith(prefix)]
+            tasks = state['tasks'] or ExportTaskManager(gee_args[gee_args.index('--task-state') + 1])
+            missing = [n for n in names if n not in tasks.records]
+            if not names or missing:
+                raise RuntimeError(f"No {prefix} exports to fetch {missing or ''}; rerun data_preparation")
+            fetched = fetch_exports(tasks, names, fetcher)
+            state['fetched'][name] = [path for n in names for path in fetched[n]]
+
+        return Stage(name, fetch, deps=['data_preparation'],
+                     inputs=lambda: {'record': get_latest_file(output_dir, 'data_preparation')},
+                     output_prefix=prefix, find_output=lambda: state['fetched'].get(name, [None])[0])
+
+    def mosaic(inputs):
+        # Merge tiled or split raster exports into one COG per export
+        mosaic_exports(output_dir, ['stack', 'forestMask', 'predictionCHM'])
+
+    def height_analysis(inputs):
+        # The training file the stage key was computed from
+        combine_heights_with_training(output_dir, inputs['reference'], training_file=inputs['training'])
+
+    def train_predict(inputs):
+        import train_predict_map
+        print("\nRunning local model training and prediction...")
+        train_predict_map.main([
+            '--training-data', inputs['training'],
+            '--stack', inputs['stack'],
+            '--mask', inputs['mask'],  # Used as both quality mask and forest mask
+            '--output-dir', output_dir,
+        ] + train_options)
+
+    def evaluate(inputs):
+        import evaluate_predictions
+        print("\nRunning evaluation...")
+        return evaluate_predictions.main([
+            '--pred', inputs['prediction'],
+            '--ref', inputs['reference'],
             '--output', eval_dir,
             '--pdf',
-            '--training', training_file,
-            '--merged', stack_file,
-            '--forest-mask', mask_file
-        ]
-        print("\nRunning evaluation...")
-        subprocess.run([str(arg) for arg in eval_cmd], check=True)
+            '--training', inputs['training'],
+            '--merged', inputs['stack'],
+            '--forest-mask', inputs['mask'],
+        ])
+
+    pipeline = Pipeline(output_dir, max_workers=max_workers, sync=sync)
+    pipeline.add(Stage('data_preparation', data_preparation, inputs=lambda: {'aoi': aoi_path},
+                       params={'args': gee_args}, output_prefix='data_preparation'))
+    pipeline.add(fetch_stage('fetch_training', 'training_data'))
+    pipeline.add(fetch_stage('fetch_stack', 'stack'))
+    pipeline.add(fetch_stage('fetch_mask', 'forestMask'))
+    pipeline.add(Stage('height_analysis', height_analysis, deps=['fetch_training'],
+                       inputs=lambda: local_inputs('training'), output_prefix='trainingData_with_heights',
+                       exclusive='pyplot'))
+    pipeline.add(Stage('mosaic', mosaic, deps=['fetch_stack', 'fetch_mask']))
+    pipeline.add(Stage('train_predict', train_predict, deps=['mosaic', 'fetch_training'],
+                       inputs=lambda: local_inputs('training', 'stack', 'mask'),
+                       params={'options': train_options}, output_prefix='predictCH'))
+    pipeline.add(Stage('evaluate', evaluate, deps=['train_predict'],
+                       inputs=lambda: local_inputs('training', 'stack', 'mask', 'prediction'),
+                       output_prefix='evaluation_metrics', exclusive='pyplot',
+                       find_output=lambda: max(glob.glob(os.path.join(eval_dir, '*', 'evaluation_metrics.json')),
+                                               key=os.path.getmtime, default=None)))
+    return pipeline
+
+
+def run_pipeline(aoi_path: str, output_dir: str = 'chm_outputs', type: str = 'all', force: bool = False,
+                 ref_file: str = None, sync: bool = False) -> dict:
+    """Run one pipeline stage, or the whole pipeline with type='all', for one AOI.
+
+    A single stage uses the existing outputs of the stages before it, also
+    when they were copied into output_dir by hand.
+
+    Returns:
+        Pipeline results by stage name
+    """
+    if not os.path.exists(aoi_path):
+        raise FileNotFoundError(f"AOI file not found at {aoi_path}")
+
+    pipeline = build_pipeline(aoi_path, output_dir, ref_file=ref_file, sync=sync)
+    if type == 'all':
+        return pipeline.run(force=force)
+    return pipeline.run([type], force=force, with_deps=False)
+
+
+# Set parameters
+def main(type: str = 'all', force: bool = False):
+    results = run_pipeline('../downloads/new_aoi.geojson', 'chm_outputs', type, force)
+
+    for name, result in results.items():
+        print(f"{name}: {result['status']} ({result['seconds']:.1f}s) {result['output'] or ''}")
+    if all(r['status'] in ('done', 'cached') for r in results.values()):
         print("All processing complete!")
+        return 0
+    print("Please ensure all required files have been exported from GEE before running local processing.")
+    return 1
 
 if __name__ == "__main__":
     # Example usage
@@ -108,4 +196,4 @@ if __name__ == "__main__":
     # main('height_analysis')
     main('train_predict')
     # main('evaluate')
-    
\ No newline at end of file
+    # main('all')
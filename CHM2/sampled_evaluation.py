@@ -0,0 +1,193 @@
+"""Fast approximate evaluation from a stratified random sample of pixels."""
+
+import json
+import math
+import os
+import numpy as np
+import pandas as pd
+import rasterio
+
+from block_metrics import valid_pixel_mask
+from point_sampler import sample_points
+
+
+def draw_stratified_sample(width: int, height: int, n_samples: int, seed: int = 42,
+                           samples_per_stratum: int = 50) -> tuple:
+    """Draw random pixel positions with equal allocation over a regular grid of strata.
+
+    Args:
+        width: Raster width in pixels
+        height: Raster height in pixels
+        n_samples: Approximate total number of samples
+        seed: Random seed
+        samples_per_stratum: Target number of samples per stratum
+
+    Returns:
+        Tuple of (rows, cols, stratum labels, pixel count per stratum)
+    """
+    rng = np.random.default_rng(seed)
+    side = max(1, int(math.sqrt(max(1, n_samples // samples_per_stratum))))
+    row_edges = np.linspace(0, height, min(side, height) + 1).astype(int)
+    col_edges = np.linspace(0, width, min(side, width) + 1).astype(int)
+    n_row_strata, n_col_strata = len(row_edges) - 1, len(col_edges) - 1
+    n_strata = n_row_strata * n_col_strata
+    per_stratum = max(1, int(math.ceil(n_samples / n_strata)))
+
+    labels = np.repeat(np.arange(n_strata), per_stratum)
+    stratum_rows, stratum_cols = np.divmod(labels, n_col_strata)
+    row_lo, row_hi = row_edges[stratum_rows], row_edges[stratum_rows + 1]
+    col_lo, col_hi = col_edges[stratum_cols], col_edges[stratum_cols + 1]
+    rows = row_lo + (rng.random(labels.size) * (row_hi - row_lo)).astype(int)
+    cols = col_lo + (rng.random(labels.size) * (col_hi - col_lo)).astype(int)
+
+    heights = np.diff(row_edges)
+    widths = np.diff(col_edges)
+    stratum_pixels = np.outer(heights, widths).ravel()
+    return rows, cols, labels, stratum_pixels
+
+
+def sample_raster(path: str, xs: np.ndarray, ys: np.ndarray, crs) -> np.ndarray:
+    """Read band 1 at point coordinates with block-ordered reads, nodata as NaN."""
+    with rasterio.open(path) as src:
+        return sample_points(src, xs, ys, crs=crs, bands=[1])[:, 0]
+
+
+def stratified_estimates(values: dict, labels: np.ndarray, stratum_weights: np.ndarray) -> tuple:
+    """Stratified means and standard errors for per-sample quantities.
+
+    Args:
+        values: Mapping of quantity name to per-sample values
+        labels: Stratum label of each sample
+        stratum_weights: Weight of each stratum (summing to 1)
+
+    Returns:
+        Tuple of (means dict, standard errors dict)
+    """
+    n_strata = len(stratum_weights)
+    counts = np.bincount(labels, minlength=n_strata)
+    occupied = counts > 0
+    weights = np.where(occupied, stratum_weights, 0.0)
+    weights = weights / weights.sum()
+    means, errors = {}, {}
+    for name, v in values.items():
+        sums = np.bincount(labels, weights=v, minlength=n_strata)
+        sq_sums = np.bincount(labels, weights=v * v, minlength=n_strata)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            stratum_mean = np.where(occupied, sums / counts, 0.0)
+            stratum_var = np.where(counts > 1, (sq_sums - counts * stratum_mean ** 2) / (counts - 1), 0.0)
+            stratum_var_of_mean = np.where(occupied, np.maximum(stratum_var, 0.0) / counts, 0.0)
+        means[name] = float(np.sum(weights * stratum_mean))
+        errors[name] = float(np.sqrt(np.sum(weights ** 2 * stratum_var_of_mean)))
+    return means, errors
+
+
+def evaluate_sampled(pred_path: str, ref_path: str, forest_mask_path: str = None,
+                     n_samples: int = 10000, seed: int = 42) -> dict:
+    """Estimate evaluation metrics from a stratified random sample of valid pixels.
+
+    Sample positions are drawn on the prediction grid; reference and mask
+    values are read at the same map coordinates, so no raster is aligned or
+    read in full. Strata are weighted by their estimated number of valid pixels.
+
+    Returns:
+        Dictionary with 'metrics', 'standard_errors', and sample information
+    """
+    with rasterio.open(pred_path) as src:
+        rows, cols, labels, stratum_pixels = draw_stratified_sample(
+            src.width, src.height, n_samples, seed=seed)
+        xs, ys = rasterio.transform.xy(src.transform, rows, cols)
+        xs, ys = np.asarray(xs), np.asarray(ys)
+        crs = src.crs
+
+    pred = sample_raster(pred_path, xs, ys, crs)
+    ref = sample_raster(ref_path, xs, ys, crs)
+    valid = valid_pixel_mask(pred, ref)
+    if forest_mask_path and os.path.exists(forest_mask_path):
+        valid &= np.nan_to_num(sample_raster(forest_mask_path, xs, ys, crs)) > 0
+
+    if valid.sum() < 2:
+        raise ValueError("Fewer than two valid pixels in the sample")
+
+    # Weight strata by their estimated number of valid pixels
+    drawn = np.bincount(labels, minlength=len(stratum_pixels))
+    kept = np.bincount(labels[valid], minlength=len(stratum_pixels))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        valid_pixels = np.where(drawn > 0, stratum_pixels * kept / drawn, 0.0)
+    stratum_weights = valid_pixels / valid_pixels.sum()
+
+    pred, ref, labels = pred[valid], ref[valid], labels[valid]
+    err = pred - ref
+    abs_err = np.abs(err)
+    # Centre the reference before squaring so a near-constant reference does not cancel
+    centre = float(ref.mean())
+    ref_dev = ref - centre
+    means, errors = stratified_estimates({
+        'err': err,
+        'sq_err': err * err,
+        'abs_err': abs_err,
+        'ref_dev': ref_dev,
+        'sq_ref_dev': ref_dev * ref_dev,
+        'within_1m': (abs_err <= 1.0) * 100.0,
+        'within_2m': (abs_err <= 2.0) * 100.0,
+        'within_5m': (abs_err <= 5.0) * 100.0,
+    }, labels, stratum_weights)
+
+    mse = means['sq_err']
+    rmse = math.sqrt(mse)
+    ref_var = means['sq_ref_dev'] - means['ref_dev'] ** 2
+    ref_mean = centre + means['ref_dev']
+    # R2 is undefined for a (numerically) constant reference
+    degenerate = ref_var <= np.finfo(float).eps * ref_mean ** 2
+    metrics = {
+        'MSE': mse,
+        'RMSE': rmse,
+        'MAE': means['abs_err'],
+        'R2': float('nan') if degenerate else 1 - mse / ref_var,
+        'Mean Error': means['err'],
+        'Within 1m (%)': means['within_1m'],
+        'Within 2m (%)': means['within_2m'],
+        'Within 5m (%)': means['within_5m'],
+    }
+    # Delta-method standard errors for derived metrics
+    standard_errors = {
+        'MSE': errors['sq_err'],
+        'RMSE': errors['sq_err'] / (2 * rmse) if rmse > 0 else 0.0,
+        'MAE': errors['abs_err'],
+        'R2': float('nan') if degenerate else errors['sq_err'] / ref_var,
+        'Mean Error': errors['err'],
+        'Within 1m (%)': errors['within_1m'],
+        'Within 2m (%)': errors['within_2m'],
+        'Within 5m (%)': errors['within_5m'],
+    }
+    return {
+        'metrics': metrics,
+        'standard_errors': standard_errors,
+        'sample': {
+            'drawn': int(len(valid)),
+            'valid': int(valid.sum()),
+            'strata': int(len(stratum_pixels)),
+            'seed': seed,
+        },
+        'estimated_valid_pixels': float(valid_pixels.sum()),
+    }
+
+
+def compare_with_full(sampled: dict, full_metrics_path: str) -> pd.DataFrame:
+    """Compare sampled estimates with metrics from a full evaluation run."""
+    with open(full_metrics_path) as f:
+        full = json.load(f)['metrics']
+    rows = []
+    for metric, estimate in sampled['metrics'].items():
+        if metric not in full:
+            continue
+        se = sampled['standard_errors'].get(metric, np.nan)
+        diff = estimate - full[metric]
+        rows.append({
+            'metric': metric,
+            'sampled': estimate,
+            'std_error': se,
+            'full': full[metric],
+            'difference': diff,
+            'z': diff / se if se > 0 else np.nan,
+        })
+    return pd.DataFrame(rows)
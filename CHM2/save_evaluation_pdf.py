@@ -2,6 +2,7 @@
 
 import os
 import json
+import math
 import pandas as pd
 import numpy as np
 import rasterio
@@ -15,8 +16,13 @@ from reportlab.graphics.charts.legends import Legend
 from rasterio.crs import CRS
 from rasterio.warp import transform_bounds
 
-from raster_utils import load_and_align_rasters
+from raster_utils import load_and_align_rasters, display_grid, read_display
 from utils import get_latest_file
+from report_assets import AssetJob
+from tracing import traced
+
+# Pixel budget per map panel in the report
+DISPLAY_MAX_PIXELS = 1_000_000
 
 
 def scale_adjust_band(band_data, min_val, max_val, contrast=1.0, gamma=1.0):
@@ -58,8 +64,74 @@ def scale_adjust_band(band_data, min_val, max_val, contrast=1.0, gamma=1.0):
     return scaled_uint8
 
 
-def load_rgb_composite(merged_path, target_shape, transform, temp_dir=None):
-    """Load and process RGB composite from merged data."""
+def _stretch_float(data, min_val, max_val, contrast=1.0, gamma=1.0):
+    """Fused float32 path of stretch_to_uint8, working in place on one copy."""
+    # Same nodata rule as scale_adjust_band: NaN, or -9999 if it does not occur in the data
+    temp_nodata = -9999
+    if np.any(data == temp_nodata):
+        temp_nodata = np.nanmin(data) if not np.isnan(data).all() else -1
+        temp_nodata = temp_nodata - 1
+    work = np.array(data, dtype=np.float32)
+    invalid = np.isnan(work)
+    invalid |= work == temp_nodata
+    
+    if max_val - min_val != 0:
+        np.subtract(work, min_val, out=work)
+        np.divide(work, max_val - min_val, out=work)
+        np.clip(work, 0, 1, out=work)
+    else:
+        work.fill(0)
+    if contrast != 1.0:
+        np.subtract(work, 0.5, out=work)
+        np.multiply(work, contrast, out=work)
+        np.add(work, 0.5, out=work)
+        np.clip(work, 0, 1, out=work)
+    if gamma != 1.0 and gamma > 0:
+        with np.errstate(invalid='ignore'):
+            np.power(work, 1.0 / gamma, out=work, where=work > 0)
+        np.clip(work, 0, 1, out=work)
+    
+    work[invalid] = 0
+    np.multiply(work, 255, out=work)
+    return work.astype(np.uint8)
+
+
+def stretch_to_uint8(data, min_val, max_val, contrast=1.0, gamma=1.0):
+    """Min/max scaling, contrast and gamma to uint8 in one pass.
+    
+    Gives the same result as scale_adjust_band for arrays of any shape. 8- and
+    16-bit integer input is mapped through a lookup table over all possible
+    values; other input takes a fused float32 path. Pass min_val and max_val
+    as Python numbers so the arithmetic stays in float32.
+    """
+    data = np.asarray(data)
+    if data.dtype.kind in 'iu' and data.dtype.itemsize <= 2:
+        index_dtype = np.dtype(f'uint{data.dtype.itemsize * 8}')
+        values = np.arange(2 ** (data.dtype.itemsize * 8)).astype(index_dtype).view(data.dtype)
+        # Integer data has no NaN, so every value is valid
+        lut = _stretch_float(values.astype(np.float32), min_val, max_val, contrast, gamma)
+        return lut[data.view(index_dtype)]
+    return _stretch_float(data, min_val, max_val, contrast, gamma)
+
+
+def stretch_bands(data, scale_params):
+    """Stretch the bands of an (H, W, bands) array, in one call when they share parameters."""
+    params = [(p['min'], p['max'], p.get('contrast', 1.0), p.get('gamma', 1.0)) for p in scale_params]
+    if len(set(params)) == 1:
+        return stretch_to_uint8(data, *params[0])
+    out = np.empty(data.shape, dtype=np.uint8)
+    for i, band_params in enumerate(params):
+        out[..., i] = stretch_to_uint8(data[..., i], *band_params)
+    return out
+
+
+@traced()
+def load_rgb_composite(merged_path, target_shape, transform, temp_dir=None, max_pixels=DISPLAY_MAX_PIXELS):
+    """Load and process RGB composite from merged data at display resolution.
+    
+    The composite covers the target grid but is read decimated to at most
+    ``max_pixels`` pixels, so its shape is the display grid of ``target_shape``.
+    """
     merged_file_name = os.path.basename(merged_path)
     if temp_dir is None:
         temp_dir = os.path.dirname(merged_path)
@@ -71,53 +143,31 @@ def load_rgb_composite(merged_path, target_shape, transform, temp_dir=None):
             if src.count >= 4:  # Check if we have enough bands
                 # Use S2 bands 4,3,2 (R,G,B) for natural color
                 rgb_bands = [3, 2, 1]  # B4 (R, 665nm), B3 (G, 560nm), B2 (B, 490nm)
-                rgb = np.zeros((target_shape[0], target_shape[1], 3), dtype=np.float32)
-                
-                from rasterio.warp import reproject, Resampling
-                for i, band in enumerate(rgb_bands):
-                    band_data = src.read(band)  # Band numbers are 1-based
-                    band_resampled = np.zeros(target_shape, dtype=np.float32)
-                    reproject(
-                        band_data,
-                        band_resampled,
-                        src_transform=src.transform,
-                        src_crs=src.crs,
-                        dst_transform=transform,
-                        dst_crs=src.crs,
-                        resampling=Resampling.bilinear
-                    )
-                    rgb[:, :, i] = band_resampled
+                _, display_shape, display_transform = display_grid(target_shape, transform, max_pixels)
+                rgb = read_display(src, rgb_bands, display_shape, display_transform).transpose(1, 2, 0)
                 
                 # Apply band-specific scaling for Sentinel-2 reflectance values
-                rgb_norm = np.zeros_like(rgb, dtype=np.uint8)
                 # Sentinel-2 L2A typical reflectance ranges
                 scale_params = [
                     {'min': 0, 'max': 3000, 'contrast': 1.2, 'gamma': 0.8},  # Red (B4)
                     {'min': 0, 'max': 3000, 'contrast': 1.2, 'gamma': 0.8},  # Green (B3)
                     {'min': 0, 'max': 3000, 'contrast': 1.2, 'gamma': 0.8}    # Blue (B2)
                 ]
-                for i in range(3):
-                    rgb_norm[:,:,i] = scale_adjust_band(
-                        rgb[:,:,i],
-                        scale_params[i]['min'],
-                        scale_params[i]['max'],
-                        contrast=scale_params[i]['contrast'],
-                        gamma=scale_params[i]['gamma']
-                    )
+                rgb_norm = stretch_bands(rgb, scale_params)
                 
                 # save the RGB composite
                 profile = src.profile.copy()
                 profile.update({
-                    'height': target_shape[0],
-                    'width': target_shape[1],
-                    'transform': transform,
+                    'height': display_shape[0],
+                    'width': display_shape[1],
+                    'transform': display_transform,
                     'count': 3,
                     'dtype': 'uint8'
                 })
                 try:
                     with rasterio.open(merged_clipped_path, 'w', **profile) as dst:
                         # Write bands in correct order (R,G,B)
-                        dst.write(rgb_norm.transpose(2, 1, 0))
+                        dst.write(rgb_norm.transpose(2, 0, 1))
                 except Exception as e:
                     print(f"Warning: Could not save RGB composite: {e}")
                     print(f"Attempted to save to: {merged_clipped_path}")
@@ -128,30 +178,57 @@ def load_rgb_composite(merged_path, target_shape, transform, temp_dir=None):
     return None
 
 
-def create_2x2_visualization(ref_data, pred_data, diff_data, merged_path, transform, output_path, mask=None, forest_mask=None, temp_dir=None):
-    """Create 2x2 grid with reference, prediction, difference and RGB data."""
+@traced()
+def prepare_comparison_grid(ref_data, pred_data, diff_data, merged_path, transform, mask=None, forest_mask=None,
+                            temp_dir=None, max_pixels=DISPLAY_MAX_PIXELS):
+    """Display-resolution inputs of create_comparison_grid.
+    
+    All panels are reduced to at most ``max_pixels`` pixels, so rendering cost
+    does not grow with the AOI.
+    """
+    step = max(1, math.ceil(math.sqrt(pred_data.size / max_pixels)))
+    shape = pred_data.shape
+    ref_data, pred_data, diff_data = ref_data[::step, ::step], pred_data[::step, ::step], diff_data[::step, ::step]
+    if mask is not None:
+        mask = mask[::step, ::step]
+    if forest_mask is not None:
+        forest_mask = forest_mask[::step, ::step]
     
     # Load RGB composite if available
     rgb_norm = None
     if merged_path and os.path.exists(merged_path):
-        rgb_norm = load_rgb_composite(merged_path, pred_data.shape, transform, temp_dir)
+        rgb_norm = load_rgb_composite(merged_path, shape, transform, temp_dir, max_pixels=max_pixels)
     else:
         print("Merged data not found or invalid. Skipping RGB composite creation.")
-    # Apply mask if provided
     # Combine validity mask with forest mask if provided
     final_mask = mask if mask is not None else np.ones_like(pred_data, dtype=bool)
     if forest_mask is not None:
         final_mask = final_mask & forest_mask
-        
-    # if final_mask is not None and rgb_norm is not None:
-    #     # Create a 3D mask by expanding dimensions
-    #     mask_3d = np.repeat(final_mask[:, :, np.newaxis], 3, axis=2)
-    #     # Apply mask - set masked areas to 0
-    #     rgb_norm = np.where(mask_3d, rgb_norm, 0)
-        
+    
+    return {
+        'ref_data': np.ascontiguousarray(ref_data),
+        'pred_data': np.ascontiguousarray(pred_data),
+        'diff_data': np.ascontiguousarray(diff_data),
+        'rgb_data': rgb_norm,
+        'forest_mask': np.ascontiguousarray(final_mask)
+    }
+
+
+def comparison_grid_job(ref_data, pred_data, merged_path, transform, mask=None, forest_mask=None, temp_dir=None):
+    """Asset job rendering the comparison grid as a compressed JPEG."""
     from evaluation_utils import create_comparison_grid
-    create_comparison_grid(ref_data, pred_data, diff_data, rgb_norm, output_path, 
-                           forest_mask=final_mask)
+    arrays = prepare_comparison_grid(ref_data, pred_data, pred_data - ref_data, merged_path, transform,
+                                     mask=mask, forest_mask=forest_mask, temp_dir=temp_dir)
+    return AssetJob('comparison_grid', 'comparison_grid.jpg', create_comparison_grid, arrays, {})
+
+
+def create_2x2_visualization(ref_data, pred_data, diff_data, merged_path, transform, output_path, mask=None, forest_mask=None, temp_dir=None,
+                             max_pixels=DISPLAY_MAX_PIXELS):
+    """Create 2x2 grid with reference, prediction, difference and RGB data."""
+    from evaluation_utils import create_comparison_grid
+    arrays = prepare_comparison_grid(ref_data, pred_data, diff_data, merged_path, transform,
+                                     mask=mask, forest_mask=forest_mask, temp_dir=temp_dir, max_pixels=max_pixels)
+    create_comparison_grid(output_path=output_path, **arrays)
     return output_path
 
 
@@ -235,29 +312,36 @@ def create_feature_importance_chart(data, width, height):
     drawing.add(chart)
     return drawing
 
+@traced()
 def save_evaluation_to_pdf(pred_path, ref_path, pred_data, ref_data, metrics,
                           output_dir, training_data_path=None, merged_data_path=None,
-                          mask=None, forest_mask=None, area_ha=None, validation_info=None, plot_paths=None):
-    """Create PDF report with evaluation results."""
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # Calculate difference for visualization
-    diff_data = pred_data - ref_data
+                          mask=None, forest_mask=None, area_ha=None, validation_info=None, plot_paths=None,
+                          metric_cis=None, grid_path=None):
+    """Create PDF report with evaluation results.
     
-    # Create comparison grid visualization
-    grid_path = os.path.join(output_dir, 'comparison_grid.png')
-    with rasterio.open(pred_path) as src:
-        transform = src.transform
-    # Create a temp directory for RGB composites within output_dir
-    rgb_temp_dir = os.path.join(output_dir, 'rgb_temp')
-    os.makedirs(rgb_temp_dir, exist_ok=True)
+    A comparison grid rendered beforehand (e.g. by report_assets) can be
+    passed as grid_path; otherwise it is created here.
+    """
+    os.makedirs(output_dir, exist_ok=True)
     
-    create_2x2_visualization(
-        ref_data, pred_data, diff_data,
-        merged_data_path, transform, grid_path,
-        mask=mask, forest_mask=forest_mask,
-        temp_dir=rgb_temp_dir
-    )
+    if grid_path is None:
+        # Calculate difference for visualization
+        diff_data = pred_data - ref_data
+        
+        # Create comparison grid visualization
+        grid_path = os.path.join(output_dir, 'comparison_grid.jpg')
+        with rasterio.open(pred_path) as src:
+            transform = src.transform
+        # Create a temp directory for RGB composites within output_dir
+        rgb_temp_dir = os.path.join(output_dir, 'rgb_temp')
+        os.makedirs(rgb_temp_dir, exist_ok=True)
+        
+        create_2x2_visualization(
+            ref_data, pred_data, diff_data,
+            merged_data_path, transform, grid_path,
+            mask=mask, forest_mask=forest_mask,
+            temp_dir=rgb_temp_dir
+        )
     
     # Get area if not provided
     if area_ha is None:
@@ -276,7 +360,7 @@ def save_evaluation_to_pdf(pred_path, ref_path, pred_data, ref_data, metrics,
     pdf_path = os.path.join(output_dir, pdf_name)
     
     # Initialize PDF
-    c = canvas.Canvas(pdf_path, pagesize=letter)
+    c = canvas.Canvas(pdf_path, pagesize=letter, pageCompression=1)
     width, height = letter
     
     # First page - Summary information
@@ -370,10 +454,12 @@ def save_evaluation_to_pdf(pred_path, ref_path, pred_data, ref_data, metrics,
     c.setFont("Helvetica", 10)
     y -= 15
     for metric, value in metrics.items():
+        ci = (metric_cis or {}).get(metric)
+        ci_text = f"  ({ci['level']*100:.0f}% CI {ci['lower']:,.3f} to {ci['upper']:,.3f})" if ci else ""
         if metric.endswith('(%)'):
-            c.drawString(70, y, f"{metric}: {value:,.1f}%")
+            c.drawString(70, y, f"{metric}: {value:,.1f}%{ci_text}")
         else:
-            c.drawString(70, y, f"{metric}: {value:,.3f}")
+            c.drawString(70, y, f"{metric}: {value:,.3f}{ci_text}")
         y -= 15
     
     c.showPage()
@@ -515,4 +601,73 @@ def save_evaluation_to_pdf(pred_path, ref_path, pred_data, ref_data, metrics,
     #         print(f"Warning: Could not load feature importance data: {e}")
     
     c.save()
-    return pdf_path
\ No newline at end of file
+    return pdf_path
+
+@traced()
+def save_matrix_report_pdf(table: pd.DataFrame, output_dir: str, title: str = None):
+    """Create a PDF report comparing several predictions against several references."""
+    from reportlab.lib.pagesizes import landscape
+    
+    os.makedirs(output_dir, exist_ok=True)
+    date = datetime.now().strftime("%Y%m%d")
+    pdf_path = os.path.join(output_dir, f"{date}_matrix_{table['prediction'].nunique()}x{table['reference'].nunique()}.pdf")
+    
+    c = canvas.Canvas(pdf_path, pagesize=landscape(letter))
+    width, height = landscape(letter)
+    
+    columns = [
+        ('prediction', 'Prediction', None),
+        ('reference', 'Reference', None),
+        ('N', 'N', '{:,.0f}'),
+        ('RMSE', 'RMSE', '{:.3f}'),
+        ('MAE', 'MAE', '{:.3f}'),
+        ('R2', 'R²', '{:.3f}'),
+        ('Mean Error', 'Bias', '{:.3f}'),
+        ('Within 2m (%)', 'Within 2m', '{:.1f}%'),
+        ('Within 5m (%)', 'Within 5m', '{:.1f}%'),
+    ]
+    col_widths = [170, 150, 70, 55, 55, 55, 55, 65, 65]
+    
+    def draw_header(y):
+        c.setFont("Helvetica-Bold", 16)
+        c.drawString(50, height-50, title or "Canopy Height Model Comparison Matrix")
+        c.setFont("Helvetica", 12)
+        c.drawString(50, height-70, f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}")
+        c.setFont("Helvetica-Bold", 10)
+        x = 50
+        for (_, label, _), col_width in zip(columns, col_widths):
+            c.drawString(x + 3, y, label)
+            x += col_width
+        c.setLineWidth(0.5)
+        c.line(50, y - 4, 50 + sum(col_widths), y - 4)
+        return y - 18
+    
+    # Best RMSE per reference is highlighted in bold
+    best_rows = set(table.groupby('reference')['RMSE'].idxmin().dropna().astype(int))
+    
+    y = draw_header(height - 100)
+    for row_idx, row in table.iterrows():
+        if y < 50:
+            c.showPage()
+            y = draw_header(height - 100)
+        if row_idx % 2 == 0:
+            c.setFillColorRGB(0.95, 0.95, 0.95)
+            c.rect(50, y - 4, sum(col_widths), 14, fill=1, stroke=0)
+            c.setFillColorRGB(0, 0, 0)
+        c.setFont("Helvetica-Bold" if row_idx in best_rows else "Helvetica", 9)
+        x = 50
+        for (key, _, fmt), col_width in zip(columns, col_widths):
+            value = row[key]
+            if fmt is None:
+                text = str(value)[:32]
+            elif pd.isna(value):
+                text = '-'
+            else:
+                text = fmt.format(value)
+            c.drawString(x + 3, y, text)
+            x += col_width
+        y -= 14
+    
+    c.showPage()
+    c.save()
+    return pdf_path
@@ -0,0 +1,241 @@
+"""Live progress telemetry for long-running loops.
+
+Loops report units processed (pixels, points), tiles and bytes read and
+written into named tasks. A background thread periodically rewrites a
+metrics file with throughput, progress and ETA per task, as JSON or in the
+Prometheus text exposition format (chosen by the file extension, .prom or
+.txt for Prometheus), so a dashboard, node_exporter's textfile collector or
+`tail -f`/`watch cat` can follow a run. The file is replaced atomically.
+
+Telemetry is off unless enabled with enable() or the CHM_TELEMETRY
+environment variable (path of the metrics file); when off, task() returns a
+shared no-op task.
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+
+_telemetry = None
+
+
+class _NullTask:
+    """Task used while telemetry is off."""
+
+    def update(self, units: int = 0, tiles: int = 0, bytes_read: int = 0, bytes_written: int = 0):
+        pass
+
+    def finish(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_TASK = _NullTask()
+
+
+class Task:
+    """Progress counters of one loop.
+
+    Args:
+        telemetry: Owning Telemetry
+        name: Task name
+        total: Total units, if known
+        unit: Name of the unit counted (e.g. 'pixels')
+        tiles_total: Total tiles, if known
+    """
+
+    def __init__(self, telemetry, name: str, total: int = None, unit: str = 'pixels', tiles_total: int = None):
+        self.telemetry = telemetry
+        self.name = name
+        self.total = total
+        self.unit = unit
+        self.tiles_total = tiles_total
+        self.done = 0
+        self.tiles = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.start = time.time()
+        self.end = None
+        self._lock = threading.Lock()
+        self._last = (self.start, 0)
+
+    def update(self, units: int = 0, tiles: int = 0, bytes_read: int = 0, bytes_written: int = 0):
+        """Add to the counters."""
+        with self._lock:
+            self.done += int(units)
+            self.tiles += int(tiles)
+            self.bytes_read += int(bytes_read)
+            self.bytes_written += int(bytes_written)
+
+    def finish(self):
+        """Mark the task finished and write the metrics file."""
+        if self.end is None:
+            self.end = time.time()
+            self.telemetry.write()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.finish()
+
+    def snapshot(self) -> dict:
+        """Current counters, rates and ETA."""
+        now = self.end or time.time()
+        with self._lock:
+            done, tiles = self.done, self.tiles
+            bytes_read, bytes_written = self.bytes_read, self.bytes_written
+            last_time, last_done = self._last
+            self._last = (now, done)
+        elapsed = max(now - self.start, 1e-9)
+        rate = done / elapsed
+        recent = (done - last_done) / (now - last_time) if now > last_time else rate
+        remaining = self.total - done if self.total is not None else None
+        if self.end is not None:
+            eta = 0.0
+        elif remaining is not None and rate > 0:
+            eta = remaining / rate
+        else:
+            eta = None
+        return {
+            'task': self.name,
+            'unit': self.unit,
+            'status': 'finished' if self.end is not None else 'running',
+            'done': done,
+            'total': self.total,
+            'remaining': remaining,
+            'fraction': done / self.total if self.total else None,
+            'tiles_done': tiles,
+            'tiles_total': self.tiles_total,
+            'tiles_remaining': self.tiles_total - tiles if self.tiles_total is not None else None,
+            'elapsed_seconds': elapsed,
+            'rate_per_second': rate,
+            'recent_rate_per_second': recent,
+            'eta_seconds': eta,
+            'bytes_read': bytes_read,
+            'bytes_written': bytes_written,
+            'read_bytes_per_second': bytes_read / elapsed,
+            'write_bytes_per_second': bytes_written / elapsed,
+        }
+
+
+def prometheus_text(snapshots: list, prefix: str = 'chm') -> str:
+    """Format task snapshots in the Prometheus text exposition format."""
+    metrics = ['done', 'total', 'remaining', 'fraction', 'tiles_done', 'tiles_total', 'tiles_remaining',
+               'elapsed_seconds', 'rate_per_second', 'recent_rate_per_second', 'eta_seconds',
+               'bytes_read', 'bytes_written', 'read_bytes_per_second', 'write_bytes_per_second']
+    lines = []
+    for metric in metrics:
+        name = f'{prefix}_task_{metric}'
+        lines.append(f'# TYPE {name} gauge')
+        for snap in snapshots:
+            if snap[metric] is not None:
+                lines.append(f'{name}{{task="{snap["task"]}",unit="{snap["unit"]}"}} {float(snap[metric]):.6g}')
+    name = f'{prefix}_task_running'
+    lines.append(f'# TYPE {name} gauge')
+    for snap in snapshots:
+        lines.append(f'{name}{{task="{snap["task"]}",unit="{snap["unit"]}"}} {int(snap["status"] == "running")}')
+    return '\n'.join(lines) + '\n'
+
+
+class Telemetry:
+    """Registry of tasks with a periodically written metrics file.
+
+    Args:
+        path: Metrics file
+        fmt: 'json' or 'prometheus' (default: from the extension of path)
+        interval: Seconds between writes
+    """
+
+    def __init__(self, path: str, fmt: str = None, interval: float = 5.0):
+        if fmt is None:
+            fmt = 'prometheus' if os.path.splitext(path)[1] in ('.prom', '.txt') else 'json'
+        if fmt not in ('json', 'prometheus'):
+            raise ValueError(f"Unknown telemetry format: {fmt}")
+        self.path = path
+        self.fmt = fmt
+        self.interval = interval
+        self.tasks = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='telemetry', daemon=True)
+        self._thread.start()
+
+    def task(self, name: str, total: int = None, unit: str = 'pixels', tiles_total: int = None) -> Task:
+        task = Task(self, name, total, unit, tiles_total)
+        with self._lock:
+            self.tasks.append(task)
+        return task
+
+    def snapshots(self) -> list:
+        with self._lock:
+            tasks = list(self.tasks)
+        return [task.snapshot() for task in tasks]
+
+    def write(self) -> str:
+        """Rewrite the metrics file atomically; returns its path."""
+        snapshots = self.snapshots()
+        if self.fmt == 'prometheus':
+            text = prometheus_text(snapshots)
+        else:
+            text = json.dumps({'updated': time.time(), 'tasks': snapshots}, indent=2)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, self.path)
+        return self.path
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                print(f"Warning: could not write telemetry to {self.path}: {e}")
+
+    def close(self):
+        """Stop the writer thread and write the final metrics."""
+        self._stop.set()
+        self._thread.join()
+        self.write()
+
+
+def enable(path: str, fmt: str = None, interval: float = 5.0) -> Telemetry:
+    """Start writing telemetry to path; returns the active Telemetry."""
+    global _telemetry
+    if _telemetry is None:
+        _telemetry = Telemetry(path, fmt, interval)
+        atexit.register(disable)
+    return _telemetry
+
+
+def disable():
+    """Stop telemetry after a final write."""
+    global _telemetry
+    telemetry, _telemetry = _telemetry, None
+    if telemetry is not None:
+        telemetry.close()
+
+
+def enabled() -> bool:
+    return _telemetry is not None
+
+
+def task(name: str, total: int = None, unit: str = 'pixels', tiles_total: int = None):
+    """Register a progress task, or return a no-op task while telemetry is off."""
+    if _telemetry is None:
+        return _NULL_TASK
+    return _telemetry.task(name, total, unit, tiles_total)
+
+
+if os.environ.get('CHM_TELEMETRY'):
+    enable(os.environ['CHM_TELEMETRY'], interval=float(os.environ.get('CHM_TELEMETRY_INTERVAL', 5.0)))
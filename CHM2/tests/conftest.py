@@ -0,0 +1,26 @@
+"""Shared fixtures: the fake Earth Engine backend patched into the pipeline modules."""
+
+import importlib
+import pytest
+
+from tests.fake_ee import FakeEE
+
+# Modules that use ee and are patched with the fake backend
+EE_MODULES = ['chm_main', 'ee_batch', 'export_planner', 'for_forest_masking', 'l2a_gedi_source',
+              'sentinel1_source', 'sentinel2_source', 'alos2_source', 'canopyht_source']
+
+
+@pytest.fixture
+def install_fake_ee(monkeypatch):
+    """Function replacing ee in EE_MODULES with a fake backend (default FakeEE()); returns the fake."""
+    def install(fake: FakeEE = None) -> FakeEE:
+        fake = fake or FakeEE()
+        for name in EE_MODULES:
+            monkeypatch.setattr(importlib.import_module(name), 'ee', fake)
+        return fake
+    return install
+
+
+@pytest.fixture
+def fake_ee(install_fake_ee):
+    return install_fake_ee(FakeEE(values={'size': 4}))
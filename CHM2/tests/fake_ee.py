@@ -0,0 +1,139 @@
+"""Local stand-in for the earthengine-api that counts getInfo round trips.
+
+Every attribute access and call on the fake returns a FakeObject recording
+its call chain, so pipeline code runs without credentials. getInfo() counts
+one round trip and resolves the object by the last method in its chain
+('size', 'get', 'propertyNames', ...) from FakeEE.values; an ee.Dictionary
+resolves all nested values in the same trip, like the real API. serialize()
+returns the call chain with its arguments, so equal expressions serialize
+equally. A value may be a function of the arguments of that last call,
+e.g. {'toList': lambda count, offset=0: features[offset:offset + count]}.
+
+    fake = FakeEE(values={'size': 3})
+    monkeypatch.setattr(module, 'ee', fake)
+    ...
+    assert fake.round_trips == 1
+"""
+
+DEFAULT_VALUES = {
+    'size': 3,
+    'get': 1234.4,
+    'propertyNames': ['system:index', 'rh', 'B2', 'longitude', 'latitude'],
+}
+
+
+class FakeObject:
+    """Lazy server-side object; records the chain of calls that built it."""
+
+    def __init__(self, backend, path, value=None, args=None):
+        self._backend = backend
+        self._path = path
+        self._value = value
+        self._args = args
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return FakeObject(self._backend, self._path + (name,))
+
+    def __call__(self, *args, **kwargs):
+        name = self._path[-1] if self._path else ''
+        call = f'({_serialize(args)}, {_serialize(kwargs)})'
+        if name == 'Dictionary' and args:
+            return FakeObject(self._backend, self._path + (call,), value=args[0])
+        return FakeObject(self._backend, self._path + (call,), args=(args, kwargs))
+
+    @property
+    def methods(self) -> list:
+        return [p for p in self._path if not p.startswith('(')]
+
+    def getInfo(self):
+        self._backend.round_trips += 1
+        self._backend.requests.append('.'.join(self.methods))
+        return self._backend.evaluate(self)
+
+    def serialize(self) -> str:
+        return '.'.join(self._path)
+
+    def __repr__(self):
+        return f'FakeObject({self.serialize()})'
+
+
+def _serialize(value) -> str:
+    if isinstance(value, FakeObject):
+        return value.serialize()
+    if isinstance(value, dict):
+        return '{' + ', '.join(f'{k!r}: {_serialize(v)}' for k, v in sorted(value.items())) + '}'
+    if isinstance(value, (list, tuple)):
+        return '[' + ', '.join(_serialize(v) for v in value) + ']'
+    if callable(value):
+        return getattr(value, '__qualname__', 'function')
+    return repr(value)
+
+
+class FakeEE(FakeObject):
+    """The fake ee module: counts round trips and the objects they fetched."""
+
+    def __init__(self, values: dict = None):
+        super().__init__(self, ())
+        self.values = {**DEFAULT_VALUES, **(values or {})}
+        self.round_trips = 0
+        self.requests = []
+
+    def evaluate(self, obj):
+        """Client-side value of a fake object (recursing into dictionaries)."""
+        if isinstance(obj, dict):
+            return {key: self.evaluate(value) for key, value in obj.items()}
+        if not isinstance(obj, FakeObject):
+            return obj
+        if obj._value is not None:
+            return self.evaluate(obj._value)
+        methods = obj.methods
+        value = self.values.get(methods[-1] if methods else None)
+        if callable(value):
+            args, kwargs = obj._args or ((), {})
+            return value(*args, **kwargs)
+        return value
+
+
+class FakeTaskBackend:
+    """Export task backend (see export_tasks) whose tasks advance one state per status poll.
+
+    Tasks go through states (default READY, RUNNING, COMPLETED); scripts
+    gives other sequences by task description (or task id for tasks without
+    one), e.g. {'stack': ['FAILED']}.
+    The first fail_starts starts raise, like a full Earth Engine task queue.
+    Share one instance between managers to simulate a restart.
+    """
+
+    def __init__(self, states=('READY', 'RUNNING', 'COMPLETED'), scripts: dict = None, fail_starts: int = 0):
+        self.states = list(states)
+        self.scripts = scripts or {}
+        self.fail_starts = fail_starts
+        self.tasks = {}
+        self.started = []
+        self.status_calls = 0
+        self.max_running = 0
+
+    def start(self, task) -> str:
+        if self.fail_starts:
+            self.fail_starts -= 1
+            raise RuntimeError('Too many tasks already in the queue')
+        name = getattr(task, 'description', None)
+        task_id = f'T{len(self.started) + 1}'
+        name = name if isinstance(name, str) else task_id
+        self.started.append(name)
+        self.tasks[task_id] = list(self.scripts.get(name, self.states))
+        return task_id
+
+    def status(self, task_ids: list) -> dict:
+        self.status_calls += 1
+        result = {}
+        for task_id in task_ids:
+            states = self.tasks[task_id]
+            state = states.pop(0) if len(states) > 1 else states[0]
+            result[task_id] = {'id': task_id, 'state': state,
+                               'error_message': 'Export failed' if state == 'FAILED' else None}
+        running = sum(1 for s in result.values() if s['state'] in ('READY', 'RUNNING'))
+        self.max_running = max(self.max_running, running)
+        return result
@@ -0,0 +1,105 @@
+"""Unit tests for artifact_catalog module."""
+
+import json
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+import artifact_catalog
+from artifact_catalog import ArtifactCatalog, file_bounds, register_artifact
+from utils import get_latest_file
+
+
+def write_raster(path, west, north):
+    with rasterio.open(path, 'w', driver='GTiff', dtype='float32', width=10, height=10, count=1,
+                       crs='EPSG:4326', transform=from_origin(west, north, 0.01, 0.01)) as dst:
+        dst.write(np.ones((1, 10, 10), dtype='float32'))
+
+
+@pytest.fixture
+def output_dir(tmp_path):
+    write_raster(tmp_path / 'stack_alps.tif', 10.0, 46.0)
+    write_raster(tmp_path / 'stack_coast.tif', -5.0, 44.0)
+    pd.DataFrame({'longitude': [10.02, 10.05], 'latitude': [45.95, 45.92], 'rh': [10, 20]}).to_csv(
+        tmp_path / 'training_data_alps.csv', index=False)
+    os.utime(tmp_path / 'stack_alps.tif', (1000, 1000))
+    os.utime(tmp_path / 'stack_coast.tif', (2000, 2000))
+    return tmp_path
+
+
+def test_file_bounds(output_dir, tmp_path):
+    """Bounds come from rasters, point CSVs and GeoJSON."""
+    assert file_bounds(str(output_dir / 'stack_alps.tif')) == pytest.approx((10.0, 45.9, 10.1, 46.0))
+    assert file_bounds(str(output_dir / 'training_data_alps.csv')) == pytest.approx((10.02, 45.92, 10.05, 45.95))
+    aoi = tmp_path / 'aoi.geojson'
+    aoi.write_text(json.dumps({'type': 'FeatureCollection', 'features': [{'type': 'Feature', 'geometry': {
+        'type': 'Polygon', 'coordinates': [[[10.0, 45.9], [10.1, 45.9], [10.1, 46.0], [10.0, 45.9]]]}}]}))
+    assert file_bounds(str(aoi)) == (10.0, 45.9, 10.1, 46.0)
+    assert file_bounds(str(output_dir / 'missing.txt')) is None
+
+
+def test_latest_by_prefix_bounds_and_params(output_dir):
+    """Lookups filter by name prefix, bounding box and registered parameters."""
+    with ArtifactCatalog(str(output_dir)) as catalog:
+        assert catalog.sync() == 3
+        assert catalog.latest('stack') == str(output_dir / 'stack_coast.tif')
+        training_bounds = catalog.bounds(str(output_dir / 'training_data_alps.csv'))
+        assert catalog.latest('stack', bounds=training_bounds) == str(output_dir / 'stack_alps.tif')
+        assert catalog.latest('predictCH') is None
+
+        catalog.register(str(output_dir / 'stack_alps.tif'), params={'scale': 10, 'year': 2022})
+        assert catalog.latest('stack', params={'scale': 10}) == str(output_dir / 'stack_alps.tif')
+        assert catalog.latest('stack', params={'scale': 30}) is None
+
+        # Re-syncing keeps parameters of unchanged files and drops removed files
+        assert catalog.sync() == 0
+        assert catalog.find('stack_alps')[0]['params'] == {'scale': 10, 'year': 2022}
+        os.remove(output_dir / 'stack_coast.tif')
+        catalog.sync()
+        assert [r['name'] for r in catalog.find('stack')] == ['stack_alps.tif']
+
+
+def test_get_latest_file_queries_catalog_without_hashing(output_dir, monkeypatch):
+    """Lookups query the catalog, registering only new files of the prefix; syncing is opt-in."""
+    # Without a catalog, name lookups scan the directory
+    assert get_latest_file(str(output_dir), 'stack') == str(output_dir / 'stack_coast.tif')
+    assert not os.path.exists(output_dir / '.artifacts.sqlite')
+
+    # Bounds lookups register the files of the prefix, not the rest of the directory
+    alps_bounds = (10.02, 45.92, 10.05, 45.95)
+    assert get_latest_file(str(output_dir), 'stack', bounds=alps_bounds) == str(output_dir / 'stack_alps.tif')
+    with ArtifactCatalog(str(output_dir)) as catalog:
+        assert [r['name'] for r in catalog.find()] == ['stack_coast.tif', 'stack_alps.tif']
+
+    def no_hashing(path, *args):
+        raise AssertionError(f'lookup hashed {path}')
+
+    write_raster(output_dir / 'stack_alps_v2.tif', 10.0, 46.0)
+    register_artifact(str(output_dir / 'stack_alps_v2.tif'), params={'scale': 10})
+    monkeypatch.setattr(artifact_catalog, 'file_hash', no_hashing)
+    assert get_latest_file(str(output_dir), 'stack', bounds=alps_bounds) == str(output_dir / 'stack_alps_v2.tif')
+    assert get_latest_file(str(output_dir), 'stack', params={'scale': 10}) == str(output_dir / 'stack_alps_v2.tif')
+
+    # Removed files are skipped until the next sync drops them
+    os.remove(output_dir / 'stack_alps_v2.tif')
+    assert get_latest_file(str(output_dir), 'stack', bounds=alps_bounds) == str(output_dir / 'stack_alps.tif')
+    with pytest.raises(FileNotFoundError):
+        get_latest_file(str(output_dir), 'predictCH')
+    assert get_latest_file(str(output_dir), 'predictCH', required=False) is None
+
+
+def test_get_latest_file_finds_newer_file_copied_by_hand(output_dir):
+    """A newer file copied into the directory wins over the older registered one."""
+    register_artifact(str(output_dir / 'stack_alps.tif'))
+    os.utime(output_dir / 'stack_coast.tif', (500, 500))
+    assert get_latest_file(str(output_dir), 'stack') == str(output_dir / 'stack_alps.tif')
+
+    write_raster(output_dir / 'stack_new.tif', 10.0, 46.0)
+    assert get_latest_file(str(output_dir), 'stack') == str(output_dir / 'stack_new.tif')
+    assert get_latest_file(str(output_dir), 'stack', bounds=(10.02, 45.92, 10.05, 45.95)) == \
+        str(output_dir / 'stack_new.tif')
+    with ArtifactCatalog(str(output_dir)) as catalog:
+        assert catalog.record(str(output_dir / 'stack_new.tif')) is not None
@@ -0,0 +1,97 @@
+"""Unit tests for batch_runner module."""
+
+import json
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from batch_runner import THREAD_ENV_VARS, split_aois, limit_resources, run_batch
+
+
+def polygon(west, south, size=0.1):
+    return {'type': 'Polygon', 'coordinates': [[[west, south], [west + size, south], [west + size, south + size],
+                                                [west, south + size], [west, south]]]}
+
+
+@pytest.fixture
+def aoi_file(tmp_path):
+    path = tmp_path / 'units.geojson'
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {'name': 'Unit A'}, 'geometry': polygon(10.0, 45.9)},
+        {'type': 'Feature', 'properties': {}, 'geometry': polygon(11.0, 45.9)},
+    ]}))
+    return path
+
+
+def test_split_aois_feature_collection(aoi_file, tmp_path):
+    """Each feature becomes a single-feature GeoJSON named after its properties."""
+    jobs = split_aois(str(aoi_file), str(tmp_path / 'batch'))
+    assert [job['name'] for job in jobs] == ['Unit_A', 'aoi_0001']
+    with open(jobs[1]['aoi']) as f:
+        data = json.load(f)
+    assert len(data['features']) == 1
+    assert data['features'][0]['geometry'] == polygon(11.0, 45.9)
+
+
+def test_split_aois_directory(tmp_path):
+    aoi_dir = tmp_path / 'aois'
+    aoi_dir.mkdir()
+    for name in ['north', 'south']:
+        (aoi_dir / f'{name}.geojson').write_text(json.dumps(polygon(10.0, 45.9)))
+    jobs = split_aois(str(aoi_dir), str(tmp_path / 'batch'))
+    assert [job['name'] for job in jobs] == ['north', 'south']
+    assert jobs[0]['aoi'] == str(aoi_dir / 'north.geojson')
+
+    # Files sharing a name still get their own output directories
+    (aoi_dir / 'north.json').write_text(json.dumps(polygon(10.0, 45.9)))
+    jobs = split_aois(str(aoi_dir), str(tmp_path / 'batch'))
+    assert [job['name'] for job in jobs] == ['north', 'north_0001', 'south']
+
+
+def test_split_aois_names_are_never_empty_or_shared(tmp_path):
+    path = tmp_path / 'units.geojson'
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'id': '***', 'properties': {}, 'geometry': polygon(10.0, 45.9)},
+        {'type': 'Feature', 'id': 'a', 'properties': {}, 'geometry': polygon(11.0, 45.9)},
+        {'type': 'Feature', 'id': 'a', 'properties': {}, 'geometry': polygon(12.0, 45.9)},
+    ]}))
+    jobs = split_aois(str(path), str(tmp_path / 'batch'))
+    assert [job['name'] for job in jobs] == ['aoi_0000', 'a', 'a_0002']
+
+
+def test_limit_resources_sets_thread_variables(monkeypatch):
+    # Registered with monkeypatch so the original environment is restored afterwards
+    for var in THREAD_ENV_VARS:
+        monkeypatch.setenv(var, '8')
+    limit_resources(threads=3)
+    assert all(os.environ[var] == '3' for var in THREAD_ENV_VARS)
+
+
+def test_run_batch_continues_past_failures(aoi_file, tmp_path):
+    """A failing AOI is recorded in the status table and the others still run."""
+    batch_dir = tmp_path / 'batch'
+    unit_dir = batch_dir / 'Unit_A'
+    unit_dir.mkdir(parents=True)
+    pd.DataFrame({'longitude': [10.02, 10.05, 10.08], 'latitude': [45.95, 45.92, 45.97],
+                  'rh': [10.0, 20.0, 15.0]}).to_csv(unit_dir / 'training_data_unit.csv', index=False)
+    reference = tmp_path / 'reference.tif'
+    with rasterio.open(reference, 'w', driver='GTiff', dtype='float32', width=20, height=20, count=1,
+                       crs='EPSG:4326', transform=from_origin(10.0, 46.0, 0.01, 0.01)) as dst:
+        dst.write(np.full((1, 20, 20), 12.0, dtype='float32'))
+
+    records = run_batch(str(aoi_file), str(batch_dir), stage='height_analysis', max_workers=2,
+                        threads=1, reference=str(reference), sync=True)
+    by_name = {r['name']: r for r in records}
+    assert by_name['Unit_A']['status'] == 'done'
+    assert by_name['Unit_A']['stages'] == {'height_analysis': 'done'}
+    assert (unit_dir / 'trainingData_with_heights.csv').exists()
+    assert by_name['aoi_0001']['status'] == 'failed'
+    assert 'height_analysis' in by_name['aoi_0001']['error']
+
+    status = pd.read_csv(batch_dir / 'batch_status.csv')
+    assert sorted(status['name']) == ['Unit_A', 'aoi_0001']
+    assert set(status['status']) == {'done', 'failed'}
+    assert 'stage_height_analysis' in status.columns
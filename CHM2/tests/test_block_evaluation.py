@@ -0,0 +1,150 @@
+"""Unit tests for block_metrics and block_evaluation modules."""
+
+import unittest
+import numpy as np
+import os
+import tempfile
+import shutil
+import rasterio
+from rasterio.transform import from_origin
+
+from evaluate_predictions import calculate_metrics
+from block_metrics import block_sums, grouped_sums, merge_sums, metrics_from_sums, valid_pixel_mask
+from block_evaluation import evaluate_matrix, evaluate_stratified, write_tile_metrics_raster
+from save_evaluation_pdf import save_matrix_report_pdf
+
+
+class TestBlockMetrics(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.ref = rng.uniform(0, 35, 5000)
+        self.pred = np.clip(self.ref + rng.normal(0, 3, 5000), 0, 35)
+
+    def assertMetricsEqual(self, expected, actual):
+        for key, value in expected.items():
+            self.assertAlmostEqual(value, actual[key], places=6, msg=key)
+
+    def test_metrics_from_sums_matches_calculate_metrics(self):
+        """Accumulated metrics equal the direct computation."""
+        expected = calculate_metrics(self.pred, self.ref)
+        self.assertMetricsEqual(expected, metrics_from_sums(block_sums(self.pred, self.ref)))
+
+    def test_merge_sums(self):
+        """Merging partial accumulators equals accumulating everything at once."""
+        sums = block_sums(self.pred[:1234], self.ref[:1234])
+        merge_sums(sums, block_sums(self.pred[1234:], self.ref[1234:]))
+        self.assertMetricsEqual(calculate_metrics(self.pred, self.ref), metrics_from_sums(sums))
+
+    def test_grouped_sums(self):
+        """Grouped accumulation matches per-group computation."""
+        labels = (self.ref // 10).astype(int)
+        sums = grouped_sums(self.pred, self.ref, labels, 5)
+        metrics = metrics_from_sums(sums)
+        for group in range(4):
+            sel = labels == group
+            expected = calculate_metrics(self.pred[sel], self.ref[sel])
+            self.assertAlmostEqual(metrics['RMSE'][group], expected['RMSE'], places=6)
+            self.assertAlmostEqual(metrics['Max Absolute Error'][group], expected['Max Absolute Error'])
+        # Empty group yields NaN
+        self.assertTrue(np.isnan(metrics['RMSE'][4]))
+
+    def test_valid_pixel_mask(self):
+        """Heights outside 0-35m, NaN and -32767 are excluded."""
+        pred = np.array([1.0, 40.0, 5.0, np.nan, 3.0])
+        ref = np.array([1.0, 2.0, -32767, 4.0, 3.0])
+        np.testing.assert_array_equal(valid_pixel_mask(pred, ref), [True, False, False, False, True])
+
+
+class TestEvaluateMatrix(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Create temporary rasters on a shared grid."""
+        cls.temp_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(1)
+        profile = {
+            'driver': 'GTiff',
+            'dtype': 'float32',
+            'nodata': -9999,
+            'width': 60,
+            'height': 50,
+            'count': 1,
+            'crs': 'EPSG:4326',
+            'transform': from_origin(10.0, 50.0, 0.001, 0.001)
+        }
+        cls.arrays = {}
+        base = rng.uniform(0, 35, (50, 60)).astype('float32')
+        for name, noise in [('ref_a', 0), ('ref_b', 1), ('pred_rf', 2), ('pred_mlp', 3)]:
+            data = np.clip(base + rng.normal(0, noise, base.shape), 0, 40).astype('float32')
+            data[:2, :] = -9999
+            cls.arrays[name] = data
+            with rasterio.open(os.path.join(cls.temp_dir, f'{name}.tif'), 'w', **profile) as dst:
+                dst.write(data, 1)
+        cls.forest = rng.choice([0, 1], size=base.shape, p=[0.3, 0.7]).astype('float32')
+        cls.forest_path = os.path.join(cls.temp_dir, 'forest.tif')
+        with rasterio.open(cls.forest_path, 'w', **profile) as dst:
+            dst.write(cls.forest, 1)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up temporary files."""
+        shutil.rmtree(cls.temp_dir)
+
+    def path(self, name):
+        return os.path.join(self.temp_dir, f'{name}.tif')
+
+    def test_evaluate_matrix(self):
+        """Every pair matches a direct evaluation, regardless of block size."""
+        preds, refs = ['pred_rf', 'pred_mlp'], ['ref_a', 'ref_b']
+        table = evaluate_matrix([self.path(p) for p in preds], [self.path(r) for r in refs],
+                                self.forest_path, block_size=16)
+        self.assertEqual(len(table), 4)
+        for _, row in table.iterrows():
+            pred, ref = self.arrays[row['prediction']], self.arrays[row['reference']]
+            mask = valid_pixel_mask(pred, ref) & (self.forest > 0)
+            expected = calculate_metrics(pred[mask], ref[mask])
+            self.assertEqual(row['N'], mask.sum())
+            self.assertAlmostEqual(row['RMSE'], expected['RMSE'], places=4)
+            self.assertAlmostEqual(row['R2'], expected['R2'], places=4)
+
+    def test_evaluate_stratified(self):
+        """Strata and tiles match direct per-group computation."""
+        pred, ref = self.arrays['pred_rf'], self.arrays['ref_a']
+        table, tiles, tile_transform, crs = evaluate_stratified(
+            self.path('pred_rf'), self.path('ref_a'), self.forest_path,
+            height_bins=[0, 10, 20, 35], tile_size_m=2000, block_size=16)
+
+        valid = valid_pixel_mask(pred, ref)
+        forest_valid = valid & (self.forest > 0)
+        heights = table[table['stratum_type'] == 'height_class'].set_index('stratum')
+        sel = forest_valid & (ref >= 10) & (ref < 20)
+        self.assertEqual(heights.loc['10-20 m', 'N'], sel.sum())
+        self.assertAlmostEqual(heights.loc['10-20 m', 'RMSE'],
+                               calculate_metrics(pred[sel], ref[sel])['RMSE'], places=4)
+
+        classes = table[table['stratum_type'] == 'mask_class'].set_index('stratum')
+        self.assertEqual(classes.loc['0', 'N'] + classes.loc['1', 'N'], valid.sum())
+
+        # Pixels are ~111 m tall at this latitude, so 2 km tiles span 18 pixels
+        tile_px = round(tile_transform.a / 0.001)
+        self.assertEqual(tiles['RMSE'].shape, (int(np.ceil(50 / tile_px)), int(np.ceil(60 / tile_px))))
+        block = forest_valid[:tile_px, :tile_px]
+        expected = calculate_metrics(pred[:tile_px, :tile_px][block], ref[:tile_px, :tile_px][block])
+        self.assertAlmostEqual(tiles['RMSE'][0, 0], expected['RMSE'], places=4)
+        self.assertEqual(tiles['N'].sum(), forest_valid.sum())
+
+        raster_path = write_tile_metrics_raster(os.path.join(self.temp_dir, 'tiles.tif'),
+                                                tiles, tile_transform, crs)
+        with rasterio.open(raster_path) as src:
+            self.assertEqual(src.count, 4)
+            self.assertEqual(src.descriptions[0], 'RMSE')
+
+    def test_save_matrix_report_pdf(self):
+        """Comparison report is written."""
+        table = evaluate_matrix([self.path('pred_rf')], [self.path('ref_a'), self.path('ref_b')])
+        pdf_path = save_matrix_report_pdf(table, os.path.join(self.temp_dir, 'report'))
+        self.assertTrue(os.path.exists(pdf_path))
+        self.assertGreater(os.path.getsize(pdf_path), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+"""Unit tests for bootstrap_metrics module."""
+
+import json
+import numpy as np
+import pytest
+
+from block_metrics import block_sums, metrics_from_sums
+from bootstrap_metrics import spatial_block_sums, bootstrap_metrics, confidence_intervals
+from evaluate_predictions import calculate_metrics, save_metrics_json
+
+
+@pytest.fixture
+def arrays():
+    rng = np.random.default_rng(0)
+    ref = rng.uniform(0, 35, (120, 90))
+    pred = np.clip(ref + rng.normal(0.5, 2, ref.shape), 0, 35)
+    mask = rng.random(ref.shape) > 0.2
+    return pred, ref, mask
+
+
+def test_spatial_block_sums(arrays):
+    """Block accumulators add up to the accumulator of all valid pixels."""
+    pred, ref, mask = arrays
+    sums = spatial_block_sums(pred, ref, mask, block_size=25)
+    assert len(sums) == 5 * 4
+    total = metrics_from_sums(np.concatenate([sums[:, :-1].sum(axis=0), [sums[:, -1].max()]]))
+    expected = calculate_metrics(pred[mask], ref[mask])
+    for metric in ['RMSE', 'MAE', 'R2', 'Max Absolute Error']:
+        assert total[metric] == pytest.approx(expected[metric])
+
+
+def test_bootstrap_confidence_intervals(arrays):
+    """Intervals bracket the point estimates and are reproducible across worker counts."""
+    pred, ref, mask = arrays
+    sums = spatial_block_sums(pred, ref, mask, block_size=10)
+    replicates = bootstrap_metrics(sums, n_replicates=300, seed=1, n_workers=1, chunk_size=64)
+    assert len(replicates['RMSE']) == 300
+
+    intervals = confidence_intervals(replicates)
+    point = calculate_metrics(pred[mask], ref[mask])
+    for metric in ['RMSE', 'MAE', 'R2', 'Mean Error']:
+        assert intervals[metric]['lower'] <= point[metric] <= intervals[metric]['upper']
+        assert intervals[metric]['level'] == 0.95
+
+    parallel = bootstrap_metrics(sums, n_replicates=300, seed=1, n_workers=2, chunk_size=64)
+    np.testing.assert_allclose(parallel['RMSE'], replicates['RMSE'])
+
+
+def test_bootstrap_single_block():
+    """A single block gives a degenerate interval at the point estimate."""
+    pred = np.array([1.0, 2.0, 3.0, 4.0])
+    ref = np.array([1.5, 2.5, 2.0, 5.0])
+    replicates = bootstrap_metrics(block_sums(pred, ref)[None, :], n_replicates=10, n_workers=1)
+    np.testing.assert_allclose(replicates['RMSE'], calculate_metrics(pred, ref)['RMSE'])
+
+    with pytest.raises(ValueError):
+        bootstrap_metrics(np.empty((0, 12)), n_replicates=10)
+
+
+def test_save_metrics_json(tmp_path):
+    """Metrics JSON holds point estimates and intervals."""
+    metrics = {'RMSE': np.float64(2.5), 'R2': 0.8}
+    cis = {'RMSE': {'lower': 2.4, 'upper': 2.6, 'level': 0.95}}
+    path = save_metrics_json(metrics, str(tmp_path), metric_cis=cis, bootstrap_info={'replicates': 100})
+    with open(path) as f:
+        data = json.load(f)
+    assert data['metrics']['RMSE'] == 2.5
+    assert data['confidence_intervals']['RMSE']['upper'] == 2.6
+    assert data['bootstrap']['replicates'] == 100
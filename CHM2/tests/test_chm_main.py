@@ -131,7 +131,6 @@ class TestCHMMain(unittest.TestCase):
             ]
         }
         mock_fc = MagicMock()
-        mock_fc.getInfo.return_value = mock_features
         
         # Create output directory
         os.makedirs(self.test_dir, exist_ok=True)
@@ -149,7 +148,8 @@ class TestCHMMain(unittest.TestCase):
                 }
             ]
         }
-        mock_fc.getInfo.return_value = mock_features
+        mock_fc.size.return_value.getInfo.return_value = 2
+        mock_fc.toList.return_value.getInfo.return_value = mock_features['features']
         
         # Test export
         output_path = export_training_data(mock_fc, self.test_dir)
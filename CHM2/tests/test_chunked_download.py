@@ -0,0 +1,215 @@
+"""Unit tests for chunked_download module, against a local HTTP server standing in for Earth Engine."""
+
+import json
+import os
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+
+import chunked_download
+from artifact_catalog import ArtifactCatalog
+from chunked_download import DOWNLOAD_MAX_BYTES, ChunkError, download_image, sample_bytes
+from export_planner import plan_export
+
+BOUNDS = (9.0, 45.0, 9.02, 45.015)  # about 160 x 170 pixels at 10 m
+BANDS = 3
+
+
+def pixel_values(xs, ys, band):
+    """Synthetic band values as a function of map coordinates, so every chunk can be checked."""
+    return ((xs - 500000) * 0.01 + (ys - 4980000) * 0.001 + band).astype('float32')
+
+
+def chunk_bytes(params: dict) -> bytes:
+    scale, _, left, _, _, top = json.loads(params['crs_transform'])
+    width, height = map(int, params['dimensions'].split('x'))
+    cols, rows = np.meshgrid(np.arange(width), np.arange(height))
+    xs, ys = left + (cols + 0.5) * scale, top - (rows + 0.5) * scale
+    with MemoryFile() as memfile:
+        with memfile.open(driver='GTiff', width=width, height=height, count=BANDS, dtype='float32',
+                          crs=params['crs'], transform=from_origin(left, top, scale, scale)) as dst:
+            dst.write(np.stack([pixel_values(xs, ys, b) for b in range(BANDS)]))
+        return memfile.read()
+
+
+class FakeDownloadServer:
+    """HTTP server producing GeoTIFF chunks; failures[name] lists the behaviour of successive requests."""
+
+    def __init__(self, failures: dict = None):
+        self.failures = {name: list(f) for name, f in (failures or {}).items()}
+        self.requests = []
+        self.active = self.max_active = 0
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                params = dict(urllib.parse.parse_qsl(urllib.parse.urlparse(self.path).query))
+                with server.lock:
+                    server.requests.append(params['name'])
+                    server.active += 1
+                    server.max_active = max(server.max_active, server.active)
+                    pending = server.failures.get(params['name'])
+                    behaviour = pending.pop(0) if pending else 'ok'
+                try:
+                    if behaviour in ('500', '429', '400'):
+                        self.send_error(int(behaviour))
+                        return
+                    body = chunk_bytes(params)
+                    if behaviour == 'corrupt':
+                        body = b'<html>quota exceeded</html>'.ljust(len(body))
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'image/tiff')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body[:len(body) // 2] if behaviour == 'truncate' else body)
+                finally:
+                    with server.lock:
+                        server.active -= 1
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.httpd.server_address[1]}/download'
+
+
+class FakeImage:
+    """Stands in for ee.Image: getDownloadURL points at the local server."""
+
+    def __init__(self, server):
+        self.server = server
+
+    def getDownloadURL(self, params):
+        query = {**params, 'crs_transform': json.dumps(params['crs_transform'])}
+        return f'{self.server.url}?{urllib.parse.urlencode(query)}'
+
+
+class BusyImage(FakeImage):
+    """getDownloadURL raises a server error the first time for each chunk in busy."""
+
+    def __init__(self, server, busy):
+        super().__init__(server)
+        self.busy = set(busy)
+        self.calls = []
+
+    def getDownloadURL(self, params):
+        self.calls.append(params['name'])
+        if params['name'] in self.busy:
+            self.busy.discard(params['name'])
+            raise RuntimeError('Too many concurrent aggregations.')  # ee.EEException in practice
+        return super().getDownloadURL(params)
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(chunked_download.time, 'sleep', lambda s: None)
+
+
+def small_chunks():
+    # About 40 kB per chunk: 60 x 60 pixels of 3 float32 bands
+    return {'max_bytes': 60 * 60 * BANDS * 4}
+
+
+def check_output(path):
+    plan = plan_export(BOUNDS, 10, BANDS)
+    scale, _, left, _, _, top = plan['transform']
+    cols, rows = np.meshgrid(np.arange(plan['width']), np.arange(plan['height']))
+    xs, ys = left + (cols + 0.5) * scale, top - (rows + 0.5) * scale
+    with rasterio.open(path) as src:
+        assert (src.width, src.height, src.count) == (plan['width'], plan['height'], BANDS)
+        assert src.crs.to_string() == plan['crs']
+        for band in range(BANDS):
+            np.testing.assert_allclose(src.read(band + 1), pixel_values(xs, ys, band))
+
+
+def test_parallel_download_assembles_chunks(tmp_path):
+    with FakeDownloadServer() as server:
+        output = download_image(FakeImage(server), BOUNDS, str(tmp_path / 'stack.tif'), 10, BANDS, workers=3,
+                                **small_chunks())
+    n_chunks = len(plan_export(BOUNDS, 10, BANDS, **small_chunks())['tiles'])
+    assert n_chunks == 9
+    assert sorted(server.requests) == sorted(set(server.requests)) and len(server.requests) == n_chunks
+    assert 1 < server.max_active <= 3
+    check_output(output)
+    assert sorted(os.listdir(tmp_path)) == ['.artifacts.sqlite', 'stack.tif']
+    with ArtifactCatalog(str(tmp_path)) as catalog:
+        assert catalog.latest('stack', params={'stage': 'download'}) == output
+
+
+def test_retries_failed_and_corrupt_chunks(tmp_path):
+    failures = {'r00c00': ['500', 'truncate'], 'r01c01': ['corrupt', '429'], 'r02c02': ['truncate']}
+    with FakeDownloadServer(failures) as server:
+        output = download_image(FakeImage(server), BOUNDS, str(tmp_path / 'stack.tif'), 10, BANDS, workers=4,
+                                retries=2, **small_chunks())
+    assert server.requests.count('r00c00') == 3
+    assert server.requests.count('r01c01') == 3
+    assert server.requests.count('r02c02') == 2
+    check_output(output)
+
+
+def test_gives_up_and_resumes(tmp_path):
+    with FakeDownloadServer({'r01c02': ['500'] * 3}) as server:
+        with pytest.raises(ChunkError, match='r01c02: failed after 3 attempts'):
+            download_image(FakeImage(server), BOUNDS, str(tmp_path / 'stack.tif'), 10, BANDS, workers=2,
+                           retries=2, **small_chunks())
+    chunk_dir = tmp_path / 'stack.tif.chunks'
+    assert len(os.listdir(chunk_dir)) == 8 and not any(name.endswith('.part') for name in os.listdir(chunk_dir))
+
+    with FakeDownloadServer() as server:
+        output = download_image(FakeImage(server), BOUNDS, str(tmp_path / 'stack.tif'), 10, BANDS, workers=2,
+                                **small_chunks())
+    assert server.requests == ['r01c02']  # verified chunks of the first run are reused
+    check_output(output)
+
+
+def test_retries_download_url_errors(tmp_path):
+    with FakeDownloadServer() as server:
+        image = BusyImage(server, ['r00c00', 'r02c01'])
+        output = download_image(image, BOUNDS, str(tmp_path / 'stack.tif'), 10, BANDS, workers=3,
+                                retries=1, **small_chunks())
+    assert image.calls.count('r00c00') == 2 and image.calls.count('r02c01') == 2
+    assert len(server.requests) == 9
+    check_output(output)
+
+
+def test_client_errors_are_not_retried(tmp_path):
+    with FakeDownloadServer({'r00c00': ['400']}) as server:
+        with pytest.raises(ChunkError, match='HTTP 400'):
+            download_image(FakeImage(server), BOUNDS, str(tmp_path / 'stack.tif'), 10, BANDS, workers=1,
+                           **small_chunks())
+    assert server.requests.count('r00c00') == 1
+
+
+def test_chunks_are_sized_by_data_type():
+    assert sample_bytes({'B2': {'precision': 'int', 'min': 0, 'max': 255}}) == 1
+    assert sample_bytes({'VV': {'precision': 'int', 'min': -32768, 'max': 32767}}) == 2
+    assert sample_bytes({'B2': {'precision': 'int', 'min': 0, 'max': 65535},
+                         'VV': {'precision': 'int', 'min': -32768, 'max': 32767}}) == 4
+    assert sample_bytes({'B2': {'precision': 'int', 'min': 0, 'max': 65535},
+                         'NDVI': {'precision': 'float'}}) == 4
+    assert sample_bytes({'B2': {'precision': 'int', 'min': 0, 'max': 255},
+                         'rh': {'precision': 'double'}}) == 8
+    assert sample_bytes({'count': {'precision': 'int', 'min': -2**31, 'max': 2**31 - 1}}) == 4
+    assert sample_bytes({'count': {'precision': 'int'}}) == 8
+
+    plan = plan_export((8.0, 44.0, 8.5, 44.5), 10, 40, bytes_per_sample=8, max_bytes=DOWNLOAD_MAX_BYTES)
+    assert all(t['width'] * t['height'] * 40 * 8 <= DOWNLOAD_MAX_BYTES for t in plan['tiles'])
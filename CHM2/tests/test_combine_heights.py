@@ -8,7 +8,8 @@ matplotlib.use('Agg')  # Use non-interactive backend for testing
 
 # Add parent directory to path to allow imports
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from combine_heights import analyze_heights, combine_heights_with_training
+from scipy import stats as scipy_stats
+from combine_heights import analyze_heights, combine_heights_with_training, height_statistics
 
 def test_analyze_heights_input_validation():
     """Test input validation for analyze_heights function."""
@@ -85,6 +86,42 @@ def test_analyze_heights_missing_data():
     # Check error matrix
     assert 'RMSE' in stats['error_matrix']['test_height']
 
+def test_height_statistics_matches_per_column():
+    """Vectorized statistics equal per-column computation with pairwise NaN handling."""
+    rng = np.random.default_rng(0)
+    ref = rng.uniform(0, 35, 500).astype(np.float32)
+    ref[:20] = np.nan
+    heights = (ref[:, None] + rng.normal(1, 3, (500, 3))).astype(np.float32)
+    heights[rng.random(heights.shape) < 0.1] = np.nan
+    result = height_statistics(ref, heights)
+
+    for i in range(3):
+        valid = ~np.isnan(ref) & ~np.isnan(heights[:, i])
+        r, h = ref[valid].astype(float), heights[valid, i].astype(float)
+        errors = h - r
+        fit = scipy_stats.linregress(r, h)
+        assert result['N'][i] == valid.sum()
+        assert abs(result['RMSE'][i] - np.sqrt(np.mean(errors ** 2))) < 1e-6
+        assert abs(result['MAE'][i] - np.mean(np.abs(errors))) < 1e-6
+        assert abs(result['Correlation'][i] - np.corrcoef(r, h)[0, 1]) < 1e-6
+        assert abs(result['Slope'][i] - fit.slope) < 1e-6
+        assert abs(result['Intercept'][i] - fit.intercept) < 1e-5
+        assert abs(result['Error_std'][i] - np.std(errors)) < 1e-6
+        np.testing.assert_allclose([result[f'Error_p{q}'][i] for q in (5, 25, 50, 75, 95)],
+                                   np.percentile(errors, [5, 25, 50, 75, 95]), atol=1e-5)
+
+def test_analyze_heights_without_plot():
+    """Batch mode returns statistics without creating a figure."""
+    df = pd.DataFrame({
+        'reference_height': [10, 20, 30, 40, 50],
+        'a': [12, 22, 32, 42, 52],
+        'b': [np.nan, np.nan, np.nan, np.nan, 5]
+    })
+    stats, fig = analyze_heights(df, ['a', 'b', 'missing'], plot=False)
+    assert fig is None
+    assert set(stats) == {'a', 'error_matrix'}
+    assert stats['a']['N'] == 5
+
 def test_combine_heights_input_validation(tmp_path):
     """Test input validation for combine_heights_with_training function."""
     # Test non-existent output directory
@@ -125,5 +162,26 @@ def test_output_file_naming(tmp_path):
     for fname in expected_files:
         assert not (tmp_path / fname).exists()
 
+def test_explicit_training_file_is_used(tmp_path):
+    """The given training file is read even if a newer one exists in the directory."""
+    import rasterio
+    from rasterio.transform import from_origin
+    ref_file = tmp_path / 'dchm_09id4.tif'
+    with rasterio.open(ref_file, 'w', driver='GTiff', dtype='float32', width=20, height=20, count=1,
+                       crs='EPSG:4326', transform=from_origin(10.0, 46.0, 0.01, 0.01)) as dst:
+        dst.write(np.full((1, 20, 20), 12.0, dtype='float32'))
+    chosen = tmp_path / 'training_data_aoi.csv'
+    pd.DataFrame({'longitude': [10.02, 10.05], 'latitude': [45.95, 45.92], 'rh': [10.0, 20.0]}).to_csv(
+        chosen, index=False)
+    pd.DataFrame({'longitude': [1.0], 'latitude': [1.0], 'rh': [5.0]}).to_csv(
+        tmp_path / 'training_data_other.csv', index=False)
+    os.utime(chosen, (1000, 1000))
+
+    combine_heights_with_training(str(tmp_path), str(ref_file), plot=False, training_file=str(chosen))
+    combined = pd.read_csv(tmp_path / 'trainingData_with_heights.csv')
+    assert combined['rh'].tolist() == [10.0, 20.0]
+    assert combined['reference_height'].tolist() == [12.0, 12.0]
+
+
 if __name__ == '__main__':
     pytest.main([__file__])
\ No newline at end of file
@@ -1,7 +1,7 @@
 import pytest
 import torch
 import numpy as np
-from dl_models import create_normalized_dataloader, MLPRegressionModel
+from dl_models import create_normalized_dataloader, MLPRegressionModel, fold_mlp, linear_to_conv1x1
 
 def test_create_normalized_dataloader_independent():
     # Create sample data
@@ -96,5 +96,28 @@ def test_mlp_regression_model():
     assert isinstance(model.layers[0], torch.nn.Linear)
     assert model.layers[0].in_features == input_size
 
+
+def test_fold_mlp_and_conv_match_model():
+    torch.manual_seed(0)
+    X = torch.randn(64, 6) * 50 + 100
+    model = MLPRegressionModel(input_size=6, num_layers=2, nodes=32)
+    # Give the batch norms non-trivial statistics
+    model.train()
+    with torch.no_grad():
+        for _ in range(5):
+            model((X - X.mean(0)) / X.std(0))
+    model.eval()
+    model.scaler_mean, model.scaler_std = X.mean(0), X.std(0)
+
+    with torch.no_grad():
+        expected = model((X - model.scaler_mean) / model.scaler_std)
+        folded = fold_mlp(model)
+        np.testing.assert_allclose(folded(X).squeeze(1).numpy(), expected.numpy(), rtol=1e-4, atol=1e-4)
+
+        tile = X.T.reshape(1, 6, 8, 8)
+        conv = linear_to_conv1x1(folded)
+        np.testing.assert_allclose(conv(tile).reshape(-1).numpy(), expected.numpy(), rtol=1e-4, atol=1e-4)
+
+
 if __name__ == '__main__':
-    pytest.main([__file__])
\ No newline at end of file
+    pytest.main([__file__])
@@ -0,0 +1,59 @@
+"""Round-trip counts of the Earth Engine calls, run against a local fake backend."""
+
+import json
+
+
+def test_deferred_values_resolve_in_one_trip(fake_ee):
+    from ee_batch import DeferredValues, export_info
+    image = fake_ee.Image('stack')
+    values = DeferredValues()
+    values.add('n_bands', image.bandNames().size())
+    values.add('stack', export_info(image, fake_ee.Geometry.Polygon([]), 30))
+    assert 'stack' in values and fake_ee.round_trips == 0
+
+    assert values['n_bands'] == 4
+    assert values['stack'] == {'band_count': 4, 'area_ha': 1234.4}
+    assert values.get('missing') is None
+    assert fake_ee.round_trips == 1
+
+
+def test_create_forest_mask_uses_resolved_counts(fake_ee):
+    from for_forest_masking import create_forest_mask, forest_mask_collections
+    aoi, start, end = fake_ee.Geometry.Polygon([]), fake_ee.Date('2022-01-01'), fake_ee.Date('2022-12-31')
+    create_forest_mask('ALL', aoi, start, end)
+    assert fake_ee.round_trips == 3  # dw, fnf4 and s2 sizes
+
+    fake_ee.round_trips = 0
+    counts = fake_ee.Dictionary({name: c.size() for name, c in
+                                 forest_mask_collections('ALL', aoi, start, end).items()}).getInfo()
+    assert set(counts) == {'dw', 'fnf4', 'fnf', 's2'}
+    create_forest_mask('ALL', aoi, start, end, counts=counts)
+    assert fake_ee.round_trips == 1
+
+
+def test_exports_use_resolved_info(fake_ee, capsys):
+    from chm_main import export_tif_via_ee, export_featurecollection_to_csv
+    aoi = fake_ee.Geometry.Polygon([])
+    export_tif_via_ee(fake_ee.Image('stack'), aoi, 'stack', 30)
+    export_featurecollection_to_csv(fake_ee.FeatureCollection('points'), 'points')
+    assert fake_ee.round_trips == 2
+
+    fake_ee.round_trips = 0
+    export_tif_via_ee(fake_ee.Image('stack'), aoi, 'stack', 30, info={'band_count': 4, 'area_ha': 1234.4})
+    export_featurecollection_to_csv(fake_ee.FeatureCollection('points'), 'points', ['rh', 'longitude'])
+    assert fake_ee.round_trips == 0
+    assert capsys.readouterr().out.count('stack_b4_s30_p1234') == 2
+
+
+def test_main_resolves_all_values_in_one_trip(fake_ee, tmp_path, capsys):
+    """Before batching a full run made 13 round trips (sizes, mask checks, export names)."""
+    import chm_main
+    aoi = tmp_path / 'aoi.geojson'
+    aoi.write_text(json.dumps({'type': 'Polygon', 'coordinates': [[[0, 0], [1, 0], [1, 1], [0, 0]]]}))
+    chm_main.main(['--aoi', str(aoi), '--year', '2022', '--mask-type', 'ALL', '--output-dir', str(tmp_path),
+                   '--export-training', '--export-predictions', '--export-gedi-points'])
+    assert fake_ee.round_trips == 1
+    out = capsys.readouterr().out
+    assert 'stack_b4_s30_p1234' in out
+    assert 'forestMaskALL30_b1_s30_p1234' in out
+    assert 'training_data_ALL30_b8.csv' in out
@@ -0,0 +1,114 @@
+"""Unit tests for the persistent getInfo cache, using the fake ee backend."""
+
+import json
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+
+import ee_cache
+from ee_cache import GetInfoCache
+
+
+@pytest.fixture
+def active_cache(tmp_path):
+    ee_cache.disable()
+    cache = ee_cache.enable(str(tmp_path / 'cache' / 'getinfo.sqlite'))
+    yield cache
+    ee_cache.disable()
+
+
+def test_put_get_and_persistence(tmp_path):
+    path = str(tmp_path / 'getinfo.sqlite')
+    with GetInfoCache(path) as cache:
+        cache.put('a', {'band_count': 3, 'area_ha': 12.5})
+        assert cache.get('a') == {'band_count': 3, 'area_ha': 12.5}
+        assert cache.get('missing', 'default') == 'default'
+    with GetInfoCache(path) as cache:
+        assert cache.get('a')['band_count'] == 3
+        assert cache.stats()['entries'] == 1
+
+
+def test_ttl_expiry(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ee_cache.time, 'time', lambda: now[0])
+    with GetInfoCache(str(tmp_path / 'getinfo.sqlite'), ttl=60) as cache:
+        cache.put('a', 1)
+        now[0] += 59
+        assert cache.get('a') == 1
+        now[0] += 2
+        assert cache.get('a') is None
+        assert cache.stats()['entries'] == 0
+
+
+def test_lru_eviction_by_size(tmp_path, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(ee_cache.time, 'time', lambda: now[0])
+    value = 'x' * 98  # 100 bytes as JSON
+    with GetInfoCache(str(tmp_path / 'getinfo.sqlite'), max_bytes=300) as cache:
+        for key in 'abc':
+            now[0] += 1
+            cache.put(key, value)
+        now[0] += 1
+        cache.get('a')  # a is now the most recently used
+        now[0] += 1
+        cache.put('d', value)
+        assert cache.get('b') is None
+        assert all(cache.get(key) == value for key in 'acd')
+        assert cache.stats()['bytes'] == 300
+
+
+def test_get_info_skips_server_on_repeat(fake_ee, active_cache):
+    size = fake_ee.ImageCollection('COPERNICUS/S2_HARMONIZED').filterDate('2022-01-01', '2022-12-31').size()
+    assert ee_cache.get_info(size) == 4
+    other = fake_ee.ImageCollection('COPERNICUS/S2_HARMONIZED').filterDate('2023-01-01', '2023-12-31').size()
+    assert ee_cache.get_info(other) == 4
+    assert fake_ee.round_trips == 2
+    assert ee_cache.get_info(size) == 4
+    assert fake_ee.round_trips == 2
+    assert active_cache.stats()['hits'] == 1
+
+
+def test_cache_used_from_other_threads(fake_ee, active_cache):
+    """The cache enabled in one thread serves pipeline stages running in worker threads."""
+    size = fake_ee.ImageCollection('COPERNICUS/S2_HARMONIZED').size()
+    assert ee_cache.get_info(size) == 4
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert list(executor.map(lambda _: ee_cache.get_info(size), range(8))) == [4] * 8
+    assert fake_ee.round_trips == 1
+    assert active_cache.stats()['hits'] == 8
+
+
+def test_deferred_values_request_only_missing(fake_ee, active_cache):
+    from ee_batch import DeferredValues
+    image = fake_ee.Image('stack')
+    first = DeferredValues()
+    first.add('n_bands', image.bandNames().size())
+    first.resolve()
+
+    second = DeferredValues()
+    second.add('n_bands', image.bandNames().size())
+    second.add('names', image.bandNames().propertyNames())
+    second.resolve()
+    assert fake_ee.round_trips == 2
+    assert fake_ee.requests[-1] == 'Dictionary'
+    assert second['n_bands'] == 4
+
+    third = DeferredValues()
+    third.add('names', image.bandNames().propertyNames())
+    third.resolve()
+    assert fake_ee.round_trips == 2
+
+
+def test_repeat_main_run_skips_server(fake_ee, tmp_path, capsys):
+    import chm_main
+    aoi = tmp_path / 'aoi.geojson'
+    aoi.write_text(json.dumps({'type': 'Polygon', 'coordinates': [[[0, 0], [1, 0], [1, 1], [0, 0]]]}))
+    argv = ['--aoi', str(aoi), '--year', '2022', '--output-dir', str(tmp_path),
+            '--export-training', '--ee-cache', str(tmp_path / 'getinfo.sqlite')]
+    try:
+        chm_main.main(argv)
+        assert fake_ee.round_trips == 1
+        chm_main.main(argv)
+        assert fake_ee.round_trips == 1
+    finally:
+        ee_cache.disable()
+    assert 'getInfo cache: 6 hits, 6 misses' in capsys.readouterr().out
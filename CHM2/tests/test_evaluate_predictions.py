@@ -13,7 +13,7 @@ from evaluate_predictions import (
     calculate_metrics
 )
 from evaluation_utils import validate_data, create_plots
-from raster_utils import load_and_align_rasters
+from raster_utils import load_and_align_rasters, quick_validity_check
 
 class TestEvaluatePredictions(unittest.TestCase):
     @classmethod
@@ -76,6 +76,34 @@ class TestEvaluatePredictions(unittest.TestCase):
         
         self.assertFalse(check_predictions(invalid_path))
 
+    def test_quick_validity_check(self):
+        """Sparse valid pixels missed by the decimated read are found in a bounded scan."""
+        profile = {
+            'driver': 'GTiff', 'dtype': 'float32', 'nodata': -9999, 'width': 3000, 'height': 2000,
+            'count': 1, 'crs': 'EPSG:4326', 'transform': from_origin(0, 0, 0.001, 0.001)
+        }
+        data = np.full((2000, 3000), -9999, dtype='float32')
+        data[1501, 2999] = 12.5
+        sparse_path = os.path.join(self.temp_dir, 'sparse.tif')
+        with rasterio.open(sparse_path, 'w', **profile) as dst:
+            dst.write(data, 1)
+        
+        check = quick_validity_check(sparse_path, max_reads=17)
+        self.assertTrue(check['valid'])
+        self.assertEqual(check['source'], 'block')
+        self.assertLessEqual(check['reads'], 17)
+        self.assertEqual(check['max'], 12.5)
+        
+        # NaN counts as nodata when no nodata value is set
+        profile['nodata'] = None
+        nan_path = os.path.join(self.temp_dir, 'nan.tif')
+        with rasterio.open(nan_path, 'w', **profile) as dst:
+            dst.write(np.full((2000, 3000), np.nan, dtype='float32'), 1)
+        check = quick_validity_check(nan_path, max_reads=17)
+        self.assertFalse(check['valid'])
+        self.assertLessEqual(check['reads'], 17)
+        self.assertEqual(check['nodata_fraction'], 1.0)
+    
     def test_validate_data(self):
         """Test data validation checks."""
         # Test valid data
@@ -0,0 +1,129 @@
+"""Unit tests for export_fetch module, using fake Drive and task backends."""
+
+import functools
+import json
+import os
+
+import pytest
+
+from export_fetch import ExportFetcher, fetch_exports
+from export_tasks import ExportTaskManager
+from tests.fake_ee import FakeTaskBackend
+
+
+class FakeTask:
+    def __init__(self, description):
+        self.description = description
+
+
+class FakeDrive:
+    """Drive backend holding files by name; files appear after hidden_listings listings."""
+
+    def __init__(self, files: dict = None, hidden_listings: int = 0):
+        self.files = dict(files or {})
+        self.hidden_listings = hidden_listings
+        self.downloads = []
+
+    def list(self, folder, prefix):
+        if self.hidden_listings:
+            self.hidden_listings -= 1
+            return []
+        return [{'id': name, 'name': name, 'size': str(len(data))}
+                for name, data in self.files.items() if prefix in name]
+
+    def download(self, file_id, path, chunk_size=None):
+        self.downloads.append(file_id)
+        with open(path, 'wb') as f:
+            f.write(self.files[file_id])
+
+
+def completed(name, file_name, state='COMPLETED'):
+    return {'name': name, 'task_id': 'T1', 'state': state, 'error': None, 'file_name': file_name,
+            'folder': 'GEE_exports'}
+
+
+def test_fetch_copies_split_pieces(tmp_path):
+    drive = FakeDrive({'stack_b3.tif': b'one',
+                       'stack_b3-0000000000-0000000000.tif': b'piece0',
+                       'stack_b3-0000000000-0000032768.tif': b'piece1',
+                       'stack_b30.tif': b'other export'})
+    fetcher = ExportFetcher(str(tmp_path), backend=drive, sleep=lambda s: None)
+
+    paths = fetcher.fetch(completed('stack_b3', 'stack_b3.tif'))
+    assert [os.path.basename(p) for p in paths] == ['stack_b3-0000000000-0000000000.tif',
+                                                    'stack_b3-0000000000-0000032768.tif', 'stack_b3.tif']
+    assert (tmp_path / 'stack_b3-0000000000-0000032768.tif').read_bytes() == b'piece1'
+    assert not any(name.endswith('.part') for name in os.listdir(tmp_path))
+
+    # Files already fetched are not downloaded again
+    fetcher.fetch(completed('stack_b3', 'stack_b3.tif'))
+    assert len(drive.downloads) == 3
+
+
+def test_fetch_waits_for_drive_and_reports_missing_files(tmp_path):
+    sleeps = []
+    drive = FakeDrive({'training_data.csv': b'rh\n1\n'}, hidden_listings=2)
+    fetcher = ExportFetcher(str(tmp_path), backend=drive, attempts=3, delay=5, sleep=sleeps.append)
+    assert fetcher.fetch(completed('training_data', 'training_data.csv')) == [str(tmp_path / 'training_data.csv')]
+    assert sleeps == [5, 5]
+
+    with pytest.raises(FileNotFoundError):
+        fetcher.fetch(completed('stack', 'stack.tif'))
+    with pytest.raises(RuntimeError, match='failed'):
+        fetcher.fetch(completed('training_data', 'training_data.csv', state='FAILED'))
+
+
+def test_fetch_exports_fetches_each_export_when_it_completes(tmp_path):
+    backend = FakeTaskBackend(scripts={'stack': ['READY'] + ['RUNNING'] * 5 + ['COMPLETED']})
+    tasks = ExportTaskManager(str(tmp_path / 'tasks.json'), backend=backend, sleep=lambda s: None)
+    for name, file_name in [('stack', 'stack.tif'), ('training_data', 'training_data.csv')]:
+        tasks.submit(name, functools.partial(FakeTask, name), file_name=file_name, folder='GEE_exports')
+
+    fetched_at = {}
+
+    class Fetcher(ExportFetcher):
+        def fetch(self, record):
+            fetched_at[record['name']] = dict((n, r['state']) for n, r in tasks.records.items())
+            return super().fetch(record)
+
+    drive = FakeDrive({'stack.tif': b'stack', 'training_data.csv': b'rh\n'})
+    paths = fetch_exports(tasks, ['stack', 'training_data'], Fetcher(str(tmp_path), backend=drive))
+    assert paths == {'training_data': [str(tmp_path / 'training_data.csv')], 'stack': [str(tmp_path / 'stack.tif')]}
+    # The training data is fetched while the stack export still runs
+    assert fetched_at['training_data']['stack'] == 'RUNNING'
+
+
+def test_pipeline_stages_wait_on_their_own_exports(tmp_path, monkeypatch, install_fake_ee):
+    import chm_main
+    from run_main import build_pipeline
+    install_fake_ee()
+    # Fake ee tasks have no description, so they are named by task id: T2 is the stack export
+    backend = FakeTaskBackend(scripts={'T2': ['READY'] + ['RUNNING'] * 20 + ['COMPLETED']})
+    monkeypatch.setattr(chm_main, 'ExportTaskManager',
+                        functools.partial(ExportTaskManager, backend=backend, sleep=lambda s: None))
+    aoi = tmp_path / 'aoi.geojson'
+    aoi.write_text(json.dumps({'type': 'Polygon',
+                               'coordinates': [[[10, 45], [10.05, 45], [10.05, 45.05], [10, 45]]]}))
+    drive = FakeDrive()
+    fetched = []
+
+    class Fetcher(ExportFetcher):
+        def fetch(self, record):
+            # Drive has each export's file once the export completed
+            drive.files[record['file_name']] = record['name'].encode()
+            fetched.append((record['name'], backend.status_calls))
+            return super().fetch(record)
+
+    pipeline = build_pipeline(str(aoi), str(tmp_path), fetcher=Fetcher(str(tmp_path), backend=drive))
+    results = pipeline.run(['fetch_training', 'fetch_stack', 'fetch_mask'])
+    assert {r['status'] for r in results.values()} == {'done'}
+    assert results['fetch_stack']['output'] == str(tmp_path / 'stack_b3_s10_p1234.tif')
+    # The training data is fetched long before the stack export completes
+    polls = dict(fetched)
+    assert polls['training_data_ALL35_b6'] + 10 < polls['stack_b3_s10_p1234']
+    assert pipeline.stages['height_analysis'].deps == ('fetch_training',)
+
+    # A rerun with the same exports is cached
+    results = build_pipeline(str(aoi), str(tmp_path), fetcher=Fetcher(str(tmp_path), backend=drive)).run(
+        ['fetch_training', 'fetch_stack', 'fetch_mask'], with_deps=False)
+    assert {r['status'] for r in results.values()} == {'cached'}
@@ -0,0 +1,75 @@
+"""Unit tests for export_planner module."""
+
+import pytest
+
+from export_planner import plan_export, plan_grid, tile_size, utm_crs, MAX_DIMENSION, MAX_FILE_BYTES
+from export_tasks import ExportTaskManager
+from tests.fake_ee import FakeTaskBackend
+
+
+def test_utm_zone():
+    assert utm_crs(9.2, 45.5) == 'EPSG:32632'
+    assert utm_crs(-47.9, -15.8) == 'EPSG:32723'
+    assert utm_crs(180.0, 10) == 'EPSG:32660'
+
+
+def test_grid_is_snapped_to_scale():
+    grid = plan_grid((9.0, 45.0, 9.05, 45.03), 10)
+    scale, _, left, _, neg_scale, top = grid['transform']
+    assert grid['crs'] == 'EPSG:32632'
+    assert scale == 10 and neg_scale == -10
+    assert left % 10 == 0 and top % 10 == 0
+    assert 390 <= grid['width'] <= 400 and 330 <= grid['height'] <= 340
+
+
+def test_small_export_is_one_tile():
+    plan = plan_export((9.0, 45.0, 9.05, 45.03), 10, band_count=40)
+    assert len(plan['tiles']) == 1
+    (tile,) = plan['tiles']
+    assert (tile['width'], tile['height']) == (plan['width'], plan['height'])
+    assert plan['bytes'] == plan['pixels'] * 40 * 4 < MAX_FILE_BYTES
+
+
+def test_large_export_tiles_fit_limits_and_cover_grid():
+    plan = plan_export((8.0, 44.0, 10.0, 46.0), 10, band_count=40)
+    side = tile_size(40)
+    assert plan['tile_size'] == side and side * side * 40 * 4 <= MAX_FILE_BYTES
+    assert plan['bytes'] > MAX_FILE_BYTES
+    scale, left, top = plan['transform'][0], plan['transform'][2], plan['transform'][5]
+    covered = 0
+    for tile in plan['tiles']:
+        assert tile['width'] <= MAX_DIMENSION and tile['height'] <= MAX_DIMENSION
+        assert tile['width'] * tile['height'] * 40 * 4 <= MAX_FILE_BYTES
+        # Tile edges fall on pixel edges of the shared grid
+        x0, y0, x1, y1 = tile['bounds']
+        assert (x0 - left) / scale == tile['col_off'] and (top - y1) / scale == tile['row_off']
+        assert (x1 - x0) / scale == tile['width'] and (y1 - y0) / scale == tile['height']
+        covered += tile['width'] * tile['height']
+    assert covered == plan['pixels']
+    assert len({t['name'] for t in plan['tiles']}) == len(plan['tiles'])
+
+
+def test_dimension_limit_with_few_bands():
+    assert tile_size(1, 1) == 5792  # sqrt(32 MB)
+    assert tile_size(1, 1, max_bytes=2**30) == MAX_DIMENSION
+    with pytest.raises(ValueError):
+        tile_size(10, 4, max_bytes=16)
+
+
+def test_tiled_export_submits_tasks_on_one_grid(tmp_path, install_fake_ee):
+    from chm_main import export_tif_via_ee
+    fake = install_fake_ee()
+    backend = FakeTaskBackend()
+    tasks = ExportTaskManager(str(tmp_path / 'tasks.json'), backend=backend, max_concurrent=4,
+                              sleep=lambda s: None)
+    names = export_tif_via_ee(fake.Image('stack'), fake.Geometry.Polygon([]), 'stack', 10,
+                              info={'band_count': 40, 'area_ha': 40000.0}, tasks=tasks,
+                              bounds=(9.0, 45.0, 9.3, 45.2))
+    records = tasks.run()
+
+    assert len(names) > 1 and all(name.startswith('stack_b40_s10_p40000_r') for name in names)
+    assert all(r['state'] == 'COMPLETED' for r in records.values())
+    assert backend.max_running == 4
+    assert len({tuple(r['transform']) for r in records.values()}) == 1
+    assert {r['crs'] for r in records.values()} == {'EPSG:32632'}
+    assert {r['mosaic'] for r in records.values()} == {'stack_b40_s10_p40000'}
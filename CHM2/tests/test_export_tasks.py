@@ -0,0 +1,118 @@
+"""Unit tests for export_tasks module, using a fake task backend."""
+
+import functools
+import json
+import pytest
+
+from export_tasks import ExportTaskManager
+from tests.fake_ee import FakeTaskBackend
+
+
+class FakeTask:
+    def __init__(self, description):
+        self.description = description
+
+
+def make_manager(path, backend, **kwargs):
+    sleeps = []
+    manager = ExportTaskManager(str(path), backend=backend, sleep=sleeps.append, **kwargs)
+    return manager, sleeps
+
+
+def test_concurrency_limit_and_callbacks(tmp_path):
+    backend = FakeTaskBackend()
+    manager, _ = make_manager(tmp_path / 'tasks.json', backend, max_concurrent=2)
+    finished = []
+    for name in ['training', 'stack', 'mask']:
+        manager.submit(name, functools.partial(FakeTask, name), callback=finished.append, file_name=f'{name}.tif')
+
+    records = manager.run()
+    assert all(r['state'] == 'COMPLETED' for r in records.values())
+    assert backend.started == ['training', 'stack', 'mask']
+    assert backend.max_running == 2
+    assert [r['name'] for r in finished] == ['training', 'stack', 'mask']
+    assert finished[0]['file_name'] == 'training.tif'
+
+    with open(tmp_path / 'tasks.json') as f:
+        saved = json.load(f)['tasks']
+    assert saved['mask']['state'] == 'COMPLETED' and saved['mask']['task_id'] == 'T3'
+
+
+def test_poll_delay_backs_off(tmp_path):
+    backend = FakeTaskBackend(states=['READY'] + ['RUNNING'] * 6 + ['COMPLETED'])
+    manager, sleeps = make_manager(tmp_path / 'tasks.json', backend, poll_interval=10, max_interval=60)
+    manager.submit('stack', functools.partial(FakeTask, 'stack'))
+    manager.run()
+    # Reset after each state change, doubled while nothing changes, capped at max_interval
+    assert sleeps == [10, 10, 20, 40, 60, 60, 60]
+
+
+def test_resume_after_restart(tmp_path):
+    backend = FakeTaskBackend(states=['READY', 'RUNNING', 'RUNNING', 'COMPLETED'])
+    first, _ = make_manager(tmp_path / 'tasks.json', backend, max_concurrent=1)
+    for name in ['training', 'stack']:
+        first.submit(name, functools.partial(FakeTask, name))
+    first.step()  # training started and READY, stack queued; then the process dies
+
+    def must_not_restart():
+        raise AssertionError('running task was started again')
+
+    second, _ = make_manager(tmp_path / 'tasks.json', backend, max_concurrent=1)
+    assert second.records['training']['state'] == 'READY'
+    assert 'stack' not in second.records
+    second.submit('training', must_not_restart)
+    second.submit('stack', functools.partial(FakeTask, 'stack'))
+    records = second.run()
+    assert backend.started == ['training', 'stack']
+    assert records['training']['state'] == records['stack']['state'] == 'COMPLETED'
+
+    third, _ = make_manager(tmp_path / 'tasks.json', backend)
+    done = []
+    third.submit('stack', must_not_restart, callback=done.append)
+    assert done[0]['state'] == 'COMPLETED'
+    assert third.run(['stack'])['stack']['attempts'] == 1
+
+
+def test_failed_start_and_task_retry(tmp_path):
+    backend = FakeTaskBackend(scripts={'mask': ['RUNNING', 'FAILED']}, fail_starts=1)
+    manager, _ = make_manager(tmp_path / 'tasks.json', backend, retries=1)
+    finished = []
+    manager.submit('stack', functools.partial(FakeTask, 'stack'), callback=finished.append)
+    manager.submit('mask', functools.partial(FakeTask, 'mask'), callback=finished.append)
+    records = manager.run()
+
+    assert records['stack']['state'] == 'COMPLETED' and records['stack']['attempts'] == 2
+    assert records['mask']['state'] == 'FAILED' and records['mask']['attempts'] == 2
+    assert records['mask']['error'] == 'Export failed'
+    assert {r['name']: r['state'] for r in finished} == {'stack': 'COMPLETED', 'mask': 'FAILED'}
+
+
+def test_run_timeout(tmp_path, monkeypatch):
+    import export_tasks
+    backend = FakeTaskBackend(states=['RUNNING'])
+    manager, _ = make_manager(tmp_path / 'tasks.json', backend)
+    manager.submit('stack', functools.partial(FakeTask, 'stack'))
+    clock = iter(range(0, 10000, 100))
+    monkeypatch.setattr(export_tasks.time, 'time', lambda: next(clock))
+    with pytest.raises(TimeoutError, match='stack'):
+        manager.run(timeout=300)
+
+
+def test_chm_main_waits_for_exports(tmp_path, monkeypatch, install_fake_ee):
+    import chm_main
+    install_fake_ee()
+    backend = FakeTaskBackend()
+    monkeypatch.setattr(chm_main, 'ExportTaskManager',
+                        functools.partial(ExportTaskManager, backend=backend, sleep=lambda s: None))
+    aoi = tmp_path / 'aoi.geojson'
+    aoi.write_text(json.dumps({'type': 'Polygon',
+                               'coordinates': [[[10, 45], [10.05, 45], [10.05, 45.05], [10, 45]]]}))
+    finished = []
+    chm_main.main(['--aoi', str(aoi), '--year', '2022', '--output-dir', str(tmp_path), '--export-training',
+                   '--task-state', str(tmp_path / 'tasks.json'), '--max-exports', '1'],
+                  on_export=finished.append)
+
+    assert backend.max_running == 1
+    assert [r['file_name'] for r in finished] == ['training_data_NDVI30_b6.csv', 'stack_b3_s30_p1234.tif',
+                                                  'forestMaskNDVI30_b1_s30_p1234.tif']
+    assert all(r['state'] == 'COMPLETED' for r in finished)
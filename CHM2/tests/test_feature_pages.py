@@ -0,0 +1,97 @@
+"""Unit tests for feature_pages module."""
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import feature_pages
+from feature_pages import iter_pages, write_features_csv
+from tests.fake_ee import FakeEE
+
+
+def make_features(n):
+    return [{'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [9.0 + i * 1e-4, 45.0]},
+             'properties': {'rh': float(i % 40), 'B2': i * 0.001, 'VV': -12.5}} for i in range(n)]
+
+
+class PagedCollection:
+    """FeatureCollection on the fake backend whose toList pages come from features."""
+
+    def __init__(self, features, failures=0, delay=0.0):
+        self.features = features
+        self.failures = failures
+        self.active = self.max_active = 0
+        self.lock = threading.Lock()
+        self.fake = FakeEE(values={'size': len(features), 'toList': self.page})
+        self.collection = self.fake.FeatureCollection('projects/test/training')
+        self.delay = delay
+
+    def page(self, count, offset=0):
+        with self.lock:
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError('Too many concurrent aggregations')
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        return self.features[offset:offset + count]
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(feature_pages, 'time', SimpleNamespace(sleep=lambda s: None))
+
+
+def test_pages_are_fetched_concurrently_in_order():
+    source = PagedCollection(make_features(12345), delay=0.05)
+    pages = list(iter_pages(source.collection, page_size=1000, workers=4))
+    assert [len(p) for p in pages] == [1000] * 12 + [345]
+    assert [f for page in pages for f in page] == source.features
+    assert 1 < source.max_active <= 4
+    assert source.fake.round_trips == 14  # size + 13 pages
+
+
+def test_csv_matches_features_above_getinfo_limit(tmp_path):
+    source = PagedCollection(make_features(12345))
+    result = write_features_csv(source.collection, str(tmp_path / 'training.csv'), page_size=5000, workers=3)
+    assert result['rows'] == 12345
+    assert result['columns'] == ['rh', 'B2', 'VV', 'longitude', 'latitude']
+    df = pd.read_csv(result['path'])
+    assert list(df.columns) == result['columns'] and len(df) == 12345
+    assert df['rh'].tolist() == [float(i % 40) for i in range(12345)]
+    assert df['longitude'].iloc[-1] == pytest.approx(9.0 + 12344e-4)
+    assert source.fake.requests.count('FeatureCollection.toList') == 3
+    assert list(tmp_path.iterdir()) == [tmp_path / 'training.csv']
+
+
+def test_failed_pages_are_retried(tmp_path):
+    source = PagedCollection(make_features(250), failures=2)
+    result = write_features_csv(source.collection, str(tmp_path / 'training.csv'), count=250, page_size=100,
+                                workers=1)
+    assert result['rows'] == 250
+    assert source.fake.round_trips == 5  # 3 pages + 2 failed attempts, size was given
+
+    source = PagedCollection(make_features(250), failures=10)
+    with pytest.raises(RuntimeError, match='concurrent aggregations'):
+        write_features_csv(source.collection, str(tmp_path / 'failed.csv'), page_size=100, retries=2)
+
+
+def test_export_training_data_names_file_by_bands_and_rows(tmp_path):
+    import chm_main
+    source = PagedCollection(make_features(4321))
+    output_path = chm_main.export_training_data(source.collection, str(tmp_path), page_size=1000)
+    assert output_path == str(tmp_path / 'training_data_b2_4321.csv')
+    assert len(pd.read_csv(output_path)) == 4321
+
+
+def test_empty_training_data_is_not_published(tmp_path):
+    import chm_main
+    source = PagedCollection([])
+    with pytest.raises(ValueError, match='empty'):
+        chm_main.export_training_data(source.collection, str(tmp_path))
+    assert list(tmp_path.iterdir()) == []
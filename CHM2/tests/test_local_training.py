@@ -0,0 +1,59 @@
+"""Unit tests for local_training module."""
+
+import numpy as np
+import pandas as pd
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.warp import transform as transform_coords
+
+from local_training import build_training_table
+from train_predict_map import load_training_data
+
+
+@pytest.fixture
+def stack_and_gedi(tmp_path):
+    rng = np.random.default_rng(0)
+    stack = rng.uniform(0, 3000, (4, 100, 120)).astype('float32')
+    stack[2, :10, :] = -9999
+    stack_path = str(tmp_path / 'stack.tif')
+    with rasterio.open(stack_path, 'w', driver='GTiff', dtype='float32', nodata=-9999, width=120, height=100,
+                       count=4, crs='EPSG:32632', transform=from_origin(500000, 5000000, 10, 10)) as dst:
+        dst.write(stack)
+        for i, name in enumerate(['B2', 'B3', 'VV'], start=1):
+            dst.set_band_description(i, name)
+
+    rows = rng.integers(0, 100, 50)
+    cols = rng.integers(0, 120, 50)
+    xs, ys = 500000 + (cols + 0.5) * 10, 5000000 - (rows + 0.5) * 10
+    lons, lats = transform_coords('EPSG:32632', 'EPSG:4326', xs, ys)
+    gedi = pd.DataFrame({'longitude': list(lons) + [0.0], 'latitude': list(lats) + [0.0],
+                         'rh': list(rng.uniform(5, 30, 50)) + [10.0]})
+    gedi_path = str(tmp_path / 'gedi_points.csv')
+    gedi.to_csv(gedi_path, index=False)
+    return stack_path, gedi_path, stack, rows, cols
+
+
+def test_build_training_table(stack_and_gedi, tmp_path):
+    """Features follow the stack band order and incomplete footprints are dropped."""
+    stack_path, gedi_path, stack, rows, cols = stack_and_gedi
+    df = build_training_table(gedi_path, stack_path, output_dir=str(tmp_path / 'out'), block_size=32)
+    assert list(df.columns) == ['B2', 'B3', 'VV', 'b4', 'rh', 'longitude', 'latitude']
+
+    keep = rows >= 10
+    assert len(df) == keep.sum()
+    np.testing.assert_allclose(df[['B2', 'B3', 'VV', 'b4']].values, stack[:, rows[keep], cols[keep]].T)
+
+    csv_path = next((tmp_path / 'out').glob('training_data_local_b4_*.csv'))
+    X, y = load_training_data(str(csv_path))
+    assert X.shape == (keep.sum(), 4)
+    np.testing.assert_allclose(y, df['rh'].values)
+
+
+def test_build_training_table_missing_columns(stack_and_gedi, tmp_path):
+    """A GEDI table without the height column is rejected."""
+    stack_path, _, _, _, _ = stack_and_gedi
+    path = tmp_path / 'bad.csv'
+    pd.DataFrame({'longitude': [9.0], 'latitude': [45.0]}).to_csv(path, index=False)
+    with pytest.raises(ValueError):
+        build_training_table(str(path), stack_path)
@@ -0,0 +1,98 @@
+"""Unit tests for mosaic module."""
+
+import os
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from mosaic import export_prefixes, find_pieces, mosaic_export, mosaic_exports
+from utils import get_latest_file
+
+LEFT, TOP, RES = 500000.0, 5000000.0, 10.0
+
+
+def write_piece(path, data, row_off, col_off, nodata=None, descriptions=None):
+    with rasterio.open(path, 'w', driver='GTiff', width=data.shape[2], height=data.shape[1], count=data.shape[0],
+                       dtype=data.dtype, crs='EPSG:32632', nodata=nodata,
+                       transform=from_origin(LEFT + col_off * RES, TOP - row_off * RES, RES, RES)) as dst:
+        dst.write(data)
+        if descriptions:
+            dst.descriptions = descriptions
+
+
+@pytest.fixture
+def full():
+    rows, cols = np.mgrid[0:1100, 0:900]
+    return np.stack([rows * 0.5 + cols, rows - cols * 0.25]).astype('float32')
+
+
+def split_pieces(directory, prefix, full, nodata=None):
+    """Earth Engine style split into 2 x 2 pieces of unequal size."""
+    for r0, r1, c0, c1 in [(0, 600, 0, 512), (0, 600, 512, 900), (600, 1100, 0, 512), (600, 1100, 512, 900)]:
+        name = f'{prefix}-{r0:010d}-{c0:010d}.tif'
+        write_piece(os.path.join(directory, name), full[:, r0:r1, c0:c1], r0, c0, nodata, ('B2', 'B3'))
+
+
+def test_find_pieces_and_prefixes(tmp_path):
+    data = np.zeros((1, 4, 4), dtype='uint8')
+    for name in ['stack_b2_s10_p10-0000000000-0000000000.tif', 'stack_b2_s10_p10_r00c01.tif',
+                 'stack_b2_s10_p10_r00c00-0000000000-0000000256.tif', 'stack_b2_s10_p100_r00c00.tif',
+                 'stack_b2_s10_p10.tif', 'forestMaskALL35_b1_s10_p10_r00c00.tif']:
+        write_piece(tmp_path / name, data, 0, 0)
+    pieces = [os.path.basename(p) for p in find_pieces(str(tmp_path), 'stack_b2_s10_p10')]
+    assert pieces == ['stack_b2_s10_p10-0000000000-0000000000.tif',
+                      'stack_b2_s10_p10_r00c00-0000000000-0000000256.tif', 'stack_b2_s10_p10_r00c01.tif']
+    assert export_prefixes(str(tmp_path), 'stack') == ['stack_b2_s10_p10', 'stack_b2_s10_p100']
+    assert export_prefixes(str(tmp_path)) == ['forestMaskALL35_b1_s10_p10', 'stack_b2_s10_p10',
+                                              'stack_b2_s10_p100']
+
+
+def test_mosaic_matches_full_raster_and_is_cog(tmp_path, full):
+    split_pieces(str(tmp_path), 'stack_b2_s10_p990', full)
+    output = mosaic_export(str(tmp_path), 'stack_b2_s10_p990', threads='2')
+    assert output == str(tmp_path / 'stack_b2_s10_p990.tif')
+    assert not os.path.exists(tmp_path / 'stack_b2_s10_p990.vrt')
+
+    with rasterio.open(output) as src:
+        np.testing.assert_array_equal(src.read(), full)
+        assert src.transform == from_origin(LEFT, TOP, RES, RES)
+        assert src.crs.to_epsg() == 32632
+        assert src.descriptions == ('B2', 'B3')
+        assert src.compression.name.lower() == 'deflate'
+        assert src.block_shapes[0] == (512, 512)
+        assert src.overviews(1) == [2, 4]
+        assert src.tags(ns='IMAGE_STRUCTURE').get('LAYOUT') == 'COG'
+
+
+def test_tiles_with_nodata_overlap(tmp_path, full):
+    """Tiles of one grid may overlap by a pixel; nodata in one piece does not hide the other."""
+    left = full[:1, :, :501].copy()
+    left[:, :, 500] = -9999
+    write_piece(tmp_path / 'predictionCHM_b1_s10_p1_r00c00.tif', left, 0, 0, nodata=-9999)
+    write_piece(tmp_path / 'predictionCHM_b1_s10_p1_r00c01.tif', full[:1, :, 500:], 0, 500, nodata=-9999)
+    write_piece(tmp_path / 'predictionCHM_b1_s10_p1_r00c02.tif', full[:1, :, 500:501], 0, 500, nodata=-9999)
+    (output,) = mosaic_exports(str(tmp_path), ['predictionCHM'], remove_pieces=True)
+    with rasterio.open(output) as src:
+        np.testing.assert_array_equal(src.read(), full[:1])
+        assert src.nodata == -9999
+    assert sorted(os.listdir(tmp_path)) == ['.artifacts.sqlite', 'predictionCHM_b1_s10_p1.tif']
+    assert get_latest_file(str(tmp_path), 'predictionCHM') == output
+
+
+def test_misaligned_pieces_are_rejected(tmp_path):
+    data = np.ones((1, 10, 10), dtype='float32')
+    write_piece(tmp_path / 'stack_b1_s10_p1_r00c00.tif', data, 0, 0)
+    write_piece(tmp_path / 'stack_b1_s10_p1_r00c01.tif', data, 0, 10.5)
+    with pytest.raises(ValueError, match='resampling'):
+        mosaic_export(str(tmp_path), 'stack_b1_s10_p1')
+
+
+def test_up_to_date_mosaic_is_kept(tmp_path, full, capsys):
+    write_piece(tmp_path / 'stack_b2_s10_p990_r00c00.tif', full[:, :100, :50], 0, 0)
+    write_piece(tmp_path / 'stack_b2_s10_p990_r00c01.tif', full[:, :100, 50:100], 0, 50)
+    output = mosaic_export(str(tmp_path), 'stack_b2_s10_p990')
+    mtime = os.path.getmtime(output)
+    assert mosaic_export(str(tmp_path), 'stack_b2_s10_p990') == output
+    assert os.path.getmtime(output) == mtime
+    assert 'up to date' in capsys.readouterr().out
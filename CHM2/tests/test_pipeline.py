@@ -0,0 +1,152 @@
+"""Unit tests for pipeline module."""
+
+import os
+import threading
+import time
+
+import pytest
+
+from pipeline import Pipeline, Stage
+
+
+def make_stage(tmp_path, name, calls, deps=(), inputs=None, fail=False, barrier=None):
+    """Stage writing {name}_out.txt from the contents of its inputs."""
+    def run(resolved):
+        calls.append(name)
+        if barrier is not None:
+            barrier.wait(timeout=5)
+        if fail:
+            raise RuntimeError('boom')
+        text = ''.join(open(p).read() for _, p in sorted(resolved.items()))
+        (tmp_path / f'{name}_out.txt').write_text(text + name)
+    return Stage(name, run, deps=deps, inputs=inputs, output_prefix=f'{name}_out')
+
+
+def test_pipeline_runs_in_order_and_caches(tmp_path):
+    """Stages run after their dependencies and are skipped when inputs are unchanged."""
+    source = tmp_path / 'source.txt'
+    source.write_text('a')
+    calls = []
+    pipeline = Pipeline(str(tmp_path))
+    pipeline.add(make_stage(tmp_path, 'first', calls, inputs=lambda: {'src': str(source)}))
+    pipeline.add(make_stage(tmp_path, 'second', calls, deps=['first'],
+                            inputs=lambda: {'first': str(tmp_path / 'first_out.txt')}))
+
+    results = pipeline.run()
+    assert calls == ['first', 'second']
+    assert {r['status'] for r in results.values()} == {'done'}
+    assert (tmp_path / 'second_out.txt').read_text() == 'afirstsecond'
+
+    results = pipeline.run()
+    assert calls == ['first', 'second']
+    assert {r['status'] for r in results.values()} == {'cached'}
+
+    # Changing an input reruns the stage and, through its new output, the next one
+    source.write_text('b')
+    results = pipeline.run()
+    assert calls == ['first', 'second', 'first', 'second']
+    assert (tmp_path / 'second_out.txt').read_text() == 'bfirstsecond'
+
+    results = pipeline.run(['second'], force=True, with_deps=False)
+    assert list(results) == ['second']
+    assert calls[-1] == 'second'
+
+
+def test_pipeline_runs_independent_stages_concurrently(tmp_path):
+    """Stages sharing a dependency run at the same time."""
+    calls = []
+    barrier = threading.Barrier(2)
+    pipeline = Pipeline(str(tmp_path), max_workers=2)
+    pipeline.add(make_stage(tmp_path, 'prep', calls))
+    pipeline.add(make_stage(tmp_path, 'left', calls, deps=['prep'], barrier=barrier))
+    pipeline.add(make_stage(tmp_path, 'right', calls, deps=['prep'], barrier=barrier))
+
+    results = pipeline.run()
+    assert calls[0] == 'prep'
+    assert sorted(calls[1:]) == ['left', 'right']
+    assert {r['status'] for r in results.values()} == {'done'}
+
+
+def test_pipeline_failure_blocks_dependents(tmp_path):
+    """A failed stage blocks the stages depending on it but not the others."""
+    calls = []
+    pipeline = Pipeline(str(tmp_path))
+    pipeline.add(make_stage(tmp_path, 'prep', calls))
+    pipeline.add(make_stage(tmp_path, 'broken', calls, deps=['prep'], fail=True))
+    pipeline.add(make_stage(tmp_path, 'other', calls, deps=['prep']))
+    pipeline.add(make_stage(tmp_path, 'report', calls, deps=['broken']))
+    pipeline.add(make_stage(tmp_path, 'missing', calls, deps=['prep'],
+                            inputs=lambda: {'x': str(tmp_path / 'does_not_exist.txt')}))
+
+    results = pipeline.run()
+    assert results['broken']['status'] == 'failed'
+    assert results['report']['status'] == 'blocked'
+    assert results['other']['status'] == 'done'
+    assert results['missing']['status'] == 'failed'
+    assert 'report' not in calls and 'missing' not in calls
+
+
+def test_pipeline_rejects_unknown_stages(tmp_path):
+    pipeline = Pipeline(str(tmp_path))
+    with pytest.raises(ValueError):
+        pipeline.add(Stage('evaluate', lambda inputs: None, deps=['train_predict']))
+    with pytest.raises(ValueError):
+        pipeline.run(['evaluate'])
+    with pytest.raises(ValueError, match='evaluate'):
+        pipeline.run(['evaluate'], with_deps=False)
+
+
+def test_stage_key_follows_input_contents(tmp_path):
+    """A stage runs once per set of input contents and parameters."""
+    stack = tmp_path / 'stack.tif'
+    stack.write_bytes(b'stack v1')
+    runs = []
+
+    def predict(inputs):
+        runs.append(1)
+        (tmp_path / f'predictCH_{len(runs)}.tif').write_bytes(b'x' * len(runs))
+
+    def pipeline(options):
+        p = Pipeline(str(tmp_path))
+        p.add(Stage('train_predict', predict, inputs=lambda: {'stack': str(stack)}, params={'options': options},
+                    output_prefix='predictCH'))
+        return p
+
+    first = pipeline(['--model', 'mlp']).run()['train_predict']
+    second = pipeline(['--model', 'mlp']).run()['train_predict']
+    assert len(runs) == 1 and second['status'] == 'cached' and second['output'] == first['output']
+
+    # Same contents with a new modification time stay cached; new contents or parameters rerun
+    os.utime(stack, (5000, 5000))
+    assert pipeline(['--model', 'mlp']).run()['train_predict']['status'] == 'cached'
+    stack.write_bytes(b'stack v2')
+    assert pipeline(['--model', 'mlp']).run()['train_predict']['status'] == 'done'
+    assert pipeline(['--model', 'rf']).run()['train_predict']['status'] == 'done'
+    assert len(runs) == 3
+    pipeline(['--model', 'rf']).run(force=True)
+    assert len(runs) == 4
+
+
+def test_exclusive_stages_do_not_overlap(tmp_path):
+    """Stages sharing an exclusive resource run one at a time, others alongside them."""
+    active, overlaps, lock = set(), [], threading.Lock()
+
+    def make(name, duration):
+        def run(inputs):
+            with lock:
+                overlaps.append((name, frozenset(active)))
+                active.add(name)
+            time.sleep(duration)
+            with lock:
+                active.discard(name)
+        return run
+
+    pipeline = Pipeline(str(tmp_path), max_workers=3)
+    pipeline.add(Stage('height_analysis', make('height_analysis', 0.2), exclusive='pyplot'))
+    pipeline.add(Stage('evaluate', make('evaluate', 0.2), exclusive='pyplot'))
+    pipeline.add(Stage('mosaic', make('mosaic', 0.3)))
+    results = pipeline.run()
+    assert {r['status'] for r in results.values()} == {'done'}
+    started_with = dict(overlaps)
+    assert 'height_analysis' not in started_with['evaluate'] and 'evaluate' not in started_with['height_analysis']
+    assert 'mosaic' in started_with['evaluate'] or 'mosaic' in started_with['height_analysis']
@@ -0,0 +1,77 @@
+"""Unit tests for point_sampler module."""
+
+import numpy as np
+import pandas as pd
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.warp import transform as transform_coords
+
+from point_sampler import morton_key, sample_points, sample_rasters
+from combine_heights import combine_heights_with_training
+
+
+@pytest.fixture
+def rasters(tmp_path):
+    rng = np.random.default_rng(0)
+    profile = {
+        'driver': 'GTiff', 'dtype': 'float32', 'nodata': -9999, 'width': 300, 'height': 200,
+        'count': 1, 'crs': 'EPSG:32632', 'transform': from_origin(500000, 5000000, 10, 10)
+    }
+    height = rng.uniform(0, 35, (200, 300)).astype('float32')
+    height[:10, :10] = -9999
+    paths = {'height': str(tmp_path / 'height.tif'), 'stack': str(tmp_path / 'stack.tif')}
+    with rasterio.open(paths['height'], 'w', **profile) as dst:
+        dst.write(height, 1)
+    profile['count'] = 3
+    with rasterio.open(paths['stack'], 'w', **profile) as dst:
+        dst.write(rng.uniform(0, 3000, (3, 200, 300)).astype('float32'))
+        dst.set_band_description(1, 'B2')
+    return paths
+
+
+def test_morton_key():
+    """Keys interleave row and column bits."""
+    rows = np.array([0, 0, 1, 1, 2])
+    cols = np.array([0, 1, 0, 1, 0])
+    np.testing.assert_array_equal(morton_key(rows, cols), [0, 1, 2, 3, 8])
+
+
+def test_sample_points_matches_rasterio(rasters):
+    """Values equal src.sample, with NaN at nodata and outside the raster."""
+    rng = np.random.default_rng(1)
+    xs = rng.uniform(499900, 503100, 2000)
+    ys = rng.uniform(4997900, 5000100, 2000)
+    with rasterio.open(rasters['stack']) as src:
+        values = sample_points(src, xs, ys, block_size=64)
+        inside = (xs > 500000) & (xs < 503000) & (ys > 4998000) & (ys < 5000000)
+        expected = np.array(list(src.sample(zip(xs[inside], ys[inside]))))
+    assert values.shape == (2000, 3)
+    np.testing.assert_allclose(values[inside], expected)
+    assert np.isnan(values[~inside]).all()
+
+    with rasterio.open(rasters['height']) as src:
+        corner = sample_points(src, [500005.0, 500155.0], [4999995.0, 4999845.0])
+    assert np.isnan(corner[0, 0]) and not np.isnan(corner[1, 0])
+
+
+def test_sample_rasters_columns(rasters):
+    """Geographic points are transformed and every band gets a column."""
+    lons, lats = transform_coords('EPSG:32632', 'EPSG:4326', [500055.0, 501505.0], [4999055.0, 4998505.0])
+    table = sample_rasters(rasters, lons, lats)
+    assert list(table.columns) == ['height', 'stack_B2', 'stack_b2', 'stack_b3']
+    with rasterio.open(rasters['height']) as src:
+        expected = [v[0] for v in src.sample([(500055.0, 4999055.0), (501505.0, 4998505.0)])]
+    np.testing.assert_allclose(table['height'], expected, rtol=1e-6)
+
+
+def test_combine_heights_extra_rasters(rasters, tmp_path):
+    """Extra rasters are sampled into their own columns and analysed."""
+    lons, lats = transform_coords('EPSG:32632', 'EPSG:4326',
+                                  np.linspace(500200, 502800, 20), np.linspace(4998200, 4999800, 20))
+    pd.DataFrame({'longitude': lons, 'latitude': lats, 'rh': np.linspace(5, 30, 20)}).to_csv(
+        tmp_path / 'training_data.csv', index=False)
+    combine_heights_with_training(str(tmp_path), rasters['height'], extra_rasters={'ht2024': rasters['height']})
+    df = pd.read_csv(tmp_path / 'trainingData_with_heights.csv')
+    np.testing.assert_allclose(df['ht2024'], df['reference_height'])
+    assert (tmp_path / 'trainingData_height_analysis.json').exists()
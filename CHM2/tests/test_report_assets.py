@@ -0,0 +1,57 @@
+"""Unit tests for report_assets module."""
+
+import os
+import numpy as np
+import pytest
+
+from evaluation_utils import plot_jobs, create_plots
+from report_assets import AssetJob, asset_key, render_assets
+
+
+@pytest.fixture
+def heights():
+    rng = np.random.default_rng(0)
+    ref = rng.uniform(0, 35, 2000)
+    pred = np.clip(ref + rng.normal(0, 2, ref.shape), 0, 35)
+    return pred, ref
+
+
+def test_asset_key(heights):
+    """Keys depend on array contents and parameters only."""
+    pred, ref = heights
+    metrics = {'R2': 0.9, 'RMSE': 2.0}
+    key = asset_key(plot_jobs(pred, ref, metrics)[0])
+    assert key == asset_key(plot_jobs(pred.copy(), ref.copy(), metrics)[0])
+    assert key != asset_key(plot_jobs(pred, ref, {'R2': 0.9, 'RMSE': 2.1})[0])
+    changed = pred.copy()
+    changed[0] += 1
+    assert key != asset_key(plot_jobs(changed, ref, metrics)[0])
+
+
+def test_render_assets_reuses_cache(heights, tmp_path):
+    """Unchanged assets are copied from the cache on re-runs."""
+    pred, ref = heights
+    cache_dir = str(tmp_path / 'cache')
+    metrics = {'R2': 0.9, 'RMSE': 2.0}
+    paths = create_plots(pred, ref, metrics, str(tmp_path / 'run1'), cache_dir=cache_dir, n_workers=2)
+    assert set(paths) == {'scatter', 'error_hist', 'height_dist'}
+    assert all(os.path.getsize(p) > 0 for p in paths.values())
+    assert len(os.listdir(cache_dir)) == 3
+
+    # Only the scatter plot depends on the metrics
+    paths = create_plots(pred, ref, {'R2': 0.8, 'RMSE': 2.0}, str(tmp_path / 'run2'), cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 4
+    assert os.path.exists(paths['height_dist'])
+
+
+def _write_text(output_path, text):
+    with open(output_path, 'w') as f:
+        f.write(text)
+
+
+def test_render_assets_in_process(tmp_path):
+    """A single worker renders in-process."""
+    jobs = [AssetJob('note', 'note.txt', _write_text, {}, {'text': 'hello'})]
+    paths = render_assets(jobs, str(tmp_path), n_workers=1)
+    with open(paths['note']) as f:
+        assert f.read() == 'hello'
@@ -0,0 +1,89 @@
+"""Unit tests for sampled_evaluation module."""
+
+import json
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from block_metrics import valid_pixel_mask
+from evaluate_predictions import calculate_metrics
+from sampled_evaluation import draw_stratified_sample, evaluate_sampled, compare_with_full
+
+
+@pytest.fixture
+def rasters(tmp_path):
+    rng = np.random.default_rng(3)
+    profile = {
+        'driver': 'GTiff', 'dtype': 'float32', 'nodata': -9999, 'width': 200, 'height': 150,
+        'count': 1, 'crs': 'EPSG:32632', 'transform': from_origin(500000, 5000000, 10, 10)
+    }
+    ref = rng.uniform(0, 35, (150, 200)).astype('float32')
+    pred = np.clip(ref + rng.normal(1.0, 2.0, ref.shape), 0, 40).astype('float32')
+    pred[:30, :] = -9999
+    paths = {}
+    for name, data in [('pred', pred), ('ref', ref)]:
+        paths[name] = str(tmp_path / f'{name}.tif')
+        with rasterio.open(paths[name], 'w', **profile) as dst:
+            dst.write(data, 1)
+    return paths, pred, ref
+
+
+def test_draw_stratified_sample():
+    """Samples stay inside the raster and cover every stratum."""
+    rows, cols, labels, stratum_pixels = draw_stratified_sample(90, 60, 1000, seed=1)
+    assert rows.min() >= 0 and rows.max() < 60
+    assert cols.min() >= 0 and cols.max() < 90
+    assert stratum_pixels.sum() == 90 * 60
+    assert set(labels) == set(range(len(stratum_pixels)))
+
+    again = draw_stratified_sample(90, 60, 1000, seed=1)
+    np.testing.assert_array_equal(rows, again[0])
+
+
+def test_evaluate_sampled(rasters):
+    """Sampled estimates agree with the full evaluation within their standard errors."""
+    paths, pred, ref = rasters
+    mask = valid_pixel_mask(pred, ref)
+    full = calculate_metrics(pred[mask], ref[mask])
+
+    sampled = evaluate_sampled(paths['pred'], paths['ref'], n_samples=4000, seed=7)
+    assert sampled['sample']['valid'] < sampled['sample']['drawn']
+    assert sampled['estimated_valid_pixels'] == pytest.approx(mask.sum(), rel=0.05)
+    for metric in ['RMSE', 'MAE', 'Mean Error']:
+        se = sampled['standard_errors'][metric]
+        assert se > 0
+        assert abs(sampled['metrics'][metric] - full[metric]) < 4 * se
+
+
+def test_constant_reference_has_undefined_r2(rasters, tmp_path):
+    """A constant reference has no variance to explain; R2 is NaN rather than huge."""
+    paths, pred, ref = rasters
+    with rasterio.open(paths['ref']) as src:
+        profile = src.profile
+    constant = str(tmp_path / 'constant.tif')
+    with rasterio.open(constant, 'w', **profile) as dst:
+        dst.write(np.full(ref.shape, 10.0, dtype='float32'), 1)
+
+    sampled = evaluate_sampled(paths['pred'], constant, n_samples=2000, seed=7)
+    assert np.isnan(sampled['metrics']['R2']) and np.isnan(sampled['standard_errors']['R2'])
+    assert np.isfinite(sampled['metrics']['RMSE'])
+
+    sampled = evaluate_sampled(paths['pred'], paths['ref'], n_samples=4000, seed=7)
+    mask = valid_pixel_mask(pred, ref)
+    full = calculate_metrics(pred[mask], ref[mask])
+    assert abs(sampled['metrics']['R2'] - full['R2']) < 4 * sampled['standard_errors']['R2']
+
+
+def test_compare_with_full(rasters, tmp_path):
+    """Comparison table lists differences and z-scores for shared metrics."""
+    paths, pred, ref = rasters
+    sampled = evaluate_sampled(paths['pred'], paths['ref'], n_samples=2000)
+    full_path = tmp_path / 'evaluation_metrics.json'
+    full_path.write_text(json.dumps({'metrics': {'RMSE': 2.2, 'MAE': 1.8}}))
+
+    comparison = compare_with_full(sampled, str(full_path))
+    assert list(comparison['metric']) == ['RMSE', 'MAE']
+    row = comparison.iloc[0]
+    assert row['difference'] == pytest.approx(sampled['metrics']['RMSE'] - 2.2)
+    assert row['z'] == pytest.approx(row['difference'] / row['std_error'])
@@ -14,6 +14,10 @@ matplotlib.use('Agg')  # Use non-interactive backend for testing
 
 from save_evaluation_pdf import (
     create_2x2_visualization,
+    load_rgb_composite,
+    scale_adjust_band,
+    stretch_to_uint8,
+    stretch_bands,
     get_training_info,
     calculate_area,
     save_evaluation_to_pdf
@@ -122,6 +126,57 @@ class TestSaveEvaluationPDF(unittest.TestCase):
         )
         self.assertTrue(os.path.exists(result))
 
+    def test_load_rgb_composite_display_resolution(self):
+        """RGB composite is read at display resolution within the pixel budget."""
+        merged_path = os.path.join(self.temp_dir, 'merged_4band.tif')
+        transform = from_origin(10.0, 50.0, 0.0001, 0.0001)
+        rgb_data = np.random.randint(0, 3000, (4, 400, 600)).astype('float32')
+        with rasterio.open(merged_path, 'w', driver='GTiff', dtype='float32', width=600, height=400,
+                           count=4, crs='EPSG:4326', transform=transform) as dst:
+            dst.write(rgb_data)
+        
+        rgb = load_rgb_composite(merged_path, (400, 600), transform, self.temp_dir, max_pixels=10000)
+        self.assertEqual(rgb.dtype, np.uint8)
+        self.assertEqual(rgb.shape, (80, 120, 3))
+        self.assertLessEqual(rgb.shape[0] * rgb.shape[1], 10000)
+        
+        grid_path = os.path.join(self.temp_dir, 'grid.jpg')
+        result = create_2x2_visualization(
+            np.random.rand(400, 600), np.random.rand(400, 600), np.random.rand(400, 600),
+            merged_path, transform, grid_path, max_pixels=10000)
+        with open(result, 'rb') as f:
+            self.assertEqual(f.read(2), b'\xff\xd8')  # JPEG magic number
+    
+    def test_stretch_matches_scale_adjust_band(self):
+        """Fused stretch gives exactly the result of scale_adjust_band."""
+        rng = np.random.default_rng(0)
+        params = [(0, 3000, 1.2, 0.8), (0, 3000, 1.0, 1.0), (100, 100, 1.5, 2.0), (-500.5, 4000, 0.7, 1.3)]
+        float_data = rng.uniform(-500, 4000, (200, 300)).astype('float32')
+        float_data[rng.random(float_data.shape) < 0.1] = np.nan
+        float_data[0, :5] = -9999
+        for dtype in ['uint16', 'int16', 'uint8']:
+            info = np.iinfo(dtype)
+            int_data = rng.integers(info.min, info.max, (200, 300), endpoint=True).astype(dtype)
+            for min_val, max_val, contrast, gamma in params:
+                np.testing.assert_array_equal(
+                    stretch_to_uint8(int_data, min_val, max_val, contrast, gamma),
+                    scale_adjust_band(int_data.astype('float32'), min_val, max_val, contrast, gamma))
+        for data in [float_data, float_data.astype('float64')]:
+            for min_val, max_val, contrast, gamma in params:
+                np.testing.assert_array_equal(
+                    stretch_to_uint8(data, min_val, max_val, contrast, gamma),
+                    scale_adjust_band(data, min_val, max_val, contrast, gamma))
+        
+        # Shared and band-specific parameters
+        rgb = rng.uniform(0, 4000, (50, 60, 3)).astype('float32')
+        band_params = [{'min': 0, 'max': 3000, 'contrast': 1.2, 'gamma': 0.8},
+                       {'min': 0, 'max': 2000, 'contrast': 1.0, 'gamma': 1.0},
+                       {'min': 0, 'max': 3000, 'contrast': 1.2, 'gamma': 0.8}]
+        result = stretch_bands(rgb, band_params)
+        for i, p in enumerate(band_params):
+            np.testing.assert_array_equal(
+                result[:, :, i], scale_adjust_band(rgb[:, :, i], p['min'], p['max'], p['contrast'], p['gamma']))
+    
     def test_get_training_info(self):
         """Test extraction of training data information."""
         info = get_training_info(self.train_path)
@@ -0,0 +1,106 @@
+"""Unit tests for telemetry module."""
+
+import json
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+import telemetry
+from block_evaluation import evaluate_matrix
+
+
+@pytest.fixture
+def metrics_path(tmp_path):
+    telemetry.disable()
+    path = tmp_path / 'progress.json'
+    telemetry.enable(str(path), interval=60)
+    yield path
+    telemetry.disable()
+
+
+def test_disabled_task_is_noop():
+    telemetry.disable()
+    task = telemetry.task('anything', total=10)
+    task.update(units=5)
+    task.finish()
+    assert not telemetry.enabled()
+
+
+def test_task_snapshot_rates_and_eta(metrics_path):
+    task = telemetry.task('predict', total=1000, tiles_total=4)
+    task.update(units=250, tiles=1, bytes_read=4096, bytes_written=1024)
+    snap = task.snapshot()
+    assert snap['done'] == 250 and snap['remaining'] == 750
+    assert snap['fraction'] == 0.25
+    assert snap['tiles_remaining'] == 3
+    assert snap['rate_per_second'] > 0
+    assert snap['eta_seconds'] == pytest.approx(750 / snap['rate_per_second'])
+    assert snap['status'] == 'running'
+
+    task.finish()
+    with open(metrics_path) as f:
+        data = json.load(f)
+    (written,) = data['tasks']
+    assert written['task'] == 'predict'
+    assert written['status'] == 'finished'
+    assert written['eta_seconds'] == 0
+    assert written['bytes_read'] == 4096
+
+
+def test_prometheus_format(tmp_path):
+    telemetry.disable()
+    path = tmp_path / 'progress.prom'
+    telemetry.enable(str(path), interval=60)
+    try:
+        with telemetry.task('align_rasters', total=10) as task:
+            task.update(units=10, tiles=1)
+    finally:
+        telemetry.disable()
+    text = path.read_text()
+    assert '# TYPE chm_task_done gauge' in text
+    assert 'chm_task_done{task="align_rasters",unit="pixels"} 10' in text
+    assert 'chm_task_running{task="align_rasters",unit="pixels"} 0' in text
+
+
+def test_block_evaluation_reports_tiles(metrics_path, tmp_path):
+    """The block loop of the evaluation reports every tile it reads."""
+    paths = []
+    for name, value in [('pred', 10.0), ('ref', 12.0)]:
+        path = tmp_path / f'{name}.tif'
+        with rasterio.open(path, 'w', driver='GTiff', dtype='float32', width=50, height=30, count=1,
+                           crs='EPSG:32632', transform=from_origin(500000, 5000000, 10, 10)) as dst:
+            dst.write(np.full((1, 30, 50), value, dtype='float32'))
+        paths.append(str(path))
+    evaluate_matrix([paths[0]], [paths[1]], block_size=16)
+
+    with open(metrics_path) as f:
+        (task,) = json.load(f)['tasks']
+    assert task['task'] == 'evaluate_blocks'
+    assert task['done'] == task['total'] == 1500
+    assert task['tiles_done'] == task['tiles_total'] == 8
+    assert task['bytes_read'] == 2 * 1500 * 4
+
+
+def test_stack_read_and_prediction_write_report_windows(metrics_path, tmp_path, monkeypatch):
+    """Stack reads and prediction writes report every window, not one jump to 100%."""
+    import train_predict_map
+    monkeypatch.setattr(train_predict_map, 'IO_BLOCK_SIZE', 16)
+    stack_path = tmp_path / 'stack.tif'
+    stack = np.arange(2 * 30 * 50, dtype='float32').reshape(2, 30, 50)
+    with rasterio.open(stack_path, 'w', driver='GTiff', dtype='float32', width=50, height=30, count=2,
+                       crs='EPSG:32632', transform=from_origin(500000, 5000000, 10, 10)) as dst:
+        dst.write(stack)
+    X, src = train_predict_map.load_prediction_data(str(stack_path))
+    np.testing.assert_array_equal(X, stack.reshape(2, -1).T)
+    train_predict_map.save_predictions(X[:, 0], src, str(tmp_path / 'predictCH.tif'))
+    with rasterio.open(tmp_path / 'predictCH.tif') as pred:
+        np.testing.assert_array_equal(pred.read(1), stack[0])
+
+    with open(metrics_path) as f:
+        tasks = {task['task']: task for task in json.load(f)['tasks']}
+    for name in ('read_stack', 'write_predictions'):
+        assert tasks[name]['done'] == tasks[name]['total'] == 1500
+        assert tasks[name]['tiles_done'] == tasks[name]['tiles_total'] == 8
+    assert tasks['read_stack']['bytes_read'] == stack.nbytes
+    assert tasks['write_predictions']['bytes_written'] == 1500 * 4
@@ -0,0 +1,103 @@
+"""Unit tests for tracing module."""
+
+import json
+import threading
+import numpy as np
+import pytest
+
+import tracing
+from tracing import span, traced
+
+
+@pytest.fixture
+def tracer():
+    previous = tracing.disable()
+    tracer = tracing.enable()
+    yield tracer
+    tracing.disable()
+    if previous is not None:
+        tracing._tracer = previous
+
+
+@traced()
+def add(a, b):
+    return a + b
+
+
+def test_disabled_tracing_records_nothing():
+    previous = tracing.disable()
+    try:
+        assert span('anything') is span('other')
+        with span('anything'):
+            pass
+        assert add(1, 2) == 3
+        assert not tracing.enabled()
+        assert tracing.save() is None
+    finally:
+        tracing._tracer = previous
+
+
+def test_spans_are_chrome_trace_events(tracer, tmp_path):
+    with span('outer', size=3):
+        assert add(1, 2) == 3
+    events = tracer.events
+    assert [e['name'] for e in events] == ['add', 'outer']
+    inner, outer = events
+    assert all(e['ph'] == 'X' for e in events)
+    assert outer['ts'] <= inner['ts'] and inner['ts'] + inner['dur'] <= outer['ts'] + outer['dur']
+    assert outer['args']['size'] == 3
+    assert {'cpu_ms', 'max_rss_mb'} <= set(outer['args'])
+
+    path = tracing.save(str(tmp_path / 'trace.json'))
+    with open(path) as f:
+        trace = json.load(f)
+    assert [e['name'] for e in trace['traceEvents'] if e['ph'] == 'X'] == ['add', 'outer']
+    assert tracer.summary()['add']['calls'] == 1
+
+
+def test_span_records_errors(tracer):
+    with pytest.raises(ZeroDivisionError):
+        with span('failing'):
+            1 / 0
+    assert tracer.events[0]['args']['error'] == 'ZeroDivisionError'
+
+
+def test_spans_from_threads(tracer):
+    barrier = threading.Barrier(4)  # keep all threads alive so their ids are distinct
+    idents = []
+
+    def work(i):
+        barrier.wait()
+        idents.append(threading.get_ident())
+        add(i, i)
+        barrier.wait()
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(tracer.events) == 4
+    assert sorted(e['tid'] for e in tracer.events) == sorted(idents)
+    assert len(set(idents)) == 4
+
+
+def test_tracemalloc_peak_propagates_to_parent():
+    previous = tracing.disable()
+    tracer = tracing.enable(memory='tracemalloc')
+    try:
+        with span('outer'):
+            with span('inner'):
+                data = np.ones(4 * 2**20 // 8)  # 4 MB
+                del data
+            with span('small'):
+                pass
+        by_name = {e['name']: e['args'] for e in tracer.events}
+        assert by_name['inner']['peak_alloc_mb'] >= 3.9
+        assert by_name['outer']['peak_alloc_mb'] >= 3.9
+        assert by_name['small']['peak_alloc_mb'] < 1
+    finally:
+        import tracemalloc
+        tracemalloc.stop()
+        tracing.disable()
+        tracing._tracer = previous
@@ -15,8 +15,12 @@ from train_predict_map import (
     load_prediction_data,
     train_model,
     save_predictions,
-    save_metrics_and_importance
+    save_metrics_and_importance,
+    save_model,
+    load_model
 )
+from dl_models import MLPRegressionModel
+import torch
 
 class TestTrainPredictMap(unittest.TestCase):
     @classmethod
@@ -193,6 +197,26 @@ class TestTrainPredictMap(unittest.TestCase):
             self.assertIn('feature_importance', saved_data)
             self.assertEqual(saved_data['feature_importance'], importance_data)
         
+    def test_save_and_load_model(self):
+        """Saved RF and MLP models predict the same after loading"""
+        X, y = load_training_data(self.csv_path)
+        model, _, _ = train_model(X, y, test_size=0.2)
+        output_dir = os.path.join(self.test_dir, 'saved_models')
+        path = save_model(model, output_dir, 'rf')
+        loaded, model_type = load_model(path)
+        self.assertEqual(model_type, 'rf')
+        np.testing.assert_array_equal(loaded.predict(X), model.predict(X))
+        
+        mlp = MLPRegressionModel(input_size=X.shape[1]).eval()
+        mlp.scaler_mean = torch.FloatTensor(X.mean(axis=0))
+        mlp.scaler_std = torch.FloatTensor(X.std(axis=0) + 1)
+        path = save_model(mlp, output_dir, 'mlp')
+        loaded, model_type = load_model(path)
+        self.assertEqual(model_type, 'mlp')
+        x = (torch.FloatTensor(X) - mlp.scaler_mean) / mlp.scaler_std
+        with torch.no_grad():
+            np.testing.assert_allclose(loaded(x).numpy(), mlp(x).numpy(), rtol=1e-6)
+        
     def test_save_metrics_and_importance(self):
         """Test saving metrics and feature importance to JSON"""
         # Create test data
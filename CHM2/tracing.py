@@ -0,0 +1,206 @@
+"""Lightweight timing and memory tracing of pipeline stages.
+
+Spans record wall time, thread CPU time and memory, and are written as a
+Chrome trace (chrome://tracing, Perfetto, speedscope). Tracing is off unless
+enabled with enable() or the CHM_TRACE environment variable (path of the
+trace file); when off, span() returns a shared no-op context manager and
+@traced functions are called directly, so instrumentation costs one flag
+check.
+
+Memory is the peak RSS of the process (ru_maxrss) by default. With
+memory='tracemalloc' each span also records the peak Python allocation
+while it was open; tracemalloc slows allocation-heavy code noticeably and
+its peak is process-wide, so spans overlapping in other threads share it.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import atexit
+import functools
+import threading
+from contextlib import contextmanager, nullcontext
+
+_NULL_SPAN = nullcontext()
+_tracer = None
+
+
+def max_rss_mb() -> float:
+    """Peak resident memory of this process in MB, or NaN where unavailable."""
+    try:
+        import resource
+    except ImportError:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class Tracer:
+    """Collects span events in Chrome trace format.
+
+    Args:
+        path: Trace file written by save() and at exit
+        memory: 'rss' or 'tracemalloc'
+    """
+
+    def __init__(self, path: str = None, memory: str = 'rss'):
+        if memory not in ('rss', 'tracemalloc'):
+            raise ValueError(f"Unknown memory mode: {memory}")
+        self.path = path
+        self.memory = memory
+        self.events = []
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        if memory == 'tracemalloc':
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def span(self, name: str, category: str = 'chm', **args):
+        """Record the enclosed block as a complete ('X') event."""
+        stack = self._stack()
+        frame = {'peak': 0}
+        if self.memory == 'tracemalloc':
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            # Fold the peak so far into the open spans before resetting it for this one
+            for parent in stack:
+                parent['peak'] = max(parent['peak'], peak)
+            tracemalloc.reset_peak()
+            frame['start_mem'] = current
+            frame['peak'] = current
+        stack.append(frame)
+        start_cpu = time.thread_time()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield args
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            end = time.perf_counter()
+            cpu = time.thread_time() - start_cpu
+            stack.pop()
+            event_args = {key: value if isinstance(value, (int, float, bool, type(None))) else str(value)
+                          for key, value in args.items()}
+            event_args['cpu_ms'] = round(cpu * 1e3, 3)
+            rss = max_rss_mb()
+            if not math.isnan(rss):
+                event_args['max_rss_mb'] = round(rss, 1)
+            if self.memory == 'tracemalloc':
+                _, peak = tracemalloc.get_traced_memory()
+                frame['peak'] = max(frame['peak'], peak)
+                if stack:
+                    stack[-1]['peak'] = max(stack[-1]['peak'], frame['peak'])
+                event_args['peak_alloc_mb'] = round((frame['peak'] - frame['start_mem']) / 2**20, 3)
+            if error:
+                event_args['error'] = error
+            event = {'name': name, 'cat': category, 'ph': 'X', 'pid': self.pid,
+                     'tid': threading.get_ident(), 'ts': (start - self.origin) * 1e6,
+                     'dur': (end - start) * 1e6, 'args': event_args}
+            with self._lock:
+                self.events.append(event)
+
+    def save(self, path: str = None) -> str:
+        """Write the trace as JSON; returns its path."""
+        path = path or self.path
+        if not path:
+            raise ValueError("No trace path given")
+        with self._lock:
+            events = list(self.events)
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': self.pid,
+                       'args': {'name': os.path.basename(sys.argv[0]) or 'python'}})
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return path
+
+    def summary(self) -> dict:
+        """Total wall and CPU milliseconds and call count per span name."""
+        totals = {}
+        with self._lock:
+            for event in self.events:
+                entry = totals.setdefault(event['name'], {'calls': 0, 'wall_ms': 0.0, 'cpu_ms': 0.0})
+                entry['calls'] += 1
+                entry['wall_ms'] += event['dur'] / 1e3
+                entry['cpu_ms'] += event['args']['cpu_ms']
+        return totals
+
+
+def enable(path: str = None, memory: str = 'rss') -> Tracer:
+    """Start tracing; the trace is written to path at exit (and by save())."""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(path, memory)
+        if path:
+            atexit.register(_save_at_exit)
+    elif path and not _tracer.path:
+        _tracer.path = path
+        atexit.register(_save_at_exit)
+    return _tracer
+
+
+def disable() -> Tracer:
+    """Stop tracing; returns the tracer that was active, if any."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+def get_tracer():
+    return _tracer
+
+
+def save(path: str = None):
+    """Write the active trace; returns its path, or None when tracing is off."""
+    return _tracer.save(path) if _tracer is not None else None
+
+
+def _save_at_exit():
+    if _tracer is not None and _tracer.path:
+        _tracer.save()
+
+
+def span(name: str, category: str = 'chm', **args):
+    """Context manager timing a block; a no-op while tracing is off."""
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.span(name, category, **args)
+
+
+def traced(name: str = None, category: str = 'chm'):
+    """Decorator recording each call of a function as a span."""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with _tracer.span(span_name, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+if os.environ.get('CHM_TRACE'):
+    enable(os.environ['CHM_TRACE'], os.environ.get('CHM_TRACE_MEMORY', 'rss'))
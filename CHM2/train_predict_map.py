@@ -16,11 +16,23 @@ from pathlib import Path
 from typing import Tuple, Optional
 import warnings
 import argparse
+import joblib
 from tqdm import tqdm
 warnings.filterwarnings('ignore')
 
 from evaluate_predictions import calculate_metrics
+import tracing
+import telemetry
+from tracing import span, traced
+from artifact_catalog import register_artifact
+from raster_utils import iter_windows
 
+# Rows per RF predict call, so progress can be reported
+RF_PREDICT_CHUNK = 1 << 18
+# Window side of stack reads and prediction writes, so progress can be reported
+IO_BLOCK_SIZE = 1024
+
+@traced()
 def load_training_data(csv_path: str, mask_path: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
     """
     Load training data from CSV file and optionally mask with forest mask.
@@ -98,6 +110,7 @@ def load_training_data(csv_path: str, mask_path: Optional[str] = None) -> Tuple[
     
     return X, y
 
+@traced()
 def load_prediction_data(stack_path: str, mask_path: Optional[str] = None) -> Tuple[np.ndarray, rasterio.DatasetReader]:
     """
     Load prediction data from stack TIF and optionally apply forest mask.
@@ -112,7 +125,15 @@ def load_prediction_data(stack_path: str, mask_path: Optional[str] = None) -> Tu
     """
     # Read stack file
     with rasterio.open(stack_path) as src:
-        stack = src.read()
+        windows = list(iter_windows(src.width, src.height, IO_BLOCK_SIZE))
+        stack = None
+        with telemetry.task('read_stack', total=src.width * src.height, tiles_total=len(windows)) as progress:
+            for window in windows:
+                block = src.read(window=window)
+                if stack is None:
+                    stack = np.empty((src.count, src.height, src.width), dtype=block.dtype)
+                stack[(slice(None),) + window.toslices()] = block
+                progress.update(units=block[0].size, tiles=1, bytes_read=block.nbytes)
         stack_crs = src.crs
         
         # Reshape stack to 2D array (bands x pixels)
@@ -180,6 +201,7 @@ def save_metrics_and_importance(metrics: dict, importance_data: dict, output_dir
         json.dump(output_data, f, indent=4)
     print(f"Saved model evaluation data to: {output_path}")
 
+@traced()
 def train_model(X: np.ndarray, y: np.ndarray, model_type: str = 'rf', batch_size: int = 64,
                 test_size: float = 0.2, feature_names: Optional[list] = None,
                 n_bands: Optional[int] = None) -> Tuple[object, dict, dict]:
@@ -244,6 +266,7 @@ def train_model(X: np.ndarray, y: np.ndarray, model_type: str = 'rf', batch_size
         best_val_loss = float('inf')
         
         # Training loop with tqdm progress bar
+        progress = telemetry.task('train_epochs', total=num_epochs, unit='epochs')
         for epoch in tqdm(range(num_epochs), desc="Training Epochs"):
             model.train()
             for batch_X, batch_y in train_loader:
@@ -276,6 +299,8 @@ def train_model(X: np.ndarray, y: np.ndarray, model_type: str = 'rf', batch_size
             if val_loss < best_val_loss:
                 best_val_loss = val_loss
                 train_metrics = val_metrics
+            progress.update(units=1)
+        progress.finish()
         
         # Get feature importance (using weights of first layer as proxy)
         with torch.no_grad():
@@ -305,6 +330,50 @@ def train_model(X: np.ndarray, y: np.ndarray, model_type: str = 'rf', batch_size
     
     return model, train_metrics, importance_data
 
+def save_model(model, output_dir: str, model_type: str) -> str:
+    """
+    Save a trained model so predictions can be made (or benchmarked) without retraining.
+    
+    Args:
+        model: Trained RandomForestRegressor or MLPRegressionModel
+        output_dir: Directory to save the model in
+        model_type: 'rf' or 'mlp'
+        
+    Returns:
+        Path of the saved model (model_rf.joblib or model_mlp.pt)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if model_type == 'rf':
+        path = os.path.join(output_dir, 'model_rf.joblib')
+        joblib.dump(model, path)
+    else:
+        path = os.path.join(output_dir, 'model_mlp.pt')
+        torch.save({
+            'input_size': model.num_features,
+            'state_dict': {key: value.cpu() for key, value in model.state_dict().items()},
+            'scaler_mean': model.scaler_mean.cpu(),
+            'scaler_std': model.scaler_std.cpu(),
+        }, path)
+    print(f"Saved model to: {path}")
+    return path
+
+def load_model(path: str) -> Tuple[object, str]:
+    """
+    Load a model saved by save_model.
+    
+    Returns:
+        Model (MLP in eval mode on CPU, with scaler_mean/scaler_std) and model type
+    """
+    if path.endswith('.joblib'):
+        return joblib.load(path), 'rf'
+    checkpoint = torch.load(path, map_location='cpu')
+    model = MLPRegressionModel(input_size=checkpoint['input_size'])
+    model.load_state_dict(checkpoint['state_dict'])
+    model.scaler_mean = checkpoint['scaler_mean']
+    model.scaler_std = checkpoint['scaler_std']
+    return model.eval(), 'mlp'
+
+@traced()
 def save_predictions(predictions: np.ndarray, src: rasterio.DatasetReader, output_path: str,
                     mask_path: Optional[str] = None) -> None:
     """
@@ -340,12 +409,17 @@ def save_predictions(predictions: np.ndarray, src: rasterio.DatasetReader, outpu
     
     try:
         # Save predictions
-        with rasterio.open(output_path, 'w', **profile) as dst:
-            dst.write(pred_array, 1)
+        windows = list(iter_windows(width, height, IO_BLOCK_SIZE))
+        with rasterio.open(output_path, 'w', **profile) as dst, \
+                telemetry.task('write_predictions', total=pred_array.size, tiles_total=len(windows)) as progress:
+            for window in windows:
+                block = pred_array[window.toslices()]
+                dst.write(block, 1, window=window)
+                progress.update(units=block.size, tiles=1, bytes_written=block.nbytes)
     finally:
         src.close()
 
-def parse_args():
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(description='Train model and generate canopy height predictions')
     
     # Input paths
@@ -373,19 +447,30 @@ def parse_args():
                        help='Proportion of data to use for validation')
     parser.add_argument('--apply-forest-mask', action='store_true',
                        help='Apply forest mask to predictions')
-    
-    return parser.parse_args()
+    parser.add_argument('--save-model', action='store_true',
+                       help='Save the trained model to the output directory')
+    parser.add_argument('--trace', type=str, default=None,
+                       help='Write a Chrome trace of stage timings and memory to this JSON file')
+    parser.add_argument('--telemetry', type=str, default=None,
+                       help='Periodically write progress metrics to this file (.json, or .prom for Prometheus)')
+    
+    return parser.parse_args(argv)
 
-def main():
+def main(argv=None):
     # Parse arguments
-    args = parse_args()
+    args = parse_args(argv)
+    if args.trace:
+        tracing.enable(args.trace)
+    if args.telemetry:
+        telemetry.enable(args.telemetry)
     
     # Create output directory
     os.makedirs(args.output_dir, exist_ok=True)
     
     # Load training data
     print("Loading training data...")
-    df = pd.read_csv(args.training_data)
+    with span('read_training_csv'):
+        df = pd.read_csv(args.training_data)
     feature_names = [col for col in df.columns if col not in ['rh', 'longitude', 'latitude']]
     X, y = load_training_data(args.training_data, args.mask)
     print(f"Loaded training data with {X.shape[1]} features and {len(y)} samples")
@@ -403,6 +488,8 @@ def main():
     
     # Save metrics and importance
     save_metrics_and_importance(train_metrics, importance_data, args.output_dir)
+    if args.save_model:
+        save_model(model, args.output_dir, args.model)
     
     # Load prediction data
     print("Loading prediction data...")
@@ -411,24 +498,30 @@ def main():
     
     # Make predictions
     print("Generating predictions...")
-    if args.model == 'rf':
-        predictions = model.predict(X_pred)
-    else:  # MLP model
-        model.eval()
-        with torch.no_grad():
-            # Normalize prediction data
-            X_pred_tensor = torch.FloatTensor(X_pred)
-            X_pred_normalized = (X_pred_tensor - model.scaler_mean) / model.scaler_std
-            
-            # Make predictions in batches
-            predictions = []
-            for i in range(0, len(X_pred), args.batch_size):
-                batch = X_pred_normalized[i:i + args.batch_size]
-                if torch.cuda.is_available():
-                    batch = batch.cuda()
-                pred = model(batch)
-                predictions.extend(pred.cpu().numpy())
-            predictions = np.array(predictions)
+    with span('predict', model=args.model, n_pixels=len(X_pred)), \
+            telemetry.task('predict', total=len(X_pred)) as progress:
+        if args.model == 'rf':
+            predictions = np.empty(len(X_pred), dtype=np.float64)
+            for i in range(0, len(X_pred), RF_PREDICT_CHUNK):
+                predictions[i:i + RF_PREDICT_CHUNK] = model.predict(X_pred[i:i + RF_PREDICT_CHUNK])
+                progress.update(units=len(predictions[i:i + RF_PREDICT_CHUNK]))
+        else:  # MLP model
+            model.eval()
+            with torch.no_grad():
+                # Normalize prediction data
+                X_pred_tensor = torch.FloatTensor(X_pred)
+                X_pred_normalized = (X_pred_tensor - model.scaler_mean) / model.scaler_std
+                
+                # Make predictions in batches
+                predictions = []
+                for i in range(0, len(X_pred), args.batch_size):
+                    batch = X_pred_normalized[i:i + args.batch_size]
+                    if torch.cuda.is_available():
+                        batch = batch.cuda()
+                    pred = model(batch)
+                    predictions.extend(pred.cpu().numpy())
+                    progress.update(units=len(batch))
+                predictions = np.array(predictions)
     print(f"Generated {len(predictions)} predictions")
     output_path = Path(args.output_dir) / f"{Path(args.stack).stem.replace('stack_', 'predictCH')}.tif"
     
@@ -436,6 +529,7 @@ def main():
     # output_path = os.path.join(args.output_dir, output_filename)
     print(f"Saving predictions to: {output_path}")
     save_predictions(predictions, src, output_path, args.mask)
+    register_artifact(output_path, params={'stage': 'train_predict', 'model': args.model})
     print("Done!")
 
 if __name__ == "__main__":
@@ -1,9 +1,39 @@
 import os
+import sqlite3
 
-def get_latest_file(dir_path: str, pattern: str, required: bool = True) -> str:
+def _scan_latest_file(dir_path: str, pattern: str) -> str:
     files = [f for f in os.listdir(dir_path) if f.startswith(pattern)]
     if not files:
-        if required:
-            raise FileNotFoundError(f"No files matching pattern '{pattern}' found in {dir_path}")
         return None
     return os.path.join(dir_path, max(files, key=lambda x: os.path.getmtime(os.path.join(dir_path, x))))
+
+def get_latest_file(dir_path: str, pattern: str, required: bool = True, bounds: tuple = None,
+                    params: dict = None, sync: bool = False) -> str:
+    """Newest file in dir_path whose name starts with pattern.
+
+    Looks the file up in the directory's artifact catalog, where stages
+    register the files they produce, optionally restricted to files
+    intersecting bounds (EPSG:4326) or registered with params. Files matching
+    pattern that are not registered yet or changed (e.g. copied in by hand)
+    are registered first; with sync the whole catalog is brought in line with
+    the directory. Name-only lookups without a catalog scan the directory.
+    """
+    from artifact_catalog import ArtifactCatalog, CATALOG_NAME
+    path = None
+    has_catalog = os.path.exists(os.path.join(dir_path, CATALOG_NAME))
+    if os.path.isdir(dir_path) and (sync or has_catalog or bounds is not None or params is not None):
+        try:
+            with ArtifactCatalog(dir_path) as catalog:
+                if sync:
+                    catalog.sync()
+                else:
+                    for new_path in catalog.register_new(pattern):
+                        print(f"Registered {new_path} (not in the artifact catalog)")
+                path = catalog.latest(pattern, bounds=bounds, params=params)
+        except sqlite3.Error:
+            path = None
+    if path is None and bounds is None and params is None and os.path.isdir(dir_path):
+        path = _scan_latest_file(dir_path, pattern)
+    if path is None and required:
+        raise FileNotFoundError(f"No files matching pattern '{pattern}' found in {dir_path}")
+    return path